@@ -0,0 +1,51 @@
+from openfermion_dirac import MolecularData_Dirac, ScanData_Dirac, run_dirac
+import os
+
+# Set molecule parameters.
+basis = 'STO-3G'
+bond_lengths = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+multiplicity = 1
+charge = 0
+data_directory=os.getcwd()
+delete_input = True
+delete_xyz = True
+delete_output = False
+delete_MRCONEE = True
+delete_MDCINT = True
+delete_FCIDUMP = True
+run_ccsd = True
+
+print('#'*40)
+print('NONREL Dirac scan saved in one HDF5 file')
+print('#'*40)
+print()
+
+# All the points are appended to the same file, the metadata are written once.
+scan = ScanData_Dirac("{}/H2_{}_scan.hdf5".format(data_directory, basis))
+
+for bond_length in bond_lengths:
+      geometry = [('H', (0., 0., 0.)), ('H', (0., 0., bond_length))]
+      description = 'R' + str(bond_length) + '_ccsd'
+      molecule = MolecularData_Dirac(geometry=geometry,
+                                     basis=basis,
+                                     multiplicity=multiplicity,
+                                     charge=charge,
+                                     description=description,
+                                     data_directory=data_directory)
+      molecule = run_dirac(molecule,
+                          delete_input=delete_input,
+                          delete_xyz=delete_xyz,
+                          delete_output=delete_output,
+                          delete_MRCONEE=delete_MRCONEE,
+                          delete_MDCINT=delete_MDCINT,
+                          delete_FCIDUMP=False,
+                          run_ccsd=run_ccsd)
+      scan.append(molecule, coordinate=bond_length)
+      if delete_FCIDUMP:
+            os.remove("FCIDUMP_" + molecule.name)
+
+# A whole curve, or one coefficient along the scan, is a single slice read.
+print('Bond lengths : {}'.format(scan.get_from_file('coordinate')))
+print('CCSD energies : {}'.format(scan.get_from_file('ccsd_energy')))
+print('h[0,1,1,0] along the scan : {}'.format(
+      scan.get_from_file('two_body_coefficients', (slice(None), 0, 1, 1, 0))))
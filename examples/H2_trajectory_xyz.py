@@ -0,0 +1,28 @@
+from openfermion_dirac import molecules_from_xyz, run_dirac_jobs
+import os
+
+# Set molecule parameters.
+basis = 'STO-3G'
+multiplicity = 1
+data_directory=os.getcwd()
+max_workers = 2
+
+print('#'*40)
+print('NONREL Dirac on the frames of a XYZ trajectory')
+print('#'*40)
+print()
+
+# A multi-frame XYZ file, as written by molecular dynamics codes.
+with open('H2_trajectory.xyz', 'w') as f:
+    for bond_length in [0.5, 0.6, 0.7, 0.8, 0.9, 1.0]:
+        f.write('2\nR = {}\nH 0. 0. 0.\nH 0. 0. {}\n'.format(bond_length, bond_length))
+
+# The frames are read and the molecules created only when the jobs need them,
+# max_workers calculations run at the same time in their own directory.
+molecules = molecules_from_xyz('H2_trajectory.xyz', basis, multiplicity,
+                               description='md', data_directory=data_directory)
+for molecule in run_dirac_jobs(molecules, max_workers=max_workers,
+                               delete_input=True, delete_xyz=True,
+                               delete_MRCONEE=True, delete_MDCINT=True):
+    molecule.get_energies()
+    print('{} : HF energy {}'.format(molecule.description, molecule.hf_energy))
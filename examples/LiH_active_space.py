@@ -34,6 +34,9 @@ else:
 #                second number : highest energy
 #                third number : minimum gap required between the lowest (highest)
 active = [-2.0,0.3,0.1]
+# The window can also be chosen from the spinor energies of a previous
+# calculation of the molecule without active space, e.g. for 4 spinors:
+#   active = molecule.get_active_space(4)
 description += '_active'
 
 molecule = MolecularData_Dirac(geometry=geometry,
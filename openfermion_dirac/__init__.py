@@ -1,7 +1,73 @@
 """
 OpenFermion plugin to interface with Dirac
 """
-from ._run_dirac import run_dirac
+from ._run_dirac import run_dirac, run_dirac_scan
 from ._molecular_data_Dirac import (
         MolecularData_Dirac,
+        iter_xyz_frames,
+        molecules_from_xyz,
         periodic_table)
+from ._active_space import select_active_space
+from ._scan_data import ScanData_Dirac
+from ._bulk_load import iter_molecule_files, load_molecule_files
+from ._batch import run_dirac_jobs
+from ._shared_memory import (
+        attach_coefficients,
+        attach_hamiltonian,
+        publish_arrays,
+        publish_coefficients,
+        release_coefficients,
+        unlink_coefficients)
+from ._factorization import (
+        cholesky_decomposition,
+        cholesky_from_double_factorization,
+        coulomb_exchange,
+        double_factorization,
+        energy_from_cholesky,
+        hartree_fock_density,
+        two_body_from_cholesky)
+from ._catalog import (
+        CatalogError,
+        geometry_hash,
+        molecular_formula,
+        query_catalog,
+        rebuild_catalog)
+from ._daemon import (
+        JobDaemon,
+        JobError,
+        cancel_job,
+        job_status,
+        list_jobs,
+        submit_job,
+        wait_for_job)
+from ._estimate import (
+        basis_library_index,
+        count_basis_functions,
+        detect_point_group,
+        estimate_calculation)
+from ._gradient import (
+        GradientError,
+        displaced_molecules,
+        finite_difference_gradient,
+        optimize_geometry)
+from ._memory import (
+        MemoryBudgetError,
+        allocate_array,
+        available_memory,
+        parse_memory_size,
+        track_memory)
+from ._reference_energies import fock_diagonal, hartree_fock_energy, mp2_energy
+from ._spinor_order import jordan_wigner_weight, order_spinors
+from ._tapering import (
+        Z2Symmetry,
+        find_z2_symmetries,
+        spinor_irreps,
+        taper_hamiltonian)
+
+
+def __getattr__(name):
+    # Imports openfermion, only when used.
+    if name == 'MolecularData_OpenFermion':
+        from ._openfermion_data import MolecularData_OpenFermion
+        return MolecularData_OpenFermion
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
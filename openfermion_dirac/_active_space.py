@@ -0,0 +1,82 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Function to choose the active keyword of run_dirac from the spinor
+energies of a previous calculation."""
+
+from ._run_dirac import ActiveOrbitalsError
+
+
+def select_active_space(energies, n_qubits, n_occupied, n_occupied_active=None,
+                        gap=0.01):
+    """Energy window of Dirac selecting exactly n_qubits spinors.
+
+    The window is a range of consecutive spinors (in order of energy)
+    which does not separate spinors closer in energy than gap, e.g. the
+    two spinors of a Kramers pair or a near-degenerate shell. Of the
+    possible windows, the one whose number of occupied spinors is the
+    closest to n_occupied_active is returned.
+
+    Args:
+        energies: Iterable of the spinor energies of a calculation without
+            active space, e.g. molecule.spinor.values() after
+            get_integrals_FCIDUMP.
+        n_qubits: Integer, number of active spinors wanted.
+        n_occupied: Integer, number of occupied spinors of the calculation
+            (the lowest n_occupied spinors are occupied).
+        n_occupied_active: Optional integer, number of occupied spinors
+            wanted in the window. Defaults to half of the window, such that
+            it is centred on the Fermi level.
+        gap: Real number, minimum energy difference between the first
+            (last) active spinor and the spinor below (above) it.
+
+    Returns:
+        active: A list of 3 real numbers [lowest energy, highest energy, gap]
+            to give as the active argument of run_dirac.
+
+    Raises:
+        ActiveOrbitalsError: If no window of n_qubits spinors respects gap.
+    """
+    energies = sorted(energies)
+    n_spinors = len(energies)
+    if not 0 < n_qubits <= n_spinors:
+        raise ActiveOrbitalsError('n_qubits should be between 1 and the number of '
+                                  'spinors ({})'.format(n_spinors))
+    if n_occupied_active is None:
+        n_occupied_active = n_qubits // 2
+
+    def separated(lowest, highest):
+        return ((lowest == 0 or energies[lowest] - energies[lowest - 1] >= gap) and
+                (highest == n_spinors - 1 or
+                 energies[highest + 1] - energies[highest] >= gap))
+
+    windows = [lowest for lowest in range(n_spinors - n_qubits + 1)
+               if separated(lowest, lowest + n_qubits - 1)]
+    if not windows:
+        raise ActiveOrbitalsError('no window of {} spinors is separated by a gap of {} '
+                                  'from the other spinors, change n_qubits or '
+                                  'decrease gap'.format(n_qubits, gap))
+    target = n_occupied - n_occupied_active
+    lowest = min(windows, key=lambda lowest: (abs(lowest - target), lowest))
+    highest = lowest + n_qubits - 1
+
+    # Bounds half way to the next spinors, which are at least gap away, so
+    # that Dirac does not have to shift them.
+    if lowest == 0:
+        emin = energies[lowest] - gap
+    else:
+        emin = (energies[lowest - 1] + energies[lowest]) / 2.
+    if highest == n_spinors - 1:
+        emax = energies[highest] + gap
+    else:
+        emax = (energies[highest] + energies[highest + 1]) / 2.
+    return [emin, emax, gap]
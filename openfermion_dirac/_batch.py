@@ -0,0 +1,83 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Function to run many Dirac calculations concurrently."""
+
+import os
+import warnings
+
+from ._pool import bounded_map
+from ._run_dirac import run_dirac
+
+
+def _job(job):
+    """Split a job into the molecule and its own run_dirac arguments."""
+    if isinstance(job, tuple):
+        return job
+    return job, {}
+
+
+def run_dirac_jobs(jobs, max_workers=4, failed=None, **kwargs):
+    """Run Dirac on many molecules, with at most max_workers at a time.
+
+    The jobs are taken lazily from the iterable, at most 2 * max_workers of
+    them are held at the same time, so that e.g. the frames of a long
+    trajectory given by molecules_from_xyz are never all in memory. Each
+    calculation runs in its own directory under scratch_root, which
+    defaults to the current directory.
+
+    Args:
+        jobs: Iterable of MolecularData_Dirac, or of (molecule, arguments)
+            where arguments is a dictionary of run_dirac arguments for this
+            molecule only.
+        max_workers: Number of calculations running at the same time.
+        failed: Optional list to which (molecule, exception) is appended for
+            each failed calculation. A warning summarizes the failures in
+            any case.
+        kwargs: Arguments of run_dirac for every molecule, e.g. save=True.
+            Use jobs_per_node=max_workers with auto_resources=True to share
+            the node between the calculations.
+
+    Yields:
+        molecule: Each molecule whose calculation succeeded, in the order of
+            the jobs.
+    """
+    if failed is None:
+        failed = []
+    n_failed = len(failed)
+    kwargs.setdefault('scratch_root', os.curdir)
+
+    def run(job):
+        molecule, arguments = _job(job)
+        options = dict(kwargs, **arguments)
+        if not options['scratch_root']:
+            # Concurrent calculations may not share their directory.
+            options['scratch_root'] = os.curdir
+        return run_dirac(molecule, **options)
+
+    for job, future in bounded_map(run, jobs, max_workers):
+        molecule = _check_result((_job(job)[0], future), failed)
+        if molecule is not None:
+            yield molecule
+    if len(failed) > n_failed:
+        warnings.warn('{} Dirac calculations failed, e.g. {}: {}'.format(
+            len(failed) - n_failed, failed[n_failed][0].name,
+            failed[n_failed][1]), Warning)
+
+
+def _check_result(item, failed):
+    molecule, future = item
+    try:
+        return future.result()
+    except Exception as error:
+        failed.append((molecule, error))
+        return None
@@ -0,0 +1,193 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Functions to load properties from many files written by
+MolecularData_Dirac.save, reading them with a pool of threads."""
+
+import glob
+import os
+import warnings
+
+from ._lazy import LazyModule
+from ._molecular_data_Dirac import basestring
+from ._pool import bounded_map
+
+h5py = LazyModule('h5py')
+numpy = LazyModule('numpy')
+
+
+class SchemaMismatchError(Exception):
+    pass
+
+
+def list_molecule_files(source):
+    """List the HDF5 files given by a directory, a glob or a list.
+
+    Args:
+        source: A directory (all its .hdf5 files are used), a glob pattern
+            such as 'data/LiH_*_rel.hdf5', or a list of file names.
+
+    Returns:
+        filenames: Sorted list of file names.
+    """
+    if not isinstance(source, basestring):
+        return list(source)
+    if os.path.isdir(source):
+        source = os.path.join(source, '*.hdf5')
+    return sorted(glob.glob(source))
+
+
+def _normalize(data):
+    """Convert the placeholders written by save to python values.
+
+    save() writes False for a property which was not computed, and the
+    energies parsed from the Dirac output as strings.
+    """
+    if data.ndim == 0:
+        if data.dtype.kind == 'b' and not data:
+            return None
+        if data.dtype.kind in 'SO':
+            try:
+                return numpy.array(float(data[()]))
+            except (TypeError, ValueError):
+                pass
+    return data
+
+
+def _read_properties(filename, properties):
+    data = {}
+    with h5py.File(filename, "r") as f:
+        for property_name in properties:
+            data[property_name] = _normalize(f[property_name][...])
+    return data
+
+
+def _schema_kind(data):
+    kind = data.dtype.kind
+    if kind in 'iuf':
+        return 'real'
+    return kind
+
+
+def iter_molecule_files(source, properties, max_workers=8, skipped=None):
+    """Read properties from many saved molecules with a pool of threads.
+
+    The files are opened concurrently, at most 2 * max_workers reads are in
+    flight at the same time, and the results are yielded in the order of
+    the file list. The schema (number of dimensions and kind of data) of
+    each property is fixed by the first file read successfully, files which
+    lack a property or store it with another schema are skipped.
+
+    Args:
+        source: A directory, a glob pattern or a list of file names, see
+            list_molecule_files.
+        properties: List of property names, as in
+            MolecularData_Dirac.get_from_file (e.g. 'two_body_coefficients',
+            'hf_energy', 'geometry/positions').
+        max_workers: Number of threads reading the files.
+        skipped: Optional list to which (filename, reason) is appended for
+            each skipped file. A warning summarizes the skipped files in any
+            case.
+
+    Yields:
+        (filename, data): data is a dictionary property_name -> numpy array,
+            or None for a property that was not computed (stored as False).
+    """
+    filenames = list_molecule_files(source)
+    if skipped is None:
+        skipped = []
+    n_skipped = len(skipped)
+    schema = {}
+    for item in bounded_map(lambda filename: _read_properties(filename, properties),
+                            filenames, max_workers):
+        result = _check_result(item, schema, skipped)
+        if result is not None:
+            yield result
+    if len(skipped) > n_skipped:
+        warnings.warn('{} of {} files skipped, e.g. {}: {}'.format(
+            len(skipped) - n_skipped, len(filenames),
+            skipped[n_skipped][0], skipped[n_skipped][1]), Warning)
+
+
+def _check_result(item, schema, skipped):
+    filename, future = item
+    try:
+        data = future.result()
+    except (IOError, KeyError) as error:
+        skipped.append((filename, str(error)))
+        return None
+    try:
+        for property_name, value in data.items():
+            if value is None:
+                continue
+            kind = (value.ndim, _schema_kind(value))
+            if schema.setdefault(property_name, kind) != kind:
+                raise SchemaMismatchError(
+                    '{} has {} dimensions of kind {}, expected {} of kind {}'
+                    .format(property_name, kind[0], kind[1],
+                            *schema[property_name]))
+    except SchemaMismatchError as error:
+        skipped.append((filename, str(error)))
+        return None
+    return filename, data
+
+
+def load_molecule_files(source, properties, max_workers=8):
+    """Read properties from many saved molecules into stacked arrays.
+
+    Arrays of different shapes (e.g. coefficients of molecules with
+    different numbers of qubits) are padded with zeros to the largest
+    shape, a boolean mask tells which elements were actually read.
+
+    Args:
+        source: A directory, a glob pattern or a list of file names, see
+            list_molecule_files.
+        properties: List of property names, see iter_molecule_files.
+        max_workers: Number of threads reading the files.
+
+    Returns:
+        data: Dictionary property_name -> array of shape
+            (n_files, *largest_shape).
+        mask: Dictionary property_name -> boolean array of the same shape,
+            True where data holds a value read from the file.
+        filenames: List of the n_files files which were loaded.
+        skipped: List of (filename, reason) for the skipped files.
+    """
+    skipped = []
+    filenames = []
+    values = {property_name: [] for property_name in properties}
+    for filename, file_data in iter_molecule_files(
+            source, properties, max_workers, skipped):
+        filenames.append(filename)
+        for property_name in properties:
+            values[property_name].append(file_data[property_name])
+
+    data = {}
+    mask = {}
+    for property_name, arrays in values.items():
+        present = [array for array in arrays if array is not None]
+        if not present:
+            data[property_name] = numpy.zeros(len(arrays))
+            mask[property_name] = numpy.zeros(len(arrays), dtype=bool)
+            continue
+        shape = tuple(numpy.max([array.shape for array in present], axis=0)
+                      if present[0].ndim else ())
+        dtype = numpy.result_type(*set(array.dtype for array in present))
+        data[property_name] = numpy.zeros((len(arrays),) + shape, dtype)
+        mask[property_name] = numpy.zeros((len(arrays),) + shape, bool)
+        for index, array in enumerate(arrays):
+            if array is None:
+                continue
+            region = (index,) + tuple(slice(0, size) for size in array.shape)
+            data[property_name][region] = array
+            mask[property_name][region] = True
+    return data, mask, filenames, skipped
@@ -0,0 +1,415 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Catalog of the molecules saved in a directory.
+
+MolecularData_Dirac.save records the metadata of each file (name, formula,
+basis, charge, multiplicity, relativistic options, geometry hash, number of
+qubits, energies, size) in an SQLite file, catalog.sqlite, next to the HDF5
+files, so that finding the molecules of a large archive is a query instead
+of opening every file. rebuild_catalog indexes files saved before the
+catalog existed or copied from elsewhere.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import os
+import re
+
+from ._lazy import LazyModule
+
+h5py = LazyModule('h5py')
+numpy = LazyModule('numpy')
+sqlite3 = LazyModule('sqlite3')
+
+# Name of the catalog file in the data directory.
+CATALOG_NAME = 'catalog.sqlite'
+
+# Columns of the catalog and their SQL type.
+_columns = collections.OrderedDict([
+    ('path', 'TEXT PRIMARY KEY'),
+    ('name', 'TEXT'),
+    ('formula', 'TEXT'),
+    ('basis', 'TEXT COLLATE NOCASE'),
+    ('charge', 'INTEGER'),
+    ('multiplicity', 'INTEGER'),
+    ('relativistic', 'INTEGER'),
+    ('symmetry', 'INTEGER'),
+    ('speed_of_light', 'REAL'),
+    ('description', 'TEXT'),
+    ('geometry_hash', 'TEXT'),
+    ('n_atoms', 'INTEGER'),
+    ('n_electrons', 'INTEGER'),
+    ('n_qubits', 'INTEGER'),
+    ('nuclear_repulsion', 'REAL'),
+    ('hf_energy', 'REAL'),
+    ('mp2_energy', 'REAL'),
+    ('ccsd_energy', 'REAL'),
+    ('size', 'INTEGER'),
+    ('mtime', 'REAL')])
+
+_indexed_columns = ('name', 'formula', 'basis', 'geometry_hash')
+
+
+class CatalogError(Exception):
+    pass
+
+
+def molecular_formula(atoms):
+    """Formula of a list of atom symbols in Hill order (C, H, then the other
+    elements alphabetically, or all alphabetically without carbon), e.g.
+    'HLi' for ['Li', 'H'] and 'CH4' for ['C', 'H', 'H', 'H', 'H']."""
+    counts = collections.Counter(atoms)
+    if 'C' in counts:
+        order = ['C'] + (['H'] if 'H' in counts else []) + sorted(
+            atom for atom in counts if atom not in ('C', 'H'))
+    else:
+        order = sorted(counts)
+    return ''.join(atom + (str(counts[atom]) if counts[atom] > 1 else '')
+                   for atom in order)
+
+
+def _normalize_formula(formula):
+    """Hill formula of a formula written in any order, e.g. 'LiH'."""
+    atoms = []
+    for atom, count in re.findall(r'([A-Z][a-z]?)(\d*)', formula):
+        atoms += [atom] * (int(count) if count else 1)
+    return molecular_formula(atoms)
+
+
+def geometry_hash(geometry, decimals=6):
+    """Hash of a geometry, equal for the same atoms and positions rounded to
+    decimals (in angstrom).
+
+    Args:
+        geometry: List of tuples (atom symbol, (x, y, z)), or the string
+            of a geometry file.
+        decimals: Integer, number of decimals of the positions compared.
+
+    Returns:
+        hash: Hexadecimal string.
+    """
+    if isinstance(geometry, str):
+        text = geometry
+    else:
+        # + 0. turns -0. into 0.
+        text = ';'.join('{} {}'.format(atom, ' '.join(
+            '{:.{}f}'.format(round(float(x), decimals) + 0., decimals) for x in position))
+            for atom, position in geometry)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _float(value):
+    """Energy as a float, or None if not computed or not a number."""
+    if value is None or value is False:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    if value is None or value is False:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _file_stat(filename):
+    status = os.stat(filename)
+    return status.st_size, status.st_mtime
+
+
+def molecule_record(molecule):
+    """Catalog record of a saved molecule.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class, saved in
+            molecule.filename + '.hdf5'.
+
+    Returns:
+        record: Dictionary column -> value.
+    """
+    filename = "{}.hdf5".format(molecule.filename)
+    size, mtime = _file_stat(filename)
+    geometry = molecule.geometry
+    return {'path': os.path.basename(filename),
+            'name': molecule.name,
+            'formula': molecular_formula(molecule.atoms),
+            'basis': molecule.basis,
+            'charge': _int(molecule.charge),
+            'multiplicity': _int(molecule.multiplicity),
+            'relativistic': int(bool(molecule.relativistic)),
+            'symmetry': int(molecule.symmetry is not False),
+            'speed_of_light': _float(molecule.speed_of_light),
+            'description': molecule.description,
+            'geometry_hash': geometry_hash(geometry),
+            'n_atoms': _int(molecule.n_atoms),
+            'n_electrons': _int(molecule.n_electrons),
+            'n_qubits': _int(molecule.n_qubits),
+            'nuclear_repulsion': _float(molecule.E_core),
+            'hf_energy': _float(molecule.hf_energy),
+            'mp2_energy': _float(molecule.mp2_energy),
+            'ccsd_energy': _float(molecule.ccsd_energy),
+            'size': size,
+            'mtime': mtime}
+
+
+def _dataset(f, name):
+    """Value of a dataset of a saved molecule, None if missing or not
+    computed (saved as False), strings decoded."""
+    if name not in f:
+        return None
+    data = f[name][()]
+    if isinstance(data, (bool, numpy.bool_)) and not data:
+        return None
+    if isinstance(data, bytes):
+        return data.decode()
+    if isinstance(data, numpy.ndarray) and data.dtype.kind == 'S':
+        return [item.decode() for item in data.ravel()]
+    return data
+
+
+def file_record(filename):
+    """Catalog record read from a file written by MolecularData_Dirac.save.
+
+    Files saved before the relativistic, symmetry and speed of light options
+    were datasets get them from the suffixes of the molecule name.
+
+    Args:
+        filename: Name of the HDF5 file.
+
+    Returns:
+        record: Dictionary column -> value.
+
+    Raises:
+        CatalogError: If the file is not one of a molecule, e.g. the file of
+            a ScanData_Dirac.
+    """
+    size, mtime = _file_stat(filename)
+    with h5py.File(filename, "r") as f:
+        if 'name' not in f or 'geometry' not in f:
+            raise CatalogError('{} is not the file of a molecule'.format(filename))
+        name = _dataset(f, 'name') or ''
+        atoms = _dataset(f, 'geometry/atoms')
+        positions = _dataset(f, 'geometry/positions')
+        if isinstance(atoms, list) and positions is not None:
+            geometry = list(zip(atoms, numpy.asarray(positions).reshape(-1, 3)))
+            formula = molecular_formula(atoms)
+        else:
+            geometry = atoms or ''
+            formula = None
+        record = {'path': os.path.basename(filename),
+                  'name': name,
+                  'formula': formula,
+                  'basis': _dataset(f, 'basis'),
+                  'charge': _int(_dataset(f, 'charge')),
+                  'multiplicity': _int(_dataset(f, 'multiplicity')),
+                  'description': _dataset(f, 'description') or '',
+                  'geometry_hash': geometry_hash(geometry),
+                  'n_atoms': _int(_dataset(f, 'n_atoms')),
+                  'n_electrons': _int(_dataset(f, 'n_electrons')),
+                  'n_qubits': _int(_dataset(f, 'n_qubits')),
+                  'nuclear_repulsion': _float(_dataset(f, 'nuclear_repulsion')),
+                  'hf_energy': _float(_dataset(f, 'hf_energy')),
+                  'mp2_energy': _float(_dataset(f, 'mp2_energy')),
+                  'ccsd_energy': _float(_dataset(f, 'ccsd_energy')),
+                  'size': size,
+                  'mtime': mtime}
+        if 'relativistic' in f:
+            record['relativistic'] = int(bool(f['relativistic'][()]))
+            record['symmetry'] = int(bool(f['symmetry'][()]))
+            record['speed_of_light'] = _float(f['speed_of_light'][()].item())
+            return record
+    # Suffixes of name_molecule: _rel, _nosym, then _c<speed of light>.
+    tokens = name.split('_')
+    record['relativistic'] = int('rel' in tokens)
+    record['symmetry'] = int('nosym' not in tokens)
+    record['speed_of_light'] = None
+    if record['relativistic'] and tokens[-1].startswith('c'):
+        record['speed_of_light'] = _float(tokens[-1][1:])
+    return record
+
+
+def connect_catalog(directory):
+    """Open (and create if needed) the catalog of a directory.
+
+    Returns:
+        connection: sqlite3.Connection, rows as sqlite3.Row.
+    """
+    connection = sqlite3.connect(os.path.join(directory, CATALOG_NAME),
+                                 timeout=60)
+    connection.row_factory = sqlite3.Row
+    # Concurrent save() of run_dirac_jobs write while others read.
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS molecules ({})'.format(
+        ', '.join('{} {}'.format(column, kind) for column, kind in _columns.items())))
+    for column in _indexed_columns:
+        connection.execute('CREATE INDEX IF NOT EXISTS molecules_{0} '
+                           'ON molecules ({0})'.format(column))
+    return connection
+
+
+def _upsert(connection, records):
+    columns = list(_columns)
+    connection.executemany(
+        'INSERT OR REPLACE INTO molecules ({}) VALUES ({})'.format(
+            ', '.join(columns), ', '.join('?' * len(columns))),
+        [[record[column] for column in columns] for record in records])
+
+
+def update_catalog(molecule):
+    """Record a saved molecule in the catalog of its directory, called by
+    MolecularData_Dirac.save.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class, saved.
+    """
+    directory = os.path.dirname(os.path.abspath(molecule.filename))
+    connection = connect_catalog(directory)
+    try:
+        with connection:
+            _upsert(connection, [molecule_record(molecule)])
+    finally:
+        connection.close()
+
+
+def rebuild_catalog(directory, full=False, max_workers=8, skipped=None):
+    """Index the HDF5 files of a directory in its catalog.
+
+    Files whose size and modification time are those of the catalog are not
+    read again, unless full is True. Records of deleted files are removed.
+    Files which are not those of a molecule, e.g. of a ScanData_Dirac, are
+    skipped.
+
+    Args:
+        directory: Data directory of the molecules.
+        full: Boolean, read every file again.
+        max_workers: Number of threads reading the files.
+        skipped: Optional list to which (filename, reason) is appended for
+            each file which could not be read.
+
+    Returns:
+        n_read: Number of files read and recorded.
+    """
+    if skipped is None:
+        skipped = []
+    filenames = {name: os.path.join(directory, name)
+                 for name in os.listdir(directory) if name.endswith('.hdf5')}
+    connection = connect_catalog(directory)
+    try:
+        # Records without a name, e.g. of a ScanData_Dirac file indexed by an
+        # older version, are read again.
+        known = {row['path']: (row['size'], row['mtime']) if row['name'] else None
+                 for row in connection.execute(
+                     'SELECT path, name, size, mtime FROM molecules')}
+        removed = [(path,) for path in known if path not in filenames]
+        stale = [filename for name, filename in sorted(filenames.items())
+                 if full or known.get(name) != _file_stat(filename)]
+
+        def read(filename):
+            try:
+                return file_record(filename)
+            except CatalogError:
+                removed.append((os.path.basename(filename),))
+                return None
+            except (IOError, OSError, KeyError, ValueError) as error:
+                skipped.append((filename, str(error)))
+                return None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            records = [record for record in executor.map(read, stale)
+                       if record is not None]
+        with connection:
+            connection.executemany('DELETE FROM molecules WHERE path = ?', removed)
+            _upsert(connection, records)
+    finally:
+        connection.close()
+    return len(records)
+
+
+def query_catalog(directory, computed=(), order_by='name', limit=None,
+                  **filters):
+    """Find saved molecules in the catalog of a directory.
+
+    Example: the relativistic LiH molecules in cc-pVDZ with a CCSD energy,
+        query_catalog('data', formula='LiH', basis='cc-pVDZ',
+                      relativistic=True, computed=['ccsd_energy'])
+
+    Args:
+        directory: Data directory of the molecules.
+        computed: List of columns which must be known, e.g. ['ccsd_energy'].
+        order_by: Column sorting the molecules.
+        limit: Optional maximum number of molecules.
+        filters: Column=value, with value a number or string (equality,
+            case insensitive for the basis), a list (any of the values), a
+            tuple (low, high) (range, None for an open bound), or None
+            (unknown value). The formula is accepted in any order of the
+            elements.
+
+    Returns:
+        records: List of dictionaries column -> value, with path the full
+            name of the HDF5 file.
+
+    Raises:
+        CatalogError: If a column is unknown or the directory has no
+            catalog.
+    """
+    unknown = [column for column in list(filters) + list(computed) + [order_by]
+               if column not in _columns]
+    if unknown:
+        raise CatalogError('unknown catalog columns: {}'.format(', '.join(unknown)))
+    if not os.path.exists(os.path.join(directory, CATALOG_NAME)):
+        raise CatalogError('no catalog in {}, run rebuild_catalog'.format(directory))
+    conditions = []
+    parameters = []
+    for column, value in sorted(filters.items()):
+        if column == 'formula' and isinstance(value, str):
+            value = _normalize_formula(value)
+        if isinstance(value, bool):
+            value = int(value)
+        if value is None:
+            conditions.append('{} IS NULL'.format(column))
+        elif isinstance(value, tuple):
+            low, high = value
+            if low is not None:
+                conditions.append('{} >= ?'.format(column))
+                parameters.append(low)
+            if high is not None:
+                conditions.append('{} <= ?'.format(column))
+                parameters.append(high)
+        elif isinstance(value, list):
+            conditions.append('{} IN ({})'.format(column, ', '.join('?' * len(value))))
+            parameters += value
+        else:
+            conditions.append('{} = ?'.format(column))
+            parameters.append(value)
+    conditions += ['{} IS NOT NULL'.format(column) for column in computed]
+    sql = 'SELECT * FROM molecules'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY {}'.format(order_by)
+    if limit is not None:
+        sql += ' LIMIT {:d}'.format(limit)
+
+    connection = connect_catalog(directory)
+    try:
+        records = [dict(row) for row in connection.execute(sql, parameters)]
+    finally:
+        connection.close()
+    for record in records:
+        record['path'] = os.path.join(directory, record['path'])
+    return records
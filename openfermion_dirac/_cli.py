@@ -0,0 +1,389 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Command line interface, installed as openfermion-dirac.
+
+openfermion-dirac batch manifest.json runs the sweep described by the
+manifest, a JSON file such as:
+    {
+        "geometries": [
+            {"description": "R0.7", "geometry": [["H", [0, 0, 0]], ["H", [0, 0, 0.7]]]},
+            {"description": "R0.8", "geometry": [["H", [0, 0, 0]], ["H", [0, 0, 0.8]]]}
+        ],
+        "basis": ["STO-3G", "cc-pVDZ"],
+        "multiplicity": 1,
+        "charge": [0, 1],
+        "relativistic": [false, true],
+        "speed_of_light": [false, 50],
+        "data_directory": "data",
+        "max_workers": 4,
+        "run_dirac": {"save": true, "delete_MDCINT": true}
+    }
+Every combination of the listed values is a job. "geometries" may also be
+{"xyz": "trajectory.xyz", "frames": [0, 10, 20]} to read the frames of a
+XYZ file. speed_of_light other than false only applies to relativistic
+jobs. Relative paths are relative to the directory of the manifest.
+
+The finished jobs are appended to a state file (manifest.json.state by
+default), so that running the same command again after a crash only runs
+the missing jobs.
+
+openfermion-dirac catalog rebuild DIRECTORY indexes the saved molecules of
+a directory in its catalog, and openfermion-dirac catalog query DIRECTORY
+lists them, e.g. --formula LiH --basis cc-pVDZ --relativistic --has
+ccsd_energy.
+
+openfermion-dirac daemon --cores 16 --memory 64GB serves the local job queue
+(see _daemon.py), openfermion-dirac submit job.json adds a job to it, the
+JSON file giving the arguments of MolecularData_Dirac and run_dirac:
+    {"molecule": {"geometry": [["H", [0, 0, 0]], ["H", [0, 0, 0.7]]],
+                  "basis": "STO-3G", "multiplicity": 1,
+                  "data_directory": "data"},
+     "run_dirac": {"save": true}, "cores": 2}
+and openfermion-dirac jobs lists the jobs of the queue.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+from ._batch import run_dirac_jobs
+from ._catalog import CatalogError, query_catalog, rebuild_catalog
+from ._daemon import JobDaemon, JobError, cancel_job, list_jobs, submit_job
+from ._molecular_data_Dirac import MolecularData_Dirac, iter_xyz_frames
+
+# Manifest keys of the molecular parameters, with their default value.
+_sweep_fields = [('basis', None), ('multiplicity', 1), ('charge', 0),
+                 ('relativistic', False), ('symmetry', True),
+                 ('speed_of_light', False)]
+
+# Swept parameters which are also arguments of run_dirac, given to it per job.
+_run_dirac_fields = ('relativistic', 'symmetry', 'speed_of_light')
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _iter_geometries(manifest, root):
+    """Yield (description, geometry) of the geometries of the manifest."""
+    geometries = manifest.get('geometries')
+    if isinstance(geometries, dict) and 'xyz' in geometries:
+        frames = geometries.get('frames')
+        frames = set(frames) if frames is not None else None
+        prefix = geometries.get('description', '')
+        prefix = prefix + '_' if prefix else ''
+        frame_file = os.path.join(root, geometries['xyz'])
+        for index, (_, geometry) in enumerate(iter_xyz_frames(frame_file)):
+            if frames is None or index in frames:
+                yield '{}frame{}'.format(prefix, index), geometry
+    elif isinstance(geometries, list):
+        for index, item in enumerate(geometries):
+            yield (item.get('description', 'geometry{}'.format(index)),
+                   [(atom, tuple(position)) for atom, position in item['geometry']])
+    else:
+        raise ManifestError('geometries should be a list of geometries or '
+                            '{"xyz": file name}')
+
+
+def iter_manifest_jobs(manifest, root=os.curdir):
+    """Expand the sweep of a manifest into molecules, lazily.
+
+    Args:
+        manifest: Dictionary read from the manifest file.
+        root: Directory against which relative paths are resolved.
+
+    Yields:
+        job: (molecule, arguments) per job, molecule a MolecularData_Dirac
+            and arguments the run_dirac arguments of its Hamiltonian
+            (relativistic, symmetry, speed_of_light), as taken by
+            run_dirac_jobs.
+    """
+    if manifest.get('basis') is None:
+        raise ManifestError('the manifest should give the basis')
+    values = [_as_list(manifest.get(field, default))
+              for field, default in _sweep_fields]
+    data_directory = os.path.join(root, manifest.get('data_directory', os.curdir))
+    for description, geometry in _iter_geometries(manifest, root):
+        for combination in itertools.product(*values):
+            parameters = dict(zip([field for field, _ in _sweep_fields], combination))
+            if parameters['speed_of_light'] is not False and not parameters['relativistic']:
+                continue
+            molecule = MolecularData_Dirac(geometry=geometry,
+                                           description=description,
+                                           data_directory=data_directory,
+                                           **parameters)
+            yield molecule, {field: parameters[field] for field in _run_dirac_fields}
+
+
+def read_state(state_file):
+    """Names of the molecules whose job is finished, from the state file."""
+    done = set()
+    if not os.path.exists(state_file):
+        return done
+    with open(state_file) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Line cut by a crash while it was written.
+                continue
+            if record.get('status') == 'done':
+                done.add(record['name'])
+    return done
+
+
+def _record(state, name, status, error=None):
+    record = {'name': name, 'status': status}
+    if error is not None:
+        record['error'] = str(error)
+    state.write(json.dumps(record) + '\n')
+    state.flush()
+    os.fsync(state.fileno())
+
+
+def run_batch(manifest_file, state_file=None, max_workers=None, dry_run=False):
+    """Run the jobs of a manifest which are not finished yet.
+
+    Args:
+        manifest_file: Name of the JSON manifest, see the module docstring.
+        state_file: Optional name of the state file, manifest_file + '.state'
+            by default.
+        max_workers: Optional number of concurrent calculations, overrides
+            the manifest (default 1).
+        dry_run: Boolean, only print the names of the missing jobs.
+
+    Returns:
+        n_failed: Number of jobs which failed.
+    """
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    root = os.path.dirname(os.path.abspath(manifest_file))
+    if state_file is None:
+        state_file = manifest_file + '.state'
+    if max_workers is None:
+        max_workers = manifest.get('max_workers', 1)
+    options = dict(manifest.get('run_dirac', {}))
+    for field in _run_dirac_fields:
+        if field in options:
+            raise ManifestError('{} is a parameter of the sweep, it should not be '
+                                'in run_dirac'.format(field))
+    if options.get('scratch_root'):
+        options['scratch_root'] = os.path.join(root, options['scratch_root'])
+
+    done = read_state(state_file)
+    jobs = (job for job in iter_manifest_jobs(manifest, root)
+            if job[0].name not in done)
+    if dry_run:
+        for molecule, _ in jobs:
+            print(molecule.name)
+        return 0
+
+    failed = []
+    with open(state_file, 'a') as state:
+        if state.tell() > 0:
+            # Terminate a line cut by a crash, it is ignored by read_state.
+            with open(state_file, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    state.write('\n')
+        for molecule in run_dirac_jobs(jobs, max_workers, failed, **options):
+            _record(state, molecule.name, 'done')
+        for molecule, error in failed:
+            _record(state, molecule.name, 'failed', error)
+    return len(failed)
+
+
+# Columns printed by catalog query without --json.
+_query_columns = ['name', 'n_qubits', 'hf_energy', 'mp2_energy', 'ccsd_energy', 'path']
+
+
+def run_catalog_query(args):
+    """Print the molecules of the catalog selected by the query arguments."""
+    filters = {}
+    for column in ('formula', 'basis', 'charge', 'multiplicity',
+                   'geometry_hash', 'n_qubits'):
+        if getattr(args, column) is not None:
+            filters[column] = getattr(args, column)
+    if args.relativistic is not None:
+        filters['relativistic'] = args.relativistic
+    records = query_catalog(args.directory, computed=args.has,
+                            order_by=args.order_by, limit=args.limit, **filters)
+    if args.json:
+        for record in records:
+            print(json.dumps(record))
+        return
+    print('\t'.join(_query_columns))
+    for record in records:
+        print('\t'.join('' if record[column] is None else str(record[column])
+                        for column in _query_columns))
+
+
+def submit_job_file(job_file, queue=None):
+    """Add the job described by a JSON file to the queue, see the module
+    docstring.
+
+    Returns:
+        job_id: Integer identifying the job.
+    """
+    with open(job_file) as f:
+        job = json.load(f)
+    root = os.path.dirname(os.path.abspath(job_file))
+    arguments = dict(job['molecule'])
+    if not isinstance(arguments.get('geometry'), str):
+        arguments['geometry'] = [(atom, tuple(position))
+                                 for atom, position in arguments['geometry']]
+    arguments['data_directory'] = os.path.join(
+        root, arguments.get('data_directory', os.curdir))
+    molecule = MolecularData_Dirac(**arguments)
+    return submit_job(molecule, queue, job.get('cores'), job.get('memory'),
+                      **job.get('run_dirac', {}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='openfermion-dirac',
+        description='OpenFermion/Dirac interface')
+    commands = parser.add_subparsers(dest='command')
+    batch = commands.add_parser(
+        'batch', help='run the Dirac calculations of a manifest, resuming '
+                      'after the jobs already finished')
+    batch.add_argument('manifest', help='JSON file describing the sweep')
+    batch.add_argument('--state', default=None,
+                       help='state file of the finished jobs '
+                            '(default: MANIFEST.state)')
+    batch.add_argument('--max-workers', type=int, default=None,
+                       help='number of concurrent calculations')
+    batch.add_argument('--dry-run', action='store_true',
+                       help='only list the jobs still to run')
+    catalog = commands.add_parser(
+        'catalog', help='index or query the catalog of the molecules saved '
+                        'in a directory')
+    catalog_commands = catalog.add_subparsers(dest='catalog_command')
+    rebuild = catalog_commands.add_parser(
+        'rebuild', help='index the HDF5 files new or modified since the '
+                        'last rebuild')
+    rebuild.add_argument('directory', help='data directory of the molecules')
+    rebuild.add_argument('--full', action='store_true',
+                         help='read every file again')
+    rebuild.add_argument('--max-workers', type=int, default=8,
+                         help='number of threads reading the files')
+    query = catalog_commands.add_parser('query', help='list saved molecules')
+    query.add_argument('directory', help='data directory of the molecules')
+    query.add_argument('--formula', help='e.g. LiH, in any order of the elements')
+    query.add_argument('--basis')
+    query.add_argument('--charge', type=int)
+    query.add_argument('--multiplicity', type=int)
+    query.add_argument('--n-qubits', type=int)
+    query.add_argument('--geometry-hash')
+    query.add_argument('--relativistic', action='store_true', default=None)
+    query.add_argument('--nonrelativistic', dest='relativistic',
+                       action='store_false')
+    query.add_argument('--has', action='append', default=[], metavar='COLUMN',
+                       help='only molecules with this value known, e.g. ccsd_energy')
+    query.add_argument('--order-by', default='name')
+    query.add_argument('--limit', type=int)
+    query.add_argument('--json', action='store_true',
+                       help='print every column, one JSON object per molecule')
+    daemon = commands.add_parser(
+        'daemon', help='run the jobs of the local queue within a budget of '
+                       'cores and memory')
+    daemon.add_argument('--queue', help='queue file (default: '
+                                        '$OPENFERMION_DIRAC_QUEUE or ~/.cache)')
+    daemon.add_argument('--cores', type=int, help='cores shared by the jobs')
+    daemon.add_argument('--memory', help='memory shared by the jobs, e.g. 64GB')
+    daemon.add_argument('--workers', type=int,
+                        help='number of warm worker processes')
+    daemon.add_argument('--max-wait', type=float, default=600.,
+                        help='seconds after which a queued job which does not '
+                             'fit is no longer overtaken by later jobs '
+                             '(default: 600)')
+    daemon.add_argument('--until-idle', action='store_true',
+                        help='exit when no job is queued or running')
+    submit = commands.add_parser('submit', help='add a job to the local queue')
+    submit.add_argument('job', help='JSON file describing the job')
+    submit.add_argument('--queue')
+    jobs = commands.add_parser('jobs', help='list the jobs of the local queue')
+    jobs.add_argument('--queue')
+    jobs.add_argument('--status', action='append',
+                      help='only the jobs with this status')
+    cancel = commands.add_parser('cancel', help='remove a queued job')
+    cancel.add_argument('job_id', type=int)
+    cancel.add_argument('--queue')
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        try:
+            n_failed = run_batch(args.manifest, args.state, args.max_workers,
+                                 args.dry_run)
+        except (IOError, ValueError, ManifestError) as error:
+            parser.error(str(error))
+        if n_failed:
+            print('{} jobs failed, run the command again to retry them'.format(n_failed))
+            return 1
+        return 0
+    if args.command == 'catalog' and args.catalog_command == 'rebuild':
+        skipped = []
+        try:
+            n_read = rebuild_catalog(args.directory, args.full,
+                                     args.max_workers, skipped)
+        except OSError as error:
+            parser.error(str(error))
+        print('{} files indexed, {} skipped'.format(n_read, len(skipped)))
+        for filename, reason in skipped:
+            print('{}: {}'.format(filename, reason))
+        return 1 if skipped else 0
+    if args.command == 'catalog' and args.catalog_command == 'query':
+        try:
+            run_catalog_query(args)
+        except CatalogError as error:
+            parser.error(str(error))
+        return 0
+    if args.command == 'daemon':
+        try:
+            JobDaemon(args.queue, args.cores, args.memory, args.workers,
+                      max_wait=args.max_wait).serve(args.until_idle)
+        except (JobError, ValueError) as error:
+            parser.error(str(error))
+        return 0
+    if args.command == 'submit':
+        try:
+            print(submit_job_file(args.job, args.queue))
+        except (IOError, ValueError, KeyError, JobError) as error:
+            parser.error(str(error))
+        return 0
+    if args.command == 'jobs':
+        print('id\tstatus\tuser\tcores\tname\terror')
+        for job in list_jobs(args.queue, args.status):
+            error = (job['error'] or '').strip().splitlines()
+            print('{}\t{}\t{}\t{}\t{}\t{}'.format(
+                job['id'], job['status'], job['user'], job['cores'], job['name'],
+                error[-1] if error else ''))
+        return 0
+    if args.command == 'cancel':
+        try:
+            cancel_job(args.job_id, args.queue)
+        except JobError as error:
+            parser.error(str(error))
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,633 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Local queue of run_dirac jobs served by a daemon with warm workers.
+
+Clients add jobs to a queue, an SQLite file, with submit_job. A daemon
+(JobDaemon.serve, or openfermion-dirac daemon) keeps worker processes which
+imported numpy, h5py and openfermion once at start-up, and starts the
+queued jobs in submission order as long as they fit in its budget of cores
+and memory, so that the jobs share the node without oversubscription. A
+job which does not fit yet is overtaken by later smaller ones, until it
+has waited max_wait seconds: the daemon then starts no later job until it
+runs, so that a large job is not starved by a stream of small ones.
+job_status, wait_for_job and list_jobs read the queue.
+
+The queue is $OPENFERMION_DIRAC_QUEUE, by default
+~/.cache/openfermion_dirac/queue.sqlite. It is private to its owner (mode
+0600), since the daemon runs the jobs with the identity of its user: every
+user runs their own daemon on their own queue. The arguments of the jobs
+are checked against run_dirac before they run.
+"""
+
+import getpass
+import inspect
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+
+from ._lazy import LazyModule
+from ._memory import available_memory, parse_memory_size
+
+sqlite3 = LazyModule('sqlite3')
+
+# Dirac work memory per MPI process when run_dirac does not set it, in
+# megawords (8 MB).
+_default_dirac_memory = 64
+
+# Modules imported by the workers before their first job.
+_warm_modules = ('numpy', 'h5py', 'openfermion', 'openfermion.ops',
+                 'openfermion.utils')
+
+
+def _is_flag(value):
+    return isinstance(value, bool)
+
+
+def _is_count(value):
+    return value is False or value is None or (
+        isinstance(value, int) and not isinstance(value, bool) and value > 0)
+
+
+def _is_path(value):
+    return value is False or value is None or (
+        isinstance(value, str) and '\0' not in value)
+
+
+def _is_number(value):
+    return value is False or (isinstance(value, (int, float)) and
+                              not isinstance(value, bool) and value > 0)
+
+
+def _is_active(value):
+    return value is False or (isinstance(value, list) and len(value) == 3 and all(
+        isinstance(x, (int, float)) and not isinstance(x, bool) for x in value))
+
+
+# Checks of the run_dirac arguments a queued job may give, as (test, expected
+# value). Arguments missing from it, e.g. new ones, are refused.
+_option_checks = {
+    'symmetry': (_is_flag, 'a boolean'),
+    'run_ccsd': (_is_flag, 'a boolean'),
+    'relativistic': (_is_flag, 'a boolean'),
+    'point_nucleus': (_is_flag, 'a boolean'),
+    'speed_of_light': (_is_number, 'false or a positive number'),
+    'active': (_is_active, 'false or a list of 3 numbers'),
+    'manual_option': (_is_path, 'false or a string'),
+    'delete_input': (_is_flag, 'a boolean'),
+    'delete_output': (_is_flag, 'a boolean'),
+    'delete_xyz': (_is_flag, 'a boolean'),
+    'delete_MRCONEE': (_is_flag, 'a boolean'),
+    'delete_MDCINT': (_is_flag, 'a boolean'),
+    'delete_FCIDUMP': (_is_flag, 'a boolean'),
+    'delete_DFCOEF': (_is_flag, 'a boolean'),
+    'start_guess': (_is_path, 'the name of a DFCOEF file'),
+    'mpi': (_is_count, 'false or a positive integer'),
+    'omp_threads': (_is_count, 'false or a positive integer'),
+    'memory': (_is_count, 'false or a positive integer (megawords)'),
+    'scratch': (_is_path, 'false or a directory name'),
+    'auto_resources': (_is_flag, 'a boolean'),
+    'jobs_per_node': (_is_count, 'a positive integer'),
+    'scratch_root': (_is_path, 'false or a directory name'),
+    'export_format': (lambda value: value in ('fcidump', 'npy', 'stream'),
+                      "'fcidump', 'npy' or 'stream'"),
+    'archive_FCIDUMP': (_is_flag, 'a boolean'),
+    'save': (_is_flag, 'a boolean')}
+
+
+class JobError(Exception):
+    pass
+
+
+def default_queue():
+    """Name of the default queue file."""
+    if os.environ.get('OPENFERMION_DIRAC_QUEUE'):
+        return os.environ['OPENFERMION_DIRAC_QUEUE']
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'openfermion_dirac', 'queue.sqlite')
+
+
+def _check_private(filename):
+    """Refuse a queue file which other users may write or which is theirs."""
+    status = os.stat(filename)
+    if status.st_uid != os.getuid():
+        raise JobError('the queue {} belongs to another user, every user runs '
+                       'their own daemon'.format(filename))
+    if status.st_mode & 0o077:
+        raise JobError('the queue {} is accessible to other users, make it '
+                       'private with chmod 600'.format(filename))
+
+
+def _connect(queue):
+    if queue is None:
+        queue = default_queue()
+    directory = os.path.dirname(os.path.abspath(queue))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # SQLite gives its journal files the mode of the database.
+    os.close(os.open(queue, os.O_WRONLY | os.O_CREAT, 0o600))
+    _check_private(queue)
+    connection = sqlite3.connect(queue, timeout=60)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, status TEXT, user TEXT, '
+        'name TEXT, spec TEXT, cores INTEGER, memory INTEGER, '
+        'submitted REAL, started REAL, finished REAL, worker INTEGER, '
+        'result TEXT, error TEXT)')
+    connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+    connection.execute('CREATE TABLE IF NOT EXISTS daemon ('
+                       'key TEXT PRIMARY KEY, value TEXT)')
+    return connection
+
+
+def molecule_spec(molecule):
+    """Arguments of MolecularData_Dirac recreating a molecule in a worker."""
+    geometry = molecule.geometry
+    if not isinstance(geometry, str):
+        geometry = [[atom, [float(x) for x in position]]
+                    for atom, position in geometry]
+    return {'geometry': geometry,
+            'basis': molecule.basis,
+            'special_basis': molecule.special_basis,
+            'multiplicity': molecule.multiplicity,
+            'charge': molecule.charge,
+            'description': molecule.description,
+            'filename': os.path.abspath(molecule.filename),
+            'relativistic': molecule.relativistic,
+            'symmetry': molecule.symmetry,
+            'speed_of_light': molecule.speed_of_light,
+            'precision': molecule.precision,
+            'memory_budget': molecule.memory_budget,
+            'memory_fallback': molecule.memory_fallback}
+
+
+def _check_job_spec(spec):
+    """Check the arguments of a job before it is queued or run.
+
+    Args:
+        spec: Dictionary with molecule (arguments of MolecularData_Dirac),
+            run_dirac (arguments of run_dirac) and directory (absolute name
+            of the directory of the job).
+
+    Raises:
+        JobError: If an argument is unknown or of the wrong type.
+    """
+    from ._molecular_data_Dirac import MolecularData_Dirac
+    from ._run_dirac import run_dirac
+
+    if not isinstance(spec, dict) or set(spec) != {'molecule', 'run_dirac', 'directory'}:
+        raise JobError('a job should have molecule, run_dirac and directory')
+    directory = spec['directory']
+    if not isinstance(directory, str) or not os.path.isabs(directory):
+        raise JobError('the directory of a job should be an absolute path')
+    for name, arguments, function in (('molecule', spec['molecule'],
+                                       MolecularData_Dirac.__init__),
+                                      ('run_dirac', spec['run_dirac'], run_dirac)):
+        if not isinstance(arguments, dict):
+            raise JobError('{} should be a dictionary of arguments'.format(name))
+        parameters = set(inspect.signature(function).parameters) - {'self', 'molecule'}
+        unknown = sorted(set(arguments) - parameters)
+        if unknown:
+            raise JobError('{} is not an argument of {}'.format(
+                ', '.join(unknown), function.__name__))
+    for option, value in spec['run_dirac'].items():
+        if option not in _option_checks:
+            raise JobError('{} may not be given to a queued job'.format(option))
+        check, expected = _option_checks[option]
+        if not check(value):
+            raise JobError('{} should be {}, not {!r}'.format(option, expected, value))
+    if not isinstance(spec['molecule'].get('filename', ''), str):
+        raise JobError('the filename of the molecule should be a string')
+
+
+def _job_resources(molecule, cores, memory, options):
+    """Cores and memory (bytes) reserved for a job."""
+    mpi = options.get('mpi') or 1
+    if cores is None:
+        cores = mpi * (options.get('omp_threads') or 1)
+    if memory is None:
+        from ._estimate import estimate_calculation
+
+        memory = mpi * (options.get('memory') or _default_dirac_memory) * 8 * 1024**2
+        if options.get('save') or options.get('export_format') == 'stream':
+            # The dense Hamiltonian coefficients are built by the worker.
+            memory += estimate_calculation(
+                molecule, options.get('relativistic', False),
+                options.get('active', False), options.get('symmetry', True),
+                memory_budget=0)['dense_tensor_bytes']
+    return int(cores), parse_memory_size(memory)
+
+
+def submit_job(molecule, queue=None, cores=None, memory=None, **kwargs):
+    """Add a run_dirac job to the queue.
+
+    The job runs in the current directory, with scratch_root defaulting to
+    it, as if run_dirac(molecule, **kwargs) were called here.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class.
+        queue: Optional name of the queue file, see default_queue.
+        cores: Optional number of cores of the job, by default mpi *
+            omp_threads of kwargs (1 if not given). Without mpi and
+            omp_threads, the job runs with omp_threads=cores.
+        memory: Optional memory of the job in bytes or string like '8GB', by
+            default the Dirac work memory plus the dense Hamiltonian
+            coefficients if they are built (save=True or
+            export_format='stream'), see estimate_calculation.
+        kwargs: Arguments of run_dirac, which must be JSON serializable
+            (start_guess as a DFCOEF file name), see _check_job_spec.
+
+    Returns:
+        job_id: Integer identifying the job.
+
+    Raises:
+        JobError: If the job needs more cores or memory than the budget of
+            the daemon serving the queue, or if an argument of run_dirac is
+            unknown or of the wrong type.
+    """
+    spec = {'molecule': molecule_spec(molecule),
+            'run_dirac': kwargs,
+            'directory': os.path.abspath(os.curdir)}
+    _check_job_spec(spec)
+    cores, memory = _job_resources(molecule, cores, memory, kwargs)
+    connection = _connect(queue)
+    try:
+        budget = {row['key']: json.loads(row['value'])
+                  for row in connection.execute('SELECT key, value FROM daemon')}
+        if budget.get('cores') is not None and cores > budget['cores']:
+            raise JobError('job needs {} cores, the daemon has {}'.format(
+                cores, budget['cores']))
+        if budget.get('memory') is not None and memory > budget['memory']:
+            raise JobError('job needs {:.3g} GB, the daemon has {:.3g} GB'.format(
+                memory / 1024.**3, budget['memory'] / 1024.**3))
+        with connection:
+            cursor = connection.execute(
+                'INSERT INTO jobs (status, user, name, spec, cores, memory, '
+                'submitted) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ('queued', getpass.getuser(), molecule.name, json.dumps(spec),
+                 cores, memory, time.time()))
+        return cursor.lastrowid
+    finally:
+        connection.close()
+
+
+def _job_dict(row):
+    job = dict(row)
+    del job['spec']
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def job_status(job_id, queue=None):
+    """State of a job.
+
+    Returns:
+        job: Dictionary with id, status ('queued', 'running', 'done',
+            'failed' or 'cancelled'), user, name, cores, memory, submitted,
+            started, finished (times in seconds since the epoch), worker
+            (process id), result (see wait_for_job) and error.
+
+    Raises:
+        JobError: If the job is not in the queue.
+    """
+    connection = _connect(queue)
+    try:
+        row = connection.execute('SELECT * FROM jobs WHERE id = ?',
+                                 (job_id,)).fetchone()
+    finally:
+        connection.close()
+    if row is None:
+        raise JobError('no job {} in the queue'.format(job_id))
+    return _job_dict(row)
+
+
+def list_jobs(queue=None, status=None):
+    """Jobs of the queue, in submission order.
+
+    Args:
+        queue: Optional name of the queue file.
+        status: Optional status, or list of status, of the jobs listed.
+
+    Returns:
+        jobs: List of dictionaries, see job_status.
+    """
+    sql = 'SELECT * FROM jobs'
+    parameters = []
+    if status is not None:
+        status = [status] if isinstance(status, str) else list(status)
+        sql += ' WHERE status IN ({})'.format(', '.join('?' * len(status)))
+        parameters = status
+    connection = _connect(queue)
+    try:
+        return [_job_dict(row) for row in
+                connection.execute(sql + ' ORDER BY id', parameters)]
+    finally:
+        connection.close()
+
+
+def wait_for_job(job_id, queue=None, timeout=None, poll_interval=0.5):
+    """Wait for the end of a job and return its result.
+
+    Returns:
+        result: Dictionary with name, filename, hf_energy, mp2_energy,
+            ccsd_energy and n_qubits (None when not computed). The saved
+            molecule, if save=True was given, is in filename + '.hdf5'.
+
+    Raises:
+        JobError: If the job failed or was cancelled.
+        TimeoutError: If the job is not finished after timeout seconds.
+    """
+    start = time.time()
+    while True:
+        job = job_status(job_id, queue)
+        if job['status'] == 'done':
+            return job['result']
+        if job['status'] in ('failed', 'cancelled'):
+            raise JobError('job {} {}: {}'.format(job_id, job['status'], job['error']))
+        if timeout is not None and time.time() - start > timeout:
+            raise TimeoutError('job {} still {}'.format(job_id, job['status']))
+        time.sleep(poll_interval)
+
+
+def cancel_job(job_id, queue=None):
+    """Remove a queued job from the queue.
+
+    Raises:
+        JobError: If the job is not queued (running or finished).
+    """
+    connection = _connect(queue)
+    try:
+        with connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? "
+                "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+    finally:
+        connection.close()
+    if cursor.rowcount == 0:
+        raise JobError('job {} is not queued'.format(job_id))
+
+
+def _run_job(spec, cores):
+    """Run a job in a worker and return its result."""
+    from ._molecular_data_Dirac import MolecularData_Dirac
+    from ._run_dirac import run_dirac
+
+    _check_job_spec(spec)
+    os.chdir(spec['directory'])
+    arguments = dict(spec['molecule'])
+    if not isinstance(arguments['geometry'], str):
+        arguments['geometry'] = [(atom, tuple(position))
+                                 for atom, position in arguments['geometry']]
+    molecule = MolecularData_Dirac(**arguments)
+    options = dict(spec['run_dirac'])
+    options.setdefault('scratch_root', spec['directory'])
+    if not options.get('mpi') and not options.get('omp_threads'):
+        options['omp_threads'] = cores
+    run_dirac(molecule, **options)
+    result = {'name': molecule.name, 'filename': molecule.filename,
+              'n_qubits': molecule.n_qubits}
+    try:
+        energies = molecule.get_energies()
+    except FileNotFoundError:
+        energies = (None, None, None)
+    for key, energy in zip(('hf_energy', 'mp2_energy', 'ccsd_energy'), energies):
+        result[key] = float(energy) if energy is not None else None
+    return result
+
+
+def _worker_main(connection):
+    """Loop of a worker process: import the heavy modules, then run the
+    jobs received until None."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in _warm_modules:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    while True:
+        message = connection.recv()
+        if message is None:
+            return
+        spec, cores = message
+        try:
+            connection.send(('done', _run_job(spec, cores)))
+        except BaseException:
+            connection.send(('failed', traceback.format_exc()))
+
+
+class _Worker(object):
+
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.job = None
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class JobDaemon(object):
+
+    """Daemon running the jobs of a queue within a budget of cores and
+    memory.
+
+    Usage:
+        JobDaemon(cores=16, memory='64GB').serve()
+
+    Attributes:
+        queue: Name of the queue file.
+        cores: Number of cores shared by the running jobs.
+        memory: Memory in bytes shared by the running jobs.
+        workers: Number of worker processes, the largest number of jobs
+            running at the same time, by default the number of cores up to
+            8.
+        poll_interval: Seconds between two reads of the queue when idle.
+        max_wait: Seconds after its submission during which a job which
+            does not fit may be overtaken by later jobs. Past it, the cores
+            and memory are kept for this job as the running jobs finish.
+    """
+    def __init__(self, queue=None, cores=None, memory=None, workers=None,
+                 poll_interval=0.5, max_wait=600.):
+        self.queue = queue if queue is not None else default_queue()
+        if cores is None:
+            try:
+                cores = len(os.sched_getaffinity(0))
+            except AttributeError:  # pragma: no cover
+                cores = os.cpu_count() or 1
+        self.cores = int(cores)
+        self.memory = (parse_memory_size(memory) if memory is not None
+                       else int(0.8 * (available_memory() or 8 * 1024**3)))
+        self.workers = int(workers) if workers is not None else min(self.cores, 8)
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self._stopping = False
+
+    def stop(self, *args):
+        """Stop after the running jobs, e.g. on SIGTERM."""
+        self._stopping = True
+
+    def _lock(self):
+        import fcntl
+
+        lock = os.fdopen(os.open(self.queue + '.lock', os.O_WRONLY | os.O_CREAT,
+                                 0o600), 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            raise JobError('a daemon already serves {}'.format(self.queue))
+        return lock
+
+    def serve(self, until_idle=False):
+        """Run the queued jobs until stop (SIGTERM or SIGINT).
+
+        Jobs left running by a daemon which died are queued again.
+
+        Args:
+            until_idle: Boolean, return when no job is queued or running.
+        """
+        import multiprocessing
+        import multiprocessing.connection
+
+        connection = _connect(self.queue)
+        lock = self._lock()
+        context = multiprocessing.get_context('spawn')
+        workers = []
+        previous_handlers = {}
+        try:
+            if threading.current_thread() is threading.main_thread():
+                for number in (signal.SIGTERM, signal.SIGINT):
+                    previous_handlers[number] = signal.signal(number, self.stop)
+            with connection:
+                connection.execute("UPDATE jobs SET status = 'queued', "
+                                   "started = NULL, worker = NULL "
+                                   "WHERE status = 'running'")
+                connection.executemany(
+                    'INSERT OR REPLACE INTO daemon (key, value) VALUES (?, ?)',
+                    [(key, json.dumps(value)) for key, value in
+                     (('cores', self.cores), ('memory', self.memory),
+                      ('workers', self.workers), ('pid', os.getpid()),
+                      ('started', time.time()))])
+            workers = [_Worker(context) for _ in range(self.workers)]
+            while True:
+                self._collect(connection, workers, context)
+                busy = [worker for worker in workers if worker.job is not None]
+                if not self._stopping:
+                    self._schedule(connection, workers)
+                    busy = [worker for worker in workers if worker.job is not None]
+                if not busy and (self._stopping or (
+                        until_idle and not connection.execute(
+                            "SELECT 1 FROM jobs WHERE status = 'queued'").fetchone())):
+                    return
+                multiprocessing.connection.wait(
+                    [worker.connection for worker in busy], self.poll_interval)
+        finally:
+            for number, handler in previous_handlers.items():
+                signal.signal(number, handler)
+            for worker in workers:
+                if worker.job is not None:
+                    worker.process.terminate()
+                else:
+                    worker.stop()
+            with connection:
+                connection.execute("UPDATE jobs SET status = 'queued', "
+                                   "started = NULL, worker = NULL "
+                                   "WHERE status = 'running'")
+                connection.execute("DELETE FROM daemon")
+            connection.close()
+            lock.close()
+
+    def _finish(self, connection, job_id, status, payload):
+        with connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? '
+                'WHERE id = ?',
+                (status, time.time(),
+                 json.dumps(payload) if status == 'done' else None,
+                 payload if status != 'done' else None, job_id))
+
+    def _collect(self, connection, workers, context):
+        """Record the results of the finished jobs, replace dead workers."""
+        for index, worker in enumerate(workers):
+            if worker.job is None:
+                continue
+            if worker.connection.poll():
+                try:
+                    status, payload = worker.connection.recv()
+                except (EOFError, OSError):
+                    worker.process.join(5)
+                    status, payload = 'failed', 'worker process died'
+                self._finish(connection, worker.job, status, payload)
+                worker.job = None
+            if not worker.process.is_alive():
+                if worker.job is not None:
+                    self._finish(connection, worker.job, 'failed',
+                                 'worker process died with exit code {}'.format(
+                                     worker.process.exitcode))
+                workers[index] = _Worker(context)
+
+    def _schedule(self, connection, workers):
+        """Start the queued jobs which fit in the free cores and memory, in
+        submission order, later jobs overtaking those which do not fit
+        unless one of them has waited max_wait."""
+        idle = [worker for worker in workers if worker.job is None]
+        if not idle:
+            return
+        running = connection.execute(
+            "SELECT COALESCE(SUM(cores), 0), COALESCE(SUM(memory), 0) "
+            "FROM jobs WHERE status = 'running'").fetchone()
+        free_cores = self.cores - running[0]
+        free_memory = self.memory - running[1]
+        for row in connection.execute(
+                "SELECT id, spec, cores, memory, submitted FROM jobs "
+                "WHERE status = 'queued' ORDER BY id").fetchall():
+            if row['cores'] > self.cores or row['memory'] > self.memory:
+                self._finish(connection, row['id'], 'failed',
+                             'job needs {} cores and {:.3g} GB, more than the '
+                             'budget of the daemon'.format(
+                                 row['cores'], row['memory'] / 1024.**3))
+                continue
+            if row['cores'] > free_cores or row['memory'] > free_memory:
+                if time.time() - row['submitted'] >= self.max_wait:
+                    # Reserve the resources freed by the running jobs for it.
+                    return
+                continue
+            worker = idle.pop()
+            with connection:
+                cursor = connection.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, worker = ? "
+                    "WHERE id = ? AND status = 'queued'",
+                    (time.time(), worker.process.pid, row['id']))
+            if cursor.rowcount == 0:
+                # Cancelled in the meantime.
+                idle.append(worker)
+                continue
+            worker.job = row['id']
+            worker.connection.send((json.loads(row['spec']), row['cores']))
+            free_cores -= row['cores']
+            free_memory -= row['memory']
+            if not idle:
+                return
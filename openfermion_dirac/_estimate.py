@@ -0,0 +1,438 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Estimate of the size and cost of a Dirac calculation before running it.
+
+The basis functions of each element are counted in the basis set library of
+Dirac (the directories basis and basis_dalton of the installation, found
+next to pam or given by the environment variable DIRAC_BASIS_LIBRARY). The
+library is read once and its index, element -> (primitives, contracted
+functions) per angular momentum, is cached in a JSON file. Elements or
+basis sets missing from the library fall back to the heuristic of
+heuristic_basis_size.
+"""
+
+import json
+import os
+import shutil
+
+from ._memory import available_memory, parse_memory_size
+
+# Names of the basis set directories of a Dirac installation.
+_library_names = ('basis', 'basis_dalton')
+
+# Indices of the libraries already read by this process.
+_indices = {}
+
+# Angular momentum of the subshells in the order they are filled.
+_aufbau_subshells = [0, 0, 1, 0, 1, 0, 2, 1, 0, 2, 1, 0, 3, 2, 1, 0, 3, 2, 1]
+
+# Operations of D2h as the signs they apply to x, y and z.
+_operations = {'C2z': (-1, -1, 1), 'C2y': (-1, 1, -1), 'C2x': (1, -1, -1),
+               'i': (-1, -1, -1), 'sxy': (1, 1, -1), 'sxz': (1, -1, 1),
+               'syz': (-1, 1, 1)}
+
+# Rough time of one operation of the SCF and of the integral transformation
+# in seconds, for the runtime estimate.
+_seconds_per_operation = 2e-9
+_scf_iterations = 15
+
+# Characters of a FCIDUMP row with a real or a complex value.
+_fcidump_row = {False: 32, True: 52}
+
+
+def basis_zeta(basis):
+    """Zeta level of a basis set from its name, 1 for a minimal basis."""
+    basis = basis.lower()
+    zeta = 1
+    for tag, value in (('dz', 2), ('2z', 2), ('6-31', 2), ('tz', 3),
+                       ('3z', 3), ('6-311', 3), ('qz', 4), ('4z', 4),
+                       ('5z', 5)):
+        if tag in basis:
+            zeta = value
+    if 'aug' in basis:
+        zeta *= 1.5
+    return zeta
+
+
+def heuristic_basis_size(proton, basis):
+    """Rough number of contracted functions of an atom, from the basis name.
+
+    The functions of the occupied (aufbau) subshells, multiplied by the zeta
+    level, with polarization functions.
+    """
+    zeta = basis_zeta(basis)
+    electrons = 0
+    functions = 0
+    for l in _aufbau_subshells:
+        if electrons >= proton:
+            break
+        electrons += 2 * (2 * l + 1)
+        functions += 2 * l + 1
+    return zeta * functions * (1.3 if zeta > 1 else 1.)
+
+
+def basis_library_directories():
+    """Directories of the basis set library of Dirac.
+
+    Given by the environment variable DIRAC_BASIS_LIBRARY (separated by
+    os.pathsep), else searched next to pam, in its parent directory and in
+    share/dirac.
+
+    Returns:
+        directories: List of existing directories, empty if not found.
+    """
+    if os.environ.get('DIRAC_BASIS_LIBRARY'):
+        return [directory for directory in
+                os.environ['DIRAC_BASIS_LIBRARY'].split(os.pathsep)
+                if os.path.isdir(directory)]
+    pam = shutil.which('pam')
+    if pam is None:
+        return []
+    bin_directory = os.path.dirname(os.path.realpath(pam))
+    prefix = os.path.dirname(bin_directory)
+    directories = []
+    for root in (bin_directory, prefix, os.path.join(prefix, 'share', 'dirac')):
+        for name in _library_names:
+            directory = os.path.join(root, name)
+            if os.path.isdir(directory) and directory not in directories:
+                directories.append(directory)
+    return directories
+
+
+def parse_basis_file(path):
+    """Shells of each element of a basis set file of Dirac or Dalton.
+
+    An element starts with the line 'a Z', each shell with a line
+    'n_primitives n_contracted 0' (optionally preceded by 'H'), followed by
+    the exponents and contraction coefficients, in order of increasing
+    angular momentum. Lines starting with $, ! or # are comments.
+
+    Args:
+        path: Name of the file.
+
+    Returns:
+        elements: Dictionary atomic number -> list, for each angular
+            momentum, of [n_primitives, n_contracted], n_contracted being
+            n_primitives for uncontracted shells.
+    """
+    elements = {}
+    shells = None
+    remaining = 0
+    with open(path, errors='replace') as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0][0] in '$!#':
+                continue
+            if fields[0] in ('a', 'A') and len(fields) > 1 and fields[1].isdigit():
+                shells = elements.setdefault(int(fields[1]), [])
+                remaining = 0
+                continue
+            if shells is None:
+                continue
+            if remaining > 0:
+                remaining -= len(fields)
+                continue
+            if fields[0] in ('h', 'H'):
+                fields = fields[1:]
+            try:
+                header = [int(field) for field in fields]
+            except ValueError:
+                continue
+            if len(header) < 2 or header[0] <= 0:
+                continue
+            n_primitives, n_contracted = header[0], header[1]
+            shells.append([n_primitives, n_contracted or n_primitives])
+            remaining = n_primitives * (1 + n_contracted)
+    return elements
+
+
+def _cache_file():
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'openfermion_dirac', 'basis_index.json')
+
+
+def basis_library_index(directories=None, refresh=False, cache_file=None):
+    """Index of the basis set library, read once and cached in a JSON file.
+
+    The cache is rebuilt when the directories or their modification times
+    change.
+
+    Args:
+        directories: Optional list of library directories, defaults to
+            basis_library_directories.
+        refresh: Boolean, rebuild the index even if cached.
+        cache_file: Optional name of the JSON cache, by default
+            $XDG_CACHE_HOME/openfermion_dirac/basis_index.json.
+
+    Returns:
+        index: Dictionary lower case basis name -> dictionary atomic number
+            -> shells, as parse_basis_file. Empty without library.
+    """
+    if directories is None:
+        directories = basis_library_directories()
+    if not directories:
+        return {}
+    stamp = {os.path.abspath(directory): os.path.getmtime(directory)
+             for directory in directories}
+    key = tuple(sorted(stamp.items()))
+    if not refresh and key in _indices:
+        return _indices[key]
+    if cache_file is None:
+        cache_file = _cache_file()
+    if not refresh and os.path.exists(cache_file):
+        try:
+            with open(cache_file) as f:
+                cached = json.load(f)
+            if cached.get('directories') == stamp:
+                _indices[key] = {
+                    basis: {int(proton): shells for proton, shells in elements.items()}
+                    for basis, elements in cached['index'].items()}
+                return _indices[key]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    index = {}
+    # The first directory wins for a basis set in several of them.
+    for directory in reversed(directories):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            try:
+                elements = parse_basis_file(path)
+            except (OSError, UnicodeError):
+                continue
+            if elements:
+                index[name.lower()] = elements
+    _indices[key] = index
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temporary = cache_file + '.' + str(os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump({'directories': stamp, 'index': index}, f)
+        os.replace(temporary, cache_file)
+    except OSError:
+        pass
+    return index
+
+
+def _atom_basis(molecule):
+    """Basis set name of each element symbol of the molecule."""
+    if molecule.basis != "special":
+        return {atom: molecule.basis for atom in molecule.atoms}
+    default, special = molecule.special_basis
+    atom_basis = {atom: default for atom in molecule.atoms}
+    fields = special.split()
+    # e.g. "H BASIS cc-pVDZ"
+    if fields:
+        atom_basis[fields[0]] = fields[-1]
+    return atom_basis
+
+
+def count_basis_functions(molecule, relativistic=False, index=None):
+    """Number of basis functions of a molecule, from the basis set library.
+
+    Spherical functions are counted: contracted ones without relativity,
+    the uncontracted large component and its restricted kinetic balance
+    small component with relativity, as Dirac does by default.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class, with
+            special_basis if its basis is "special".
+        relativistic: Boolean, relativistic calculation or not.
+        index: Optional index of basis_library_index, by default that of
+            the Dirac installation.
+
+    Returns:
+        n_large: Integer, number of (large component) basis functions.
+        n_small: Integer, number of small component functions, 0 without
+            relativity.
+        sources: Dictionary element symbol -> 'library', or 'heuristic'
+            when the element or basis set is missing from the library.
+    """
+    if index is None:
+        index = basis_library_index()
+    atom_basis = _atom_basis(molecule)
+    n_large = n_small = 0
+    sources = {}
+    for atom, proton in zip(molecule.atoms, molecule.protons):
+        shells = index.get(atom_basis[atom].lower(), {}).get(proton)
+        if shells is None:
+            sources[atom] = 'heuristic'
+            functions = heuristic_basis_size(proton, atom_basis[atom])
+            if relativistic:
+                # Uncontracted large component and its small component.
+                n_large += 2 * functions
+                n_small += 2 * functions
+            else:
+                n_large += functions
+            continue
+        sources[atom] = 'library'
+        for l, (n_primitives, n_contracted) in enumerate(shells):
+            if not relativistic:
+                n_large += (2 * l + 1) * n_contracted
+                continue
+            n_large += (2 * l + 1) * n_primitives
+            # Derivatives of a function l: functions l + 1 and l - 1.
+            n_small += n_primitives * ((2 * l + 3) + (2 * l - 1 if l else 0))
+    return int(n_large), int(n_small), sources
+
+
+def detect_point_group(geometry, tolerance=1e-3):
+    """Largest subgroup of D2h of the geometry, with the axes as given.
+
+    Dirac only uses the abelian subgroups of D2h. The geometry is centered
+    on its center of nuclear charge but not rotated, so a molecule not
+    aligned on the axes gets a smaller group than Dirac would find.
+
+    Args:
+        geometry: List of tuples (atom symbol, (x, y, z)).
+        tolerance: Real number, distance under which two atoms coincide.
+
+    Returns:
+        name: String, one of D2h, D2, C2v, C2h, C2, Cs, Ci or C1.
+        order: Integer, number of operations of the group.
+    """
+    from ._molecular_data_Dirac import periodic_hash_table
+
+    charges = [periodic_hash_table[atom] for atom, _ in geometry]
+    total = float(sum(charges)) or 1.
+    center = [sum(charge * position[axis] for charge, (_, position)
+                  in zip(charges, geometry)) / total for axis in range(3)]
+    atoms = [(atom, [position[axis] - center[axis] for axis in range(3)])
+             for atom, position in geometry]
+
+    def invariant(signs):
+        for atom, position in atoms:
+            image = [sign * x for sign, x in zip(signs, position)]
+            if not any(other == atom and
+                       all(abs(a - b) <= tolerance for a, b in zip(image, other_position))
+                       for other, other_position in atoms):
+                return False
+        return True
+
+    kept = {name for name, signs in _operations.items() if invariant(signs)}
+    if len(kept) == 7:
+        return 'D2h', 8
+    if len(kept) == 3:
+        if kept == {'C2x', 'C2y', 'C2z'}:
+            return 'D2', 4
+        if 'i' in kept:
+            return 'C2h', 4
+        return 'C2v', 4
+    if len(kept) == 1:
+        name = kept.pop()
+        return ('Ci' if name == 'i' else 'C2' if name.startswith('C2') else 'Cs'), 2
+    return 'C1', 1
+
+
+def estimate_calculation(molecule, relativistic=False, active=False,
+                         symmetry=True, n_active=None, index=None,
+                         memory_budget=None):
+    """Size and cost of a Dirac calculation, before running it.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class, with the
+            basis (and special_basis) and geometry of the calculation.
+        relativistic: Boolean, relativistic calculation or not.
+        active: Optional energy window [lowest, highest, gap] of run_dirac.
+            The active spinors are counted in molecule.spinor when the
+            molecule holds the spinor energies of a previous run.
+        symmetry: Boolean, use of the point group symmetry by Dirac.
+        n_active: Optional integer, number of active spinors, overriding
+            the count from active.
+        index: Optional index of basis_library_index.
+        memory_budget: Optional memory in bytes or string like '8GB'
+            checked against the dense Hamiltonian tensors. Defaults to
+            molecule.memory_budget, else the available memory.
+
+    Returns:
+        estimate: Dictionary with
+            point_group, group_order: Abelian point group used by Dirac.
+            n_basis, n_basis_small: Numbers of large and small component
+                basis functions.
+            basis_source: 'library', 'heuristic', or 'mixed' if only some
+                elements are in the library.
+            n_spinors: Number of (positive energy) spinors, twice the
+                number of orbitals.
+            n_active_spinors: Number of active spinors, the qubits of the
+                Hamiltonian.
+            mdcint_bytes, fcidump_bytes: Rough sizes of the transformed
+                integral file MDCINT and of the FCIDUMP.
+            dense_tensor_bytes: Memory of the one and two body coefficients
+                of get_molecular_hamiltonian.
+            fits_memory: Boolean, dense_tensor_bytes within the memory
+                budget (True if the budget is unknown).
+            runtime_seconds: Order of magnitude of the SCF and integral
+                transformation time on one core.
+    """
+    geometry = molecule.geometry
+    if symmetry and not isinstance(geometry, str):
+        point_group, group_order = detect_point_group(geometry)
+    else:
+        point_group, group_order = 'C1', 1
+
+    n_large, n_small, sources = count_basis_functions(molecule, relativistic, index)
+    source_names = set(sources.values())
+    basis_source = source_names.pop() if len(source_names) == 1 else 'mixed'
+    n_spinors = 2 * n_large
+
+    if n_active is None:
+        n_active = n_spinors
+        if active is not False and molecule.spinor:
+            n_active = sum(1 for energy in molecule.spinor.values()
+                           if active[0] <= energy <= active[1])
+    n_active = int(n_active)
+
+    from ._molecular_data_Dirac import _precisions
+
+    is_complex = bool(relativistic)
+    single_one_body, single_two_body = _precisions.get(
+        getattr(molecule, 'precision', 'double'), (False, False))
+    itemsize = 16 if is_complex else 8
+    one_body_itemsize = itemsize // (2 if single_one_body else 1)
+    two_body_itemsize = itemsize // (2 if single_two_body else 1)
+    n_integrals = n_active ** 4 // (8 * group_order)
+    # MDCINT: the values and the packed indices of the Kramers pairs.
+    mdcint_bytes = n_integrals * ((16 if is_complex else 8) + 4)
+    fcidump_bytes = ((n_integrals + n_active ** 2 + n_active + 1) *
+                     _fcidump_row[is_complex])
+    dense_tensor_bytes = (n_active ** 4 * two_body_itemsize +
+                          n_active ** 2 * one_body_itemsize)
+
+    if memory_budget is None:
+        memory_budget = getattr(molecule, 'memory_budget', None)
+    memory_budget = (parse_memory_size(memory_budget) if memory_budget is not None
+                     else available_memory())
+    fits_memory = memory_budget is None or dense_tensor_bytes <= memory_budget
+
+    n_functions = n_large + n_small
+    # Complex arithmetic costs about four real operations.
+    factor = 4 if is_complex else 1
+    scf_operations = _scf_iterations * factor * n_functions ** 4 / group_order
+    transformation_operations = factor * n_functions ** 4 * n_active / group_order
+    runtime_seconds = (scf_operations + transformation_operations) * _seconds_per_operation
+
+    return {'point_group': point_group,
+            'group_order': group_order,
+            'n_basis': n_large,
+            'n_basis_small': n_small,
+            'basis_source': basis_source,
+            'n_spinors': n_spinors,
+            'n_active_spinors': n_active,
+            'mdcint_bytes': int(mdcint_bytes),
+            'fcidump_bytes': int(fcidump_bytes),
+            'dense_tensor_bytes': int(dense_tensor_bytes),
+            'fits_memory': fits_memory,
+            'runtime_seconds': float(runtime_seconds)}
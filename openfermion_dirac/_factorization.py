@@ -0,0 +1,214 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Low rank factorization of the two body coefficients.
+
+The two body coefficients of get_molecular_hamiltonian are
+two_body_coefficients[p, q, r, s] = (ps|qr) / 2, in chemist's notation. The
+matrix M[(p, s), (r, q)] = (ps|qr) is Hermitian positive semidefinite, also
+for complex relativistic integrals, and its pivoted Cholesky decomposition
+gives vectors L such that
+
+    (ps|qr) = sum_l L[l, p, s] * conj(L[l, r, q]),
+
+with a number of vectors of order n_qubits instead of n_qubits**2, so
+O(n_qubits**3) memory instead of O(n_qubits**4). Each column of M is a slice
+two_body_coefficients[:, q, r, :], which is read directly from an h5py
+dataset or a memory-mapped array without loading the whole tensor.
+"""
+
+from ._lazy import LazyModule
+
+numpy = LazyModule('numpy')
+
+
+def _diagonal(two_body_coefficients):
+    """Diagonal of M, (ps|ps) = 2 * two_body_coefficients[p, s, p, s],
+    read one n_qubits x n_qubits slice at a time."""
+    n_qubits = two_body_coefficients.shape[0]
+    diagonal = numpy.empty((n_qubits, n_qubits))
+    for p in range(n_qubits):
+        block = numpy.asarray(two_body_coefficients[p, :, p, :])
+        diagonal[p] = 2. * numpy.real(numpy.diagonal(block))
+    return diagonal.ravel()
+
+
+def cholesky_decomposition(two_body_coefficients, threshold=1e-8,
+                           max_vectors=None):
+    """Pivoted Cholesky decomposition of the two body coefficients.
+
+    Args:
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits,
+            n_qubits) from get_molecular_hamiltonian, a numpy array, a
+            memory-mapped array or an h5py dataset (e.g.
+            'two_body_coefficients' of the HDF5 file of a molecule).
+        threshold: Real number, the decomposition stops when the largest
+            remaining diagonal element of M is below threshold, which
+            bounds the error of every (ps|qr).
+        max_vectors: Optional integer, maximum number of vectors.
+
+    Returns:
+        cholesky_vectors: Array (n_vectors, n_qubits, n_qubits), real or
+            complex as two_body_coefficients.
+    """
+    n_qubits = two_body_coefficients.shape[0]
+    dtype = numpy.result_type(two_body_coefficients.dtype, numpy.float64)
+    if max_vectors is None:
+        max_vectors = n_qubits ** 2
+    diagonal = _diagonal(two_body_coefficients)
+    # Vectors as rows (p, s), grown by blocks of n_qubits rows.
+    vectors = numpy.empty((min(n_qubits, max_vectors), n_qubits ** 2), dtype)
+    n_vectors = 0
+    while n_vectors < max_vectors:
+        pivot = int(numpy.argmax(diagonal))
+        if diagonal[pivot] <= threshold:
+            break
+        r, q = divmod(pivot, n_qubits)
+        column = 2. * numpy.asarray(two_body_coefficients[:, q, r, :],
+                                    dtype=dtype).ravel()
+        column -= vectors[:n_vectors].T @ numpy.conj(vectors[:n_vectors, pivot])
+        column /= numpy.sqrt(diagonal[pivot])
+        if n_vectors == vectors.shape[0]:
+            vectors = numpy.concatenate(
+                [vectors, numpy.empty((min(n_qubits, max_vectors - n_vectors),
+                                       n_qubits ** 2), dtype)])
+        vectors[n_vectors] = column
+        n_vectors += 1
+        diagonal -= numpy.absolute(column) ** 2
+        # The pivot is exact, rounding could leave a small value.
+        diagonal[pivot] = 0.
+    return vectors[:n_vectors].reshape(n_vectors, n_qubits, n_qubits)
+
+
+def two_body_from_cholesky(cholesky_vectors):
+    """Dense two body coefficients of the factorization, to check it.
+
+    Args:
+        cholesky_vectors: Array (n_vectors, n_qubits, n_qubits).
+
+    Returns:
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits, n_qubits)
+            in the convention of get_molecular_hamiltonian.
+    """
+    return numpy.einsum('lps,lrq->pqrs', cholesky_vectors,
+                        numpy.conj(cholesky_vectors)) / 2.
+
+
+def double_factorization(cholesky_vectors, threshold=1e-8):
+    """Eigen-decomposition of each Cholesky vector.
+
+    Each vector is split in Hermitian parts, L = A + iB, (only A for real
+    symmetric or Hermitian vectors) whose eigenvalues smaller than
+    threshold in absolute value are dropped:
+    L[l] = sum of phase * U @ diag(eigenvalues) @ U^dagger over its parts.
+
+    Args:
+        cholesky_vectors: Array (n_vectors, n_qubits, n_qubits).
+        threshold: Real number, eigenvalues kept are above it in absolute
+            value.
+
+    Returns:
+        factors: List, for each vector, of the list of its parts
+            (phase, eigenvalues, eigenvectors), phase being 1 or 1j.
+    """
+    factors = []
+    for vector in cholesky_vectors:
+        parts = []
+        for phase, hermitian in (
+                (1, (vector + numpy.conj(vector.T)) / 2.),
+                (1j, (vector - numpy.conj(vector.T)) / 2j)):
+            if not numpy.any(numpy.absolute(hermitian) > threshold):
+                continue
+            eigenvalues, eigenvectors = numpy.linalg.eigh(hermitian)
+            kept = numpy.absolute(eigenvalues) > threshold
+            parts.append((phase, eigenvalues[kept], eigenvectors[:, kept]))
+        factors.append(parts)
+    return factors
+
+
+def cholesky_from_double_factorization(factors, n_qubits):
+    """Cholesky vectors of a double factorization, to check it.
+
+    Args:
+        factors: List from double_factorization.
+        n_qubits: Integer.
+
+    Returns:
+        cholesky_vectors: Array (n_vectors, n_qubits, n_qubits), complex.
+    """
+    cholesky_vectors = numpy.zeros((len(factors), n_qubits, n_qubits), complex)
+    for vector, parts in zip(cholesky_vectors, factors):
+        for phase, eigenvalues, eigenvectors in parts:
+            vector += phase * (eigenvectors * eigenvalues) @ numpy.conj(eigenvectors.T)
+    return cholesky_vectors
+
+
+def hartree_fock_density(n_qubits, occupied):
+    """One body density matrix D[p, q] = <a^dagger_p a_q> of a determinant.
+
+    Args:
+        n_qubits: Integer.
+        occupied: List of the occupied spinors (qubits).
+
+    Returns:
+        density: Array (n_qubits, n_qubits).
+    """
+    density = numpy.zeros((n_qubits, n_qubits))
+    density[list(occupied), list(occupied)] = 1.
+    return density
+
+
+def coulomb_exchange(cholesky_vectors, density):
+    """Coulomb and exchange matrices of a density, from the factors.
+
+    J[p, s] = sum_qr (ps|qr) D[q, r] and K[p, r] = sum_qs (ps|qr) D[q, s],
+    in O(n_vectors * n_qubits**3) operations.
+
+    Args:
+        cholesky_vectors: Array (n_vectors, n_qubits, n_qubits).
+        density: Hermitian array (n_qubits, n_qubits), D[p, q] =
+            <a^dagger_p a_q>.
+
+    Returns:
+        coulomb: Array (n_qubits, n_qubits).
+        exchange: Array (n_qubits, n_qubits).
+    """
+    c = numpy.einsum('lps,ps->l', cholesky_vectors, density)
+    coulomb = numpy.einsum('l,lps->ps', numpy.conj(c), cholesky_vectors)
+    exchange = numpy.zeros(density.shape, numpy.result_type(cholesky_vectors, density))
+    density_transpose = density.T
+    for vector in cholesky_vectors:
+        exchange += vector @ density_transpose @ numpy.conj(vector.T)
+    return coulomb, exchange
+
+
+def energy_from_cholesky(constant, one_body_coefficients, cholesky_vectors,
+                         density):
+    """Energy of a determinant, from the Cholesky vectors.
+
+    E = constant + sum_pq h[p, q] D[p, q] + 1/2 sum (D (J - K)), which is
+    the expectation value of the Hamiltonian of get_molecular_hamiltonian
+    for a determinant of density D.
+
+    Args:
+        constant: The core energy.
+        one_body_coefficients: Array (n_qubits, n_qubits).
+        cholesky_vectors: Array (n_vectors, n_qubits, n_qubits).
+        density: Array (n_qubits, n_qubits), e.g. from hartree_fock_density.
+
+    Returns:
+        energy: Real number.
+    """
+    coulomb, exchange = coulomb_exchange(cholesky_vectors, density)
+    energy = (constant + numpy.sum(one_body_coefficients * density) +
+              numpy.sum(density * (coulomb - exchange)) / 2.)
+    return float(numpy.real(energy))
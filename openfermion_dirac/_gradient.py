@@ -0,0 +1,363 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Energy gradients by central finite differences and geometry optimization.
+
+The 6 * n_atoms displaced geometries of a gradient are independent Dirac
+calculations, run concurrently by run_dirac_jobs in their own scratch
+directories, each starting its SCF from the orbitals of the reference
+geometry unless its point group is lower (with symmetry, Dirac cannot read
+orbitals of another point group). The energies are parsed from the Dirac outputs and kept in a cache
+keyed by the geometry, so that no geometry is computed twice.
+
+Positions are in angstrom, so the gradients are in hartree per angstrom
+(multiply by 0.52917721 for hartree per bohr).
+"""
+
+import os
+import warnings
+
+from ._batch import run_dirac_jobs
+from ._catalog import geometry_hash
+from ._estimate import detect_point_group
+from ._lazy import LazyModule
+from ._molecular_data_Dirac import MolecularData_Dirac
+
+numpy = LazyModule('numpy')
+
+# Energy of each method, as an attribute of MolecularData_Dirac.
+_energy_attributes = {'hf': 'hf_energy', 'mp2': 'mp2_energy', 'ccsd': 'ccsd_energy'}
+
+# Initial guess of the force constants of the optimizer, in hartree per
+# square angstrom (a typical bond stretching force constant).
+_hessian_guess = 1.
+# Sufficient decrease of the energy along a step (Armijo condition), and
+# number of times a step is halved before the optimizer gives up.
+_armijo = 1e-4
+_max_backtracks = 6
+# Distance in angstrom under which atoms coincide when the point group of a
+# geometry is compared with that of its start guess, well below the steps.
+_symmetry_tolerance = 1e-6
+
+
+class GradientError(Exception):
+    pass
+
+
+def _options(method, kwargs):
+    """run_dirac arguments of the calculations of a gradient."""
+    if method not in _energy_attributes:
+        raise ValueError("method should be 'hf', 'mp2' or 'ccsd'")
+    options = dict(kwargs)
+    for reserved in ('start_guess', 'save', 'delete_DFCOEF', 'delete_output'):
+        if reserved in options:
+            raise ValueError('{} is chosen by the gradient driver'.format(reserved))
+    # The MP2 and CCSD energies are printed by RELCCSD.
+    options.setdefault('run_ccsd', method != 'hf')
+    for option in ('delete_input', 'delete_xyz', 'delete_MRCONEE',
+                   'delete_MDCINT', 'delete_FCIDUMP'):
+        options.setdefault(option, True)
+    options['delete_DFCOEF'] = True
+    return options
+
+
+def _cache_key(molecule, options):
+    """Key of the energies of a molecule in the cache."""
+    return '|'.join([geometry_hash(molecule.geometry, decimals=8),
+                     str(molecule.basis), str(molecule.special_basis),
+                     str(molecule.charge), str(molecule.multiplicity),
+                     str(bool(options.get('relativistic', False))),
+                     str(options.get('speed_of_light', False)),
+                     str(options.get('active', False))])
+
+
+def molecule_at(molecule, positions, description):
+    """Copy of a molecule at other positions, saved in the same directory.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class.
+        positions: Array (n_atoms, 3) of the positions in angstrom.
+        description: String, description (and so name) of the copy.
+
+    Returns:
+        molecule: A new MolecularData_Dirac.
+    """
+    positions = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+    geometry = [(atom, tuple(float(x) for x in position))
+                for (atom, _), position in zip(molecule.geometry, positions)]
+    return MolecularData_Dirac(
+        geometry=geometry, basis=molecule.basis,
+        special_basis=molecule.special_basis,
+        multiplicity=molecule.multiplicity, charge=molecule.charge,
+        description=description,
+        data_directory=os.path.dirname(os.path.abspath(molecule.filename)),
+        relativistic=molecule.relativistic, symmetry=molecule.symmetry,
+        speed_of_light=molecule.speed_of_light)
+
+
+def displaced_molecules(molecule, step=1e-3):
+    """The 6 * n_atoms geometries of the central differences.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class.
+        step: Displacement of each coordinate, in angstrom.
+
+    Returns:
+        displaced: List of (atom index, axis, sign, molecule), sign being
+            +1 or -1.
+    """
+    positions = numpy.array([position for _, position in molecule.geometry],
+                            dtype=float)
+    displaced = []
+    for atom in range(len(positions)):
+        for axis in range(3):
+            for sign, tag in ((1, 'p'), (-1, 'm')):
+                shifted = positions.copy()
+                shifted[atom, axis] += sign * step
+                description = '{}_fd{}{}{}'.format(
+                    molecule.description, atom, 'xyz'[axis], tag).lstrip('_')
+                displaced.append((atom, axis, sign,
+                                  molecule_at(molecule, shifted, description)))
+    return displaced
+
+
+def _read_energies(molecule, keep_output):
+    """Energies parsed from the output of a finished calculation."""
+    molecule.get_energies()
+    energies = {method: (float(getattr(molecule, attribute))
+                         if getattr(molecule, attribute) is not None else None)
+                for method, attribute in _energy_attributes.items()}
+    if not keep_output:
+        os.remove(molecule.filename + '.out')
+    return energies
+
+
+def _start_guess(molecule, start_guess, guess_geometry, options):
+    """start_guess, or None (cold start) if the molecule has a point group
+    other than guess_geometry, the geometry of the start guess orbitals."""
+    if start_guess is None or not options.get('symmetry', True):
+        return start_guess
+    if (detect_point_group(molecule.geometry, _symmetry_tolerance)[0] !=
+            detect_point_group(guess_geometry, _symmetry_tolerance)[0]):
+        return None
+    return start_guess
+
+
+def _evaluate(molecules, method, cache, max_workers, start_guess, options,
+              keep_guess=False, keep_output=False, guess_geometry=None):
+    """Energies of molecules, running Dirac on those missing from the cache.
+
+    With keep_guess, every molecule is run (cached or not) and keeps its
+    DFCOEF file, to be the start guess of later calculations. guess_geometry
+    is the geometry of start_guess when it is a file name.
+    """
+    keys = [_cache_key(molecule, options) for molecule in molecules]
+    missing = [index for index, key in enumerate(keys)
+               if keep_guess or cache.get(key, {}).get(method) is None]
+    if missing:
+        if start_guess is not None and not isinstance(start_guess, str):
+            guess_geometry = start_guess.geometry
+        failed = []
+        list(run_dirac_jobs(
+            ((molecules[index],
+              dict({'start_guess': _start_guess(molecules[index], start_guess,
+                                                guess_geometry, options)},
+                   **({'delete_DFCOEF': False} if keep_guess else {})))
+             for index in missing),
+            max_workers, failed, **options))
+        if failed:
+            raise GradientError('{} of {} Dirac calculations failed, e.g. {}: {}'.format(
+                len(failed), len(missing), failed[0][0].name, failed[0][1]))
+        for index in missing:
+            cache[keys[index]] = _read_energies(molecules[index], keep_output)
+    energies = []
+    for molecule, key in zip(molecules, keys):
+        energy = cache[key].get(method)
+        if energy is None:
+            raise GradientError('no {} energy in the output of {}, the MP2 and '
+                                'CCSD energies need run_ccsd=True'.format(
+                                    method, molecule.name))
+        energies.append(energy)
+    return energies
+
+
+def _remove_guess(molecule):
+    if molecule.dfcoef_file is not None and os.path.exists(molecule.dfcoef_file):
+        os.remove(molecule.dfcoef_file)
+    molecule.dfcoef_file = None
+
+
+def finite_difference_gradient(molecule, method='hf', step=1e-3, max_workers=4,
+                               cache=None, start_guess=None, **kwargs):
+    """Gradient of the energy by central differences.
+
+    The reference geometry is computed first, unless start_guess is given,
+    and its orbitals are the start guess of the displaced geometries, which
+    run concurrently. With symmetry, a displaced geometry whose point group
+    is lower than the reference one starts from the default guess instead.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class, the
+            reference geometry.
+        method: 'hf', 'mp2' or 'ccsd', the energy differentiated.
+        step: Displacement of each coordinate, in angstrom.
+        max_workers: Number of Dirac calculations running at the same time.
+        cache: Optional dictionary of the energies already computed, updated
+            with the new ones. Pass the same dictionary to later calls.
+        start_guess: Optional MolecularData_Dirac run with
+            delete_DFCOEF=False, or DFCOEF file name, start guess of the
+            displaced geometries instead of the reference one. A file
+            name is taken to hold orbitals of the reference geometry.
+        kwargs: Other arguments of run_dirac, e.g. relativistic=True or
+            scratch_root. Use jobs_per_node=max_workers with
+            auto_resources=True to share the node.
+
+    Returns:
+        energy: Energy of the reference geometry.
+        gradient: Array (n_atoms, 3), in hartree per angstrom.
+
+    Raises:
+        GradientError: If a calculation failed or its output lacks the
+            energy.
+    """
+    if cache is None:
+        cache = {}
+    options = _options(method, kwargs)
+    own_guess = start_guess is None
+    try:
+        if own_guess:
+            energy, = _evaluate([molecule], method, cache, 1, None, options,
+                                keep_guess=True)
+            start_guess = molecule
+        else:
+            energy, = _evaluate([molecule], method, cache, 1, start_guess, options,
+                                guess_geometry=molecule.geometry)
+        displaced = displaced_molecules(molecule, step)
+        energies = _evaluate([item[3] for item in displaced], method, cache,
+                             max_workers, start_guess, options,
+                             guess_geometry=molecule.geometry)
+    finally:
+        if own_guess:
+            _remove_guess(molecule)
+    gradient = numpy.zeros((len(molecule.geometry), 3))
+    for (atom, axis, sign, _), displaced_energy in zip(displaced, energies):
+        gradient[atom, axis] += sign * displaced_energy / (2. * step)
+    return energy, gradient
+
+
+def optimize_geometry(molecule, method='hf', step=1e-3, max_iterations=50,
+                      gradient_tolerance=1e-4, max_displacement=0.1,
+                      max_workers=4, cache=None, **kwargs):
+    """Minimize the energy with respect to the positions of the atoms.
+
+    Quasi-Newton (BFGS) steps, limited to max_displacement per atom and
+    halved until the energy decreases enough, with the finite difference
+    gradients of finite_difference_gradient. Every SCF starts from the
+    orbitals of the previous geometry.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class, the starting
+            geometry.
+        method: 'hf', 'mp2' or 'ccsd', the energy minimized.
+        step: Displacement of the finite differences, in angstrom.
+        max_iterations: Maximum number of steps.
+        gradient_tolerance: Convergence threshold of the largest component
+            of the gradient, in hartree per angstrom.
+        max_displacement: Largest displacement of an atom in a step, in
+            angstrom.
+        max_workers: Number of Dirac calculations running at the same time.
+        cache: Optional dictionary of the energies already computed, see
+            finite_difference_gradient. It may be saved (e.g. as JSON) to
+            restart an interrupted optimization without running the
+            geometries again.
+        kwargs: Other arguments of run_dirac.
+
+    Returns:
+        molecule: A MolecularData_Dirac at the optimized geometry, its
+            description is that of the input followed by _opt<n>.
+        energy: Energy at the optimized geometry.
+        gradient: Array (n_atoms, 3), gradient at the optimized geometry.
+        history: List of (energy, largest gradient component) per geometry
+            accepted, the first being the starting one.
+
+    Raises:
+        GradientError: If a calculation failed or its output lacks the
+            energy.
+    """
+    if cache is None:
+        cache = {}
+    options = _options(method, kwargs)
+    n_evaluations = [0]
+
+    def run(positions, guess):
+        n_evaluations[0] += 1
+        trial = molecule_at(molecule, positions, '{}_opt{}'.format(
+            molecule.description, n_evaluations[0]).lstrip('_'))
+        try:
+            energy, = _evaluate([trial], method, cache, 1, guess, options,
+                                keep_guess=True)
+        except BaseException:
+            _remove_guess(trial)
+            raise
+        return trial, energy
+
+    positions = numpy.array([position for _, position in molecule.geometry],
+                            dtype=float)
+    current, energy = run(positions, None)
+    try:
+        _, gradient = finite_difference_gradient(
+            current, method, step, max_workers, cache, start_guess=current, **kwargs)
+        history = [(energy, float(numpy.max(numpy.absolute(gradient))))]
+        inverse_hessian = numpy.eye(positions.size) / _hessian_guess
+        for _ in range(max_iterations):
+            if numpy.max(numpy.absolute(gradient)) <= gradient_tolerance:
+                break
+            direction = -inverse_hessian @ gradient.ravel()
+            if direction @ gradient.ravel() >= 0:
+                # Not a descent direction: restart from steepest descent.
+                inverse_hessian = numpy.eye(positions.size) / _hessian_guess
+                direction = -gradient.ravel() / _hessian_guess
+            largest = numpy.max(numpy.linalg.norm(direction.reshape(-1, 3), axis=1))
+            displacement = direction * min(1., max_displacement / largest)
+            for _ in range(_max_backtracks):
+                trial, trial_energy = run(positions + displacement.reshape(-1, 3),
+                                          current)
+                if trial_energy <= energy + _armijo * (displacement @ gradient.ravel()):
+                    break
+                _remove_guess(trial)
+                displacement /= 2.
+            else:
+                warnings.warn('Geometry optimization stopped: no step lowers '
+                              'the energy, the gradient may be too inaccurate '
+                              '(change step).', Warning)
+                break
+            _, trial_gradient = finite_difference_gradient(
+                trial, method, step, max_workers, cache, start_guess=trial, **kwargs)
+            change = (trial_gradient - gradient).ravel()
+            curvature = displacement @ change
+            if curvature > 1e-10:
+                # BFGS update of the inverse Hessian.
+                rho = 1. / curvature
+                left = numpy.eye(positions.size) - rho * numpy.outer(displacement, change)
+                inverse_hessian = (left @ inverse_hessian @ left.T +
+                                   rho * numpy.outer(displacement, displacement))
+            _remove_guess(current)
+            current, energy, gradient = trial, trial_energy, trial_gradient
+            positions = positions + displacement.reshape(-1, 3)
+            history.append((energy, float(numpy.max(numpy.absolute(gradient)))))
+        else:
+            if numpy.max(numpy.absolute(gradient)) > gradient_tolerance:
+                warnings.warn('Geometry optimization not converged in {} '
+                              'iterations.'.format(max_iterations), Warning)
+    finally:
+        _remove_guess(current)
+    return current, energy, gradient, history
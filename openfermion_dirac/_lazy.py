@@ -0,0 +1,41 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Deferred import of the heavy dependencies (openfermion, h5py, numpy),
+so that importing openfermion_dirac stays fast."""
+
+import importlib
+
+
+class LazyModule(object):
+    """Stand-in for a module, imported when one of its attributes is
+    first used.
+
+    Example:
+        numpy = LazyModule('numpy')
+        numpy.zeros(3)  # numpy is imported here
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        # Only called for the attributes of the module, the import itself
+        # is thread safe.
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self._module = module
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self._name)
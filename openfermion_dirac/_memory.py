@@ -0,0 +1,173 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Memory usage of the stages of a molecule (parse, build, transform, save)
+and memory budget of the dense arrays.
+
+The peak resident memory of a stage is read from /proc/self/status
+(VmHWM), reset at the start of the stage through /proc/self/clear_refs
+when Linux allows it. The peak of the Python and numpy allocations is also
+given when tracemalloc is tracing (python -X tracemalloc or
+tracemalloc.start()).
+"""
+
+import contextlib
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+
+from ._lazy import LazyModule
+
+numpy = LazyModule('numpy')
+
+
+class MemoryBudgetError(Exception):
+    pass
+
+
+# Multipliers of the units of memory sizes.
+_units = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024**2, 'MB': 1024**2,
+          'G': 1024**3, 'GB': 1024**3, 'T': 1024**4, 'TB': 1024**4}
+
+
+def _proc_status(field):
+    """Value in bytes of a field of /proc/self/status, or None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Reset VmHWM to the current resident memory, if allowed."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def available_memory():
+    """Memory available for new allocations in bytes (MemAvailable of
+    /proc/meminfo, else the free physical memory), or None if unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def parse_memory_size(size):
+    """Number of bytes of a size given as an integer or a string like '8GB'.
+
+    Raises:
+        ValueError: If size cannot be read.
+    """
+    if isinstance(size, str):
+        match = re.match(r'^\s*([0-9.]+)\s*([A-Za-z]*)\s*$', size)
+        if match is None or match.group(2).upper() not in _units:
+            raise ValueError('memory size {!r} should be a number of bytes or '
+                             'a string like "512MB" or "8GB"'.format(size))
+        return int(float(match.group(1)) * _units[match.group(2).upper()])
+    return int(size)
+
+
+def allocate_array(shape, dtype, budget=None, fallback='raise', directory=None,
+                   name='array'):
+    """Zero array, checked against a memory budget before its allocation.
+
+    Args:
+        shape: Tuple, shape of the array.
+        dtype: Type of the elements.
+        budget: Optional memory budget in bytes, or string like '8GB'.
+            Defaults to the available memory of the machine.
+        fallback: 'raise' to raise MemoryBudgetError when the array is
+            larger than budget, or 'memmap' to return a zero array mapped
+            on a temporary file instead.
+        directory: Optional directory of the temporary file of 'memmap',
+            the default temporary directory otherwise.
+        name: String naming the array in the error message.
+
+    Returns:
+        array: numpy array, or numpy.memmap.
+
+    Raises:
+        MemoryBudgetError: If the array does not fit and fallback is 'raise'.
+        ValueError: If fallback is unknown.
+    """
+    if fallback not in ('raise', 'memmap'):
+        raise ValueError("memory_fallback should be 'raise' or 'memmap'")
+    dtype = numpy.dtype(dtype)
+    size = int(numpy.prod(shape, dtype=numpy.int64)) * dtype.itemsize
+    budget = parse_memory_size(budget) if budget is not None else available_memory()
+    if budget is None or size <= budget:
+        return numpy.zeros(shape, dtype)
+    if fallback == 'raise':
+        raise MemoryBudgetError(
+            '{} {} of {} needs {:.3g} GB, more than the memory budget of {:.3g} GB. '
+            'Reduce the active space, use precision=\'single\', increase '
+            'memory_budget or set memory_fallback=\'memmap\'.'.format(
+                name, tuple(shape), dtype.name, size / 1024.**3, budget / 1024.**3))
+    with tempfile.TemporaryFile(dir=directory) as f:
+        # The file is deleted when closed, its space is freed with the map.
+        return numpy.memmap(f, dtype=dtype, mode='w+', shape=tuple(shape))
+
+
+@contextlib.contextmanager
+def track_memory(molecule, stage):
+    """Record the memory used by the code run in the context.
+
+    molecule.memory_usage[stage] is set to a dictionary with:
+        seconds: Duration of the stage.
+        peak_rss: Peak resident memory of the process in bytes during the
+            stage, or since the start of the process if the peak cannot be
+            reset (None if unknown).
+        rss_increase: Resident memory at the end minus at the start.
+        peak_traced: Peak of the memory traced by tracemalloc during the
+            stage, None if tracemalloc is not tracing.
+
+    Args:
+        molecule: Object with a memory_usage dictionary.
+        stage: String, e.g. 'parse', 'build', 'transform' or 'save'.
+    """
+    start_rss = _proc_status('VmRSS')
+    _reset_peak_rss()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        start_traced = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.time()
+    try:
+        yield
+    finally:
+        end_rss = _proc_status('VmRSS')
+        usage = {'seconds': time.time() - start,
+                 'peak_rss': _proc_status('VmHWM'),
+                 'rss_increase': (end_rss - start_rss
+                                  if start_rss is not None and end_rss is not None
+                                  else None),
+                 'peak_traced': (tracemalloc.get_traced_memory()[1] - start_traced
+                                 if tracing else None)}
+        molecule.memory_usage[stage] = usage
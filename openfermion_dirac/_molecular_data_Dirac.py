@@ -16,15 +16,27 @@
 #
 """Class and functions to store quantum chemistry data from a Dirac calculation. This program is inspired from _molecule_data.py of OpenFermion."""
 
-import h5py
-import numpy
+import collections
 import os
 import re
 import uuid
+import warnings
 
-from openfermion.config import *
-from openfermion.ops import InteractionOperator, InteractionRDM
-from openfermion.utils import count_qubits
+from ._active_space import select_active_space
+from ._catalog import update_catalog
+from ._factorization import cholesky_decomposition
+from ._lazy import LazyModule
+from ._memory import allocate_array, track_memory
+from ._reference_energies import hartree_fock_energy, mp2_energy
+from ._stream import iter_fcidump_blocks
+from ._spinor_order import jordan_wigner_weight, order_spinors
+from ._tapering import spinor_irreps, taper_hamiltonian
+
+# Imported when first used, see _lazy.py.
+h5py = LazyModule('h5py')
+numpy = LazyModule('numpy')
+openfermion_config = LazyModule('openfermion.config')
+openfermion_ops = LazyModule('openfermion.ops')
 
 
 """NOTE ON PQRS CONVENTION:
@@ -201,6 +213,215 @@ def geometry_from_file(file_name):
                 geometry += [(atom, coordinates)]
     return geometry
 
+def iter_xyz_frames(file_name):
+    """Read the frames of a multi-frame XYZ file one at a time.
+
+    Each frame is a line with the number of atoms, a comment line and one
+    line per atom, e.g.:
+        2
+        R = 0.7414
+        H 0. 0. 0.
+        H 0. 0. 0.7414
+    Only the current frame is held in memory, so that long trajectories can
+    be processed lazily.
+
+    Args:
+        file_name: a string giving the location of the XYZ file.
+
+    Yields:
+        (comment, geometry): The comment line of the frame, and a list of
+            tuples giving the coordinates of each atom, e.g.
+            [('H', (0, 0, 0)), ('H', (0, 0, 0.7414))]. Atoms given by their
+            atomic number are converted to atomic symbols.
+
+    Raises:
+        ValueError: If a frame is truncated or malformed.
+    """
+    with open(file_name, 'r') as stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            n_atoms = int(line)
+            comment = next(stream, '').strip()
+            geometry = []
+            for _ in range(n_atoms):
+                data = next(stream, '').split()
+                if len(data) < 4:
+                    raise ValueError('truncated or malformed frame in {}'.format(file_name))
+                atom = data[0]
+                if atom.isdigit():
+                    atom = periodic_table[int(atom)]
+                geometry.append((atom, (float(data[1]), float(data[2]), float(data[3]))))
+            yield comment, geometry
+
+
+def molecules_from_xyz(file_name, basis, multiplicity, description="",
+                       frames=None, **kwargs):
+    """Create a MolecularData_Dirac for each frame of a multi-frame XYZ file.
+
+    The molecules are created lazily, when iterated, and can be given
+    directly to run_dirac_jobs.
+
+    Args:
+        file_name: a string giving the location of the XYZ file, see
+            iter_xyz_frames.
+        basis: A string giving the basis set.
+        multiplicity: An integer giving the spin multiplicity.
+        description: Optional string, prefix of the description of every
+            frame. The description of frame i is description + 'frame' + i
+            (e.g. 'md_frame12'), so that each frame has its own file name.
+        frames: Optional iterable of increasing frame indices to keep (e.g.
+            range(0, 10000, 10)), all frames by default.
+        kwargs: Other arguments of MolecularData_Dirac (charge,
+            data_directory, relativistic, ...).
+
+    Yields:
+        molecule: A MolecularData_Dirac per frame.
+    """
+    prefix = description + '_' if description else ''
+    wanted = iter(frames) if frames is not None else None
+    next_frame = next(wanted, None) if wanted is not None else 0
+    for index, (comment, geometry) in enumerate(iter_xyz_frames(file_name)):
+        if wanted is not None:
+            if next_frame is None:
+                return
+            if index != next_frame:
+                continue
+            next_frame = next(wanted, None)
+        yield MolecularData_Dirac(geometry=geometry, basis=basis,
+                                  multiplicity=multiplicity,
+                                  description='{}frame{}'.format(prefix, index),
+                                  **kwargs)
+
+
+def _write_dataset(f, dataset, data):
+    """Overwrite a dataset in place, or recreate it if its layout changed."""
+    if dataset in f:
+        array = numpy.asarray(data)
+        if (f[dataset].shape == array.shape and
+                f[dataset].dtype == array.dtype):
+            f[dataset][...] = array
+            return
+        del f[dataset]
+    f.create_dataset(dataset, data=data)
+
+
+def _identity(value):
+    return value
+
+
+def _string(value):
+    return numpy.string_(value)
+
+
+# Fields saved in the HDF5 file, as attribute: (dataset, conversion).
+# The geometry is stored in the two datasets of the group "geometry".
+_hdf5_fields = collections.OrderedDict([
+    ('geometry', ('geometry', None)),
+    ('basis', ('basis', _string)),
+    ('multiplicity', ('multiplicity', _identity)),
+    ('charge', ('charge', _identity)),
+    ('description', ('description', _string)),
+    ('name', ('name', _string)),
+    ('relativistic', ('relativistic', bool)),
+    ('symmetry', ('symmetry', bool)),
+    ('speed_of_light', ('speed_of_light', _identity)),
+    ('n_atoms', ('n_atoms', _identity)),
+    ('atoms', ('atoms', _string)),
+    ('protons', ('protons', _identity)),
+    ('n_electrons', ('n_electrons', _identity)),
+    ('n_orbitals', ('n_orbitals', _identity)),
+    ('n_qubits', ('n_qubits', _identity)),
+    ('E_core', ('nuclear_repulsion', _identity)),
+    ('hf_energy', ('hf_energy', _identity)),
+    ('spinor', ('orbital_energies', str)),
+    ('one_body_int', ('one_body_integrals', str)),
+    ('two_body_int', ('two_body_integrals', str)),
+    ('one_body_coeff', ('one_body_coefficients', _identity)),
+    ('two_body_coeff', ('two_body_coefficients', _identity)),
+    ('molecular_hamiltonian', ('print_molecular_hamiltonian', str)),
+    ('mp2_energy', ('mp2_energy', _identity)),
+    ('ccsd_energy', ('ccsd_energy', _identity)),
+    ('rounding_error', ('rounding_error', _identity)),
+    ('spinor_order', ('spinor_order', _identity)),
+    ('cholesky_vectors', ('cholesky_vectors', _identity))])
+
+# Precision of the coefficients: single precision for (one body, two body).
+_precisions = {'double': (False, False),
+               'single': (True, True),
+               'mixed': (False, True)}
+
+
+def _coefficient_dtype(dtype, single):
+    """Type of the coefficients, dtype (real or complex) in single precision
+    if single."""
+    if not single:
+        return dtype
+    return numpy.dtype(numpy.complex64 if dtype.kind == 'c' else numpy.float32)
+
+
+def _rounding_error(value, dtype):
+    """Largest absolute difference between value and value cast to dtype."""
+    value = numpy.asarray(value)
+    if not value.size or numpy.dtype(dtype).itemsize >= value.dtype.itemsize:
+        return 0.
+    return float(numpy.max(numpy.absolute(value - value.astype(dtype))))
+
+
+def _integral_arrays(integrals, n_indices):
+    """Index and value arrays of a dictionary of integrals read from the
+    FCIDUMP, as written in the .npy files."""
+    index = numpy.array(list(integrals.keys()), dtype=int).reshape(-1, n_indices)
+    value = numpy.array(list(integrals.values()))
+    return index, value
+
+
+def _sorted_integrals(index, value):
+    """Python indices (starting at 0) and values of the integrals, in
+    lexicographic order of the indices. Stable sort: of integrals with the
+    same indices, the last one read wins, as in a dictionary."""
+    index = numpy.asarray(index)
+    order = numpy.lexsort(index.T[::-1]) if len(index) else numpy.arange(0)
+    return index[order].astype(int) - 1, numpy.asarray(value)[order]
+
+
+def _iter_fcidump_rows(fcidump_file, chunk_size):
+    """Read the rows of a FCIDUMP by blocks of at most chunk_size lines.
+
+    Yields:
+        (index, value): Integer array (n_rows, 4) of the indices and array
+            (n_rows) of the values, complex if the rows give the real and
+            imaginary parts.
+    """
+    with open(fcidump_file) as f:
+        for block in iter_fcidump_blocks(f, chunk_size):
+            yield block
+
+
+def _rechunk(blocks, chunk_size):
+    """Regroup (index, value) blocks of any size in blocks of chunk_size,
+    except the last one."""
+    pending = []
+    n_pending = 0
+    for index, value in blocks:
+        if len(value):
+            pending.append((index, value))
+            n_pending += len(value)
+        if n_pending < chunk_size:
+            continue
+        index = numpy.concatenate([block[0] for block in pending])
+        value = numpy.concatenate([block[1] for block in pending])
+        start = 0
+        while n_pending - start >= chunk_size:
+            yield index[start:start + chunk_size], value[start:start + chunk_size]
+            start += chunk_size
+        pending = [(index[start:], value[start:])] if start < n_pending else []
+        n_pending -= start
+    if n_pending:
+        yield (numpy.concatenate([block[0] for block in pending]),
+               numpy.concatenate([block[1] for block in pending]))
+
+
 class MolecularData_Dirac(object):
 
     """Attributes:
@@ -230,7 +451,8 @@ class MolecularData_Dirac(object):
     """
     def __init__(self, geometry=None, basis=None, special_basis=None, multiplicity=None,
                  charge=0, description="", filename="", data_directory=None, relativistic=False,
-                 symmetry=True, speed_of_light=False):
+                 symmetry=True, speed_of_light=False, precision='double',
+                 memory_budget=None, memory_fallback='raise'):
         """Initialize molecular metadata which defines class.
 
         Args:
@@ -259,6 +481,19 @@ class MolecularData_Dirac(object):
                 or not.
             speed_of_light: real number of specify the speed of light manually.
             symmetry: boolean to specify the use of symmetry or not
+            precision: Optional string, precision of the Hamiltonian
+                coefficients built by get_molecular_hamiltonian and saved:
+                'double' (default), 'single' (float32, or complex64, which
+                halves memory and storage) or 'mixed' (single precision for
+                the two body coefficients only). The integrals are read in
+                double precision, the core energy stays in double precision.
+            memory_budget: Optional largest size of a dense array of
+                coefficients, in bytes or as a string like '16GB'. Defaults
+                to the memory available when the array is allocated.
+            memory_fallback: Optional string, what to do when an array is
+                larger than memory_budget: 'raise' a MemoryBudgetError
+                (default), or 'memmap' to map the array on a temporary file
+                next to the HDF5 file.
         """
         # Check appropriate data as been provided and autoload if requested.
         if ((geometry is None) or
@@ -290,6 +525,16 @@ class MolecularData_Dirac(object):
         self.symmetry = symmetry
         self.speed_of_light = speed_of_light
         self.special_basis = special_basis
+        if precision not in _precisions:
+            raise ValueError("precision must be 'double', 'single' or 'mixed'.")
+        self.precision = precision
+        if memory_fallback not in ('raise', 'memmap'):
+            raise ValueError("memory_fallback must be 'raise' or 'memmap'.")
+        self.memory_budget = memory_budget
+        self.memory_fallback = memory_fallback
+        # Memory used by the stages parse, build, transform and save, see
+        # track_memory.
+        self.memory_usage = {}
 
         # Name molecule and get associated filename
         self.name = name_molecule(geometry, basis, multiplicity,
@@ -300,7 +545,7 @@ class MolecularData_Dirac(object):
             self.filename = filename
         else:
             if data_directory is None:
-                self.filename = DATA_DIRECTORY + '/' + self.name
+                self.filename = openfermion_config.DATA_DIRECTORY + '/' + self.name
             else:
                 self.filename = data_directory + '/' + self.name
 
@@ -326,6 +571,8 @@ class MolecularData_Dirac(object):
         self.hf_energy = None
         # Orbital energies
         self.spinor = None
+        # File with the orbital coefficients, kept to restart other SCF.
+        self.dfcoef_file = None
 
         # Attributes generated from MP2 calculation.
         self.mp2_energy = None
@@ -341,18 +588,25 @@ class MolecularData_Dirac(object):
         self.one_body_coeff = None
         self.two_body_coeff = None
         self.molecular_hamiltonian = None
+        # Largest error of the coefficients due to the precision.
+        self.rounding_error = None
+        # Spinor on each qubit, None for the order of the exporter.
+        self.spinor_order = None
+        self.jordan_wigner_weight = None
+        # Low rank factorization of two_body_coeff.
+        self.cholesky_vectors = None
+        # Integrals parsed by run_dirac with export_format='stream'.
+        self._streamed_integrals = None
+
+    def __setattr__(self, name, value):
+        # Remember which saved fields changed since the last call to save.
+        if name in _hdf5_fields:
+            self.__dict__.setdefault('_dirty', set()).add(name)
+        object.__setattr__(self, name, value)
 
-    def save(self):
-        """Method to save the class under a systematic name."""
-        self.get_energies()
-        self.get_integrals_FCIDUMP()
-        self.molecular_hamiltonian, self.one_body_coeff, self.two_body_coeff = self.get_molecular_hamiltonian()
-        self.n_qubits = count_qubits(self.molecular_hamiltonian)
-        self.n_orbitals = len(self.spinor)
-        tmp_name = uuid.uuid4()
-        with h5py.File("{}.hdf5".format(tmp_name), "w") as f:
-            # Save geometry:
-            d_geom = f.create_group("geometry")
+    def _hdf5_data(self, field):
+        """Return a dictionary dataset -> data for one saved field."""
+        if field == 'geometry':
             if not isinstance(self.geometry, basestring):
                 atoms = [numpy.string_(item[0]) for item in self.geometry]
                 positions = numpy.array([list(item[1])
@@ -360,82 +614,76 @@ class MolecularData_Dirac(object):
             else:
                 atoms = numpy.string_(self.geometry)
                 positions = None
-            d_geom.create_dataset("atoms", data=(atoms if atoms is not None
-                                                 else False))
-            d_geom.create_dataset("positions", data=(positions if positions
-                                                     is not None else False))
-            # Save basis:
-            f.create_dataset("basis", data=numpy.string_(self.basis))
-            # Save multiplicity:
-            f.create_dataset("multiplicity", data=self.multiplicity)
-            # Save charge:
-            f.create_dataset("charge", data=self.charge)
-            # Save description:
-            f.create_dataset("description",
-                             data=numpy.string_(self.description))
-            # Save name:
-            f.create_dataset("name", data=numpy.string_(self.name))
-            # Save n_atoms:
-            f.create_dataset("n_atoms", data=self.n_atoms)
-            # Save atoms:
-            f.create_dataset("atoms", data=numpy.string_(self.atoms))
-            # Save protons:
-            f.create_dataset("protons", data=self.protons)
-            # Save n_electrons:
-            f.create_dataset("n_electrons", data=self.n_electrons)
-            # Save generic attributes from calculations:
-            f.create_dataset("n_orbitals",
-                             data=(self.n_orbitals if self.n_orbitals
-                                   is not None else False))
-            f.create_dataset("n_qubits",
-                             data=(self.n_qubits if
-                                   self.n_qubits is not None else False))
-            f.create_dataset("nuclear_repulsion",
-                             data=(self.E_core if
-                                   self.E_core is not None else
-                                   False))
-            # Save attributes generated from SCF calculation.
-            f.create_dataset("hf_energy", data=(self.hf_energy if
-                                                self.hf_energy is not None
-                                                else False))
-            f.create_dataset("orbital_energies", data=(str(self.spinor) if
-                                                self.spinor is not None
-                                                else False))
-            # Save attributes generated from integrals.
-            f.create_dataset("one_body_integrals", data=(str(self.one_body_int) if
-                                                self.one_body_int is not None
-                                                else False))
-            f.create_dataset("two_body_integrals", data=(str(self.two_body_int) if
-                                                self.two_body_int is not None
-                                                else False))
-            f.create_dataset("one_body_coefficients", data=(self.one_body_coeff if
-                                                self.one_body_coeff is not None
-                                                else False))
-            f.create_dataset("two_body_coefficients", data=(self.two_body_coeff if
-                                                self.two_body_coeff is not None
-                                                else False))
-            f.create_dataset("print_molecular_hamiltonian", data=(str(self.molecular_hamiltonian) if
-                                                self.molecular_hamiltonian is not None
-                                                else False))
-            # Save attributes generated from MP2 calculation.
-            f.create_dataset("mp2_energy",
-                             data=(self.mp2_energy if
-                                   self.mp2_energy is not None else False))
-            # Save attributes generated from CCSD calculation.
-            f.create_dataset("ccsd_energy",
-                             data=(self.ccsd_energy if
-                                   self.ccsd_energy is not None else False))
-
-        # Remove old file first for compatibility with systems that don't allow
-        # rename replacement.  Catching OSError for when file does not exist
-        # yet
-        try:
-            os.remove("{}.hdf5".format(self.filename))
-        except OSError:
-            pass
+            return {"geometry/atoms": (atoms if atoms is not None
+                                       else False),
+                    "geometry/positions": (positions if positions
+                                           is not None else False)}
+        dataset, convert = _hdf5_fields[field]
+        value = getattr(self, field)
+        return {dataset: (convert(value) if value is not None else False)}
+
+    def save(self, catalog=True):
+        """Method to save the class under a systematic name.
 
-        os.rename("{}.hdf5".format(tmp_name),
-                  "{}.hdf5".format(self.filename))
+        Energies, integrals and coefficients already available are reused,
+        they are only computed from the Dirac output and FCIDUMP files when
+        missing. The first save writes the complete file to a temporary file
+        in the same directory, which is then renamed. The following calls
+        only update, in place, the datasets of the fields assigned since
+        the last save, e.g. after setting molecule.ccsd_energy. Changes made
+        in place to an array, e.g. molecule.one_body_coeff[0, 0] = 0., are
+        not seen: assign the attribute again (molecule.one_body_coeff =
+        molecule.one_body_coeff) for them to be saved.
+
+        Args:
+            catalog: Boolean, record the molecule in the catalog of its
+                directory (catalog.sqlite, see query_catalog).
+        """
+        if self.hf_energy is None:
+            self.get_energies()
+        if (self.molecular_hamiltonian is None or
+                self.one_body_coeff is None or self.two_body_coeff is None):
+            (self.molecular_hamiltonian, self.one_body_coeff,
+             self.two_body_coeff) = self.get_molecular_hamiltonian()
+        # The coefficients may come from compute_hf_energy, run_dirac with
+        # export_format='stream', ... which do not set the sizes.
+        if self.n_qubits is None:
+            self.n_qubits = self.one_body_coeff.shape[0]
+        if self.n_orbitals is None and self.spinor is not None:
+            self.n_orbitals = len(self.spinor)
+
+        with track_memory(self, 'save'):
+            filename = "{}.hdf5".format(self.filename)
+            dirty = self.__dict__.get('_dirty', set())
+            if (self.__dict__.get('_saved_file') == filename and
+                    os.path.exists(filename)):
+                if dirty:
+                    with h5py.File(filename, "r+") as f:
+                        for field in dirty:
+                            for dataset, data in self._hdf5_data(field).items():
+                                _write_dataset(f, dataset, data)
+            else:
+                # Unlike tempfile.mkstemp (mode 0600), the file gets the
+                # mode given by the umask, as if it were written in place.
+                tmp_name = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+                os.close(os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+                try:
+                    with h5py.File(tmp_name, "w") as f:
+                        for field in _hdf5_fields:
+                            for dataset, data in self._hdf5_data(field).items():
+                                f.create_dataset(dataset, data=data)
+                    os.replace(tmp_name, filename)
+                except BaseException:
+                    os.remove(tmp_name)
+                    raise
+                self._saved_file = filename
+            dirty.clear()
+            if catalog:
+                try:
+                    update_catalog(self)
+                except Exception as error:
+                    warnings.warn('{} not recorded in the catalog: {}'.format(
+                        filename, error), Warning)
 
     def get_from_file(self, property_name):
         """Helper routine to re-open HDF5 file and pull out single property
@@ -470,6 +718,8 @@ class MolecularData_Dirac(object):
                                     Openfermion
             two_body_coefficients : Two body integrals as it should appear in
                                     Openfermion
+            cholesky_vectors : Cholesky vectors of the two body coefficients,
+                               see get_cholesky_vectors
             The two latter property + the float(nuclear_repulsion) can be used to
             generate the molecular_hamiltonian thanks to InteractionOperator. This
             molecular_hamiltonian can then be used to construct the qubit_Hamiltonian. 
@@ -496,14 +746,131 @@ class MolecularData_Dirac(object):
         """Return number of beta electrons."""
         return int((self.n_electrons - (self.multiplicity - 1)) // 2)
 
+    def _allocate(self, shape, dtype, name):
+        """Zero array checked against the memory budget, see
+        allocate_array."""
+        return allocate_array(shape, dtype, self.memory_budget, self.memory_fallback,
+                              os.path.dirname(os.path.abspath(self.filename)), name)
+
+    def _find_file(self, *candidates):
+        """Return the first existing file, or None."""
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                return candidate
+        return None
+
+    def _fcidump_file(self):
+        """FCIDUMP written by run_dirac, next to self.filename when Dirac ran
+        in a scratch directory, or in the current directory."""
+        return self._find_file(
+            os.path.join(os.path.dirname(self.filename),
+                         "FCIDUMP_" + self.name),
+            "FCIDUMP_" + self.name)
+
+    def _moint_directory(self):
+        """Directory of .npy files written by run_dirac with
+        export_format='npy', found as the FCIDUMP."""
+        return self._find_file(
+            os.path.join(os.path.dirname(self.filename),
+                         "MOINT_" + self.name),
+            "MOINT_" + self.name)
+
+    def get_integrals_MOINT(self):
+        """Read the integrals written by run_dirac with export_format='npy'.
+
+        The arrays are memory-mapped, not parsed: they are read from the disk
+        only when used.
+
+        Returns:
+            E_core: Core energy.
+            spinor: Dictionary index -> spinor energy, as for the FCIDUMP.
+            one_body_index: Array (n_integrals, 2) of the spinor indices
+                (starting at 1) of the one body integrals.
+            one_body_value: Array (n_integrals) of their values, real or
+                complex.
+            two_body_index: Array (n_integrals, 4) of the spinor indices of
+                the two body integrals, in the order of the FCIDUMP.
+            two_body_value: Array (n_integrals) of their values.
+        """
+        moint_directory = self._moint_directory()
+        if moint_directory is None:
+            raise FileNotFoundError('MOINT directory not found, first make a run_dirac '
+                                    'calculation with export_format="npy"')
+
+        def load(name):
+            return numpy.load(os.path.join(moint_directory, "MOINT_" + name + ".npy"),
+                              mmap_mode='r')
+
+        self.E_core = float(load("core_energy"))
+        self.spinor = {index + 1: float(energy)
+                       for index, energy in enumerate(load("spinor_energy"))}
+        return (self.E_core, self.spinor,
+                load("one_body_index"), load("one_body_value"),
+                load("two_body_index"), load("two_body_value"))
+
+    def iter_integrals(self, chunk_size=65536, n_body=2):
+        """Read the integrals by blocks, without building the tensors.
+
+        The integrals are read from the .npy files of export_format='npy'
+        (memory-mapped) or from the FCIDUMP, chunk_size at a time, so that
+        the memory used does not depend on the size of the file.
+
+        Args:
+            chunk_size: Integer, number of integrals per block. Every block
+                has this size except the last one.
+            n_body: 1 for the one body integrals, 2 for the two body ones.
+
+        Yields:
+            (index, value): Integer array (chunk_size, 2 * n_body) of indices
+                and array (chunk_size) of values, in the convention of
+                OpenFermion: index starts at 0, and the two body (p,q,r,s) of
+                Dirac is (p,r,s,q) with value / 2, as in two_body_coeff. The
+                integrals are those of the file; in a non relativistic
+                calculation, get_molecular_hamiltonian also completes the
+                beta spin blocks from the alpha ones.
+        """
+        if n_body not in (1, 2):
+            raise ValueError('n_body must be 1 or 2.')
+        moint_directory = self._moint_directory()
+        if moint_directory is not None:
+            name = "one_body" if n_body == 1 else "two_body"
+            all_index = numpy.load(os.path.join(moint_directory, "MOINT_" + name + "_index.npy"),
+                                   mmap_mode='r')
+            all_value = numpy.load(os.path.join(moint_directory, "MOINT_" + name + "_value.npy"),
+                                   mmap_mode='r')
+            blocks = ((all_index[start:start + chunk_size], all_value[start:start + chunk_size])
+                      for start in range(0, len(all_value), chunk_size))
+        else:
+            fcidump_file = self._fcidump_file()
+            if fcidump_file is None:
+                raise FileNotFoundError('FCIDUMP not found, first make a run_dirac calculation')
+
+            def select(rows):
+                for index, value in rows:
+                    one_body = (index[:, 2] == 0) & (index[:, 3] == 0)
+                    if n_body == 1:
+                        wanted = one_body & (index[:, 1] != 0)
+                    else:
+                        wanted = ~one_body
+                    yield index[wanted][:, :2 * n_body], value[wanted]
+            blocks = select(_iter_fcidump_rows(fcidump_file, chunk_size))
+
+        for index, value in _rechunk(blocks, chunk_size):
+            if n_body == 1:
+                yield numpy.asarray(index, dtype=int) - 1, numpy.array(value)
+            else:
+                yield (numpy.asarray(index, dtype=int)[:, [0, 2, 3, 1]] - 1,
+                       numpy.asarray(value) / 2.0)
+
     def get_integrals_FCIDUMP(self):
-        if os.path.exists("FCIDUMP_" + self.name) == True:
+        fcidump_file = self._fcidump_file()
+        if fcidump_file is not None:
              self.E_core = 0
              self.spinor = {}
              self.one_body_int = {}
              self.two_body_int = {}
-             num_lines = sum(1 for line in open('FCIDUMP_' + self.name))
-             with open("FCIDUMP_" + self.name) as f:
+             num_lines = sum(1 for line in open(fcidump_file))
+             with open(fcidump_file) as f:
                start_reading=0
                for line in f:
                  start_reading+=1
@@ -530,12 +897,183 @@ class MolecularData_Dirac(object):
              raise FileNotFoundError('FCIDUMP not found, first make a run_dirac calculation')
         return self.E_core, self.spinor, self.one_body_int, self.two_body_int
 
+    def to_openfermion(self, filename=None, save=False):
+        """View of the molecule as an openfermion MolecularData.
+
+        The coefficient arrays are shared, not copied, see
+        MolecularData_OpenFermion.
+
+        Args:
+            filename: Optional name of the OpenFermion HDF5 file,
+                self.filename + '_openfermion' by default.
+            save: Optional boolean to write the file in the layout of
+                OpenFermion, which MolecularData(filename=...) can load.
+
+        Returns:
+            molecule: An instance of MolecularData_OpenFermion.
+        """
+        from ._openfermion_data import MolecularData_OpenFermion
+        molecule = MolecularData_OpenFermion(self, filename)
+        if save:
+            molecule.save()
+        return molecule
+
+    def get_active_space(self, n_qubits, n_occupied_active=None, gap=0.01):
+        """Active keyword of run_dirac giving exactly n_qubits spinors.
+
+        The spinor energies are those of the last run_dirac on this
+        molecule, which should be a calculation without active space (e.g. a
+        cheap SCF). The occupied spinors are read from the files of
+        export_format='npy', else the n_electrons lowest spinors are taken
+        as occupied. See select_active_space.
+
+        Args:
+            n_qubits: Integer, number of active spinors wanted.
+            n_occupied_active: Optional integer, number of occupied spinors
+                in the window, half of the window by default.
+            gap: Real number, minimum energy difference between the active
+                spinors and the other ones.
+
+        Returns:
+            active: A list of 3 real numbers to give to run_dirac.
+        """
+        moint_directory = self._moint_directory()
+        if moint_directory is not None:
+            self.get_integrals_MOINT()
+            occupation = numpy.load(os.path.join(moint_directory,
+                                                 "MOINT_spinor_occupation.npy"))
+            n_occupied = int(numpy.count_nonzero(occupation))
+        elif self._streamed_integrals is not None:
+            self.spinor = self._streamed_integrals[1]
+            n_occupied = self.n_electrons
+        else:
+            self.get_integrals_FCIDUMP()
+            n_occupied = self.n_electrons
+        return select_active_space(self.spinor.values(), n_qubits, n_occupied,
+                                   n_occupied_active, gap)
+
+    def _occupied_qubits(self):
+        """Qubits of the occupied spinors of the reference determinant,
+        from the files of export_format='npy', else the n_electrons lowest
+        spinors, placed on their qubits of self.spinor_order."""
+        moint_directory = self._moint_directory()
+        if moint_directory is not None:
+            occupation = numpy.load(os.path.join(moint_directory,
+                                                 'MOINT_spinor_occupation.npy'))
+            occupied = numpy.flatnonzero(occupation).tolist()
+        else:
+            occupied = list(range(self.n_electrons))
+        if self.spinor_order is not None:
+            occupied = set(occupied)
+            occupied = [qubit for qubit, spinor in enumerate(self.spinor_order)
+                        if spinor in occupied]
+        return occupied
+
+    def compute_hf_energy(self, occupied=None):
+        """Energy of the reference determinant from the coefficients.
+
+        Compare with the hf_energy of get_energies to check the
+        Hamiltonian.
+
+        Args:
+            occupied: Optional list of the occupied qubits, those of the
+                Hartree-Fock determinant by default.
+
+        Returns:
+            hf_energy: Real number.
+        """
+        if self.two_body_coeff is None:
+            (self.molecular_hamiltonian, self.one_body_coeff,
+             self.two_body_coeff) = self.get_molecular_hamiltonian()
+        if occupied is None:
+            occupied = self._occupied_qubits()
+        return hartree_fock_energy(self.E_core,
+                                   self.one_body_coeff, self.two_body_coeff,
+                                   occupied)
+
+    def compute_mp2_energy(self, occupied=None, energies=None, block_size=None):
+        """Total MP2 energy from the coefficients, without run_ccsd.
+
+        Args:
+            occupied: Optional list of the occupied qubits, those of the
+                Hartree-Fock determinant by default.
+            energies: Optional spinor energy of each qubit. Defaults to the
+                diagonal of the Fock matrix of the coefficients.
+            block_size: Optional integer, see mp2_energy.
+
+        Returns:
+            mp2_energy: Real number, compute_hf_energy plus the MP2
+                correlation energy.
+        """
+        if self.two_body_coeff is None:
+            (self.molecular_hamiltonian, self.one_body_coeff,
+             self.two_body_coeff) = self.get_molecular_hamiltonian()
+        if occupied is None:
+            occupied = self._occupied_qubits()
+        return (self.compute_hf_energy(occupied) +
+                mp2_energy(self.one_body_coeff, self.two_body_coeff, occupied,
+                           energies, block_size))
+
+    def get_tapered_hamiltonian(self, symmetries=None, occupied=None):
+        """Qubit Hamiltonian without the qubits fixed by the Z2 symmetries
+        (number parity, Kramers or Sz parity, irreps) of the coefficients.
+
+        Args:
+            symmetries: Optional list of Z2Symmetry, by default all the
+                independent symmetries found by find_z2_symmetries.
+            occupied: Optional list of the occupied spinors of the state
+                whose symmetry sector is kept, Hartree-Fock by default.
+
+        Returns:
+            tapered_hamiltonian: QubitOperator on the remaining qubits.
+            stabilizers: List of the QubitOperator stabilizers.
+            removed_qubits: List of the removed qubits.
+        """
+        return taper_hamiltonian(self, symmetries, occupied)
+
+    def get_cholesky_vectors(self, threshold=1e-8, max_vectors=None):
+        """Pivoted Cholesky decomposition of the two body coefficients.
+
+        The coefficients in memory are used, else those of the saved HDF5
+        file, read one slice at a time, else they are computed. The vectors
+        are stored in self.cholesky_vectors, and saved by save. See
+        cholesky_decomposition.
+
+        Args:
+            threshold: Real number, largest error of the integrals (ps|qr).
+            max_vectors: Optional integer, maximum number of vectors.
+
+        Returns:
+            cholesky_vectors: Array (n_vectors, n_qubits, n_qubits), with
+                (ps|qr) = 2 * two_body_coeff[p, q, r, s]
+                        = sum_l L[l, p, s] * conj(L[l, r, q]).
+        """
+        if self.two_body_coeff is not None:
+            self.cholesky_vectors = cholesky_decomposition(
+                self.two_body_coeff, threshold, max_vectors)
+            return self.cholesky_vectors
+        filename = "{}.hdf5".format(self.filename)
+        if os.path.exists(filename):
+            with h5py.File(filename, "r") as f:
+                if ('two_body_coefficients' in f and
+                        f['two_body_coefficients'].ndim == 4):
+                    self.cholesky_vectors = cholesky_decomposition(
+                        f['two_body_coefficients'], threshold, max_vectors)
+                    return self.cholesky_vectors
+        (self.molecular_hamiltonian, self.one_body_coeff,
+         self.two_body_coeff) = self.get_molecular_hamiltonian()
+        self.cholesky_vectors = cholesky_decomposition(
+            self.two_body_coeff, threshold, max_vectors)
+        return self.cholesky_vectors
+
     def get_energies(self):
         self.hf_energy = None
         self.mp2_energy = None
         self.ccsd_energy = None
-        if os.path.exists(self.name + '.out') == True:
-           with open(self.name + '.out', "r") as f:
+        output_file = self._find_file(self.filename + '.out',
+                                      self.name + '.out')
+        if output_file is not None:
+           with open(output_file, "r") as f:
              for line in f:
                 if re.search("Total energy                             :", line):
                   self.hf_energy=line.rsplit(None, 1)[-1]
@@ -547,9 +1085,22 @@ class MolecularData_Dirac(object):
            raise FileNotFoundError('output not found, check your run_dirac calculation')
         return self.hf_energy, self.mp2_energy, self.ccsd_energy
 
-    def get_molecular_hamiltonian(self):
+    def get_molecular_hamiltonian(self, precision=None, spinor_order=None):
         """Output arrays of the second quantized Hamiltonian coefficients.
 
+        Args:
+            precision: Optional string 'double', 'single' or 'mixed', see
+                __init__. Defaults to self.precision. The largest absolute
+                rounding error of the coefficients is stored in
+                self.rounding_error (0 in double precision).
+            spinor_order: Optional order of the spinors on the qubits, to
+                shorten the Jordan-Wigner strings: 'energy', 'irrep',
+                'bandwidth', 'greedy', 'auto' or a permutation, see
+                order_spinors. Qubit k holds spinor self.spinor_order[k]
+                (None for the order of the exporter), and
+                self.jordan_wigner_weight gives the estimated (total,
+                longest) Pauli weight of the terms in this order.
+
         Returns:
             molecular_hamiltonian: An instance of the MolecularOperator class.
             one_body_coefficients and
@@ -572,61 +1123,105 @@ class MolecularData_Dirac(object):
            So p,q,r,s in Openfermion reads p,s,q,r in Dirac, or reversely,
               p,q,r,s in Dirac       reads p,r,s,q in Openfermion.
         """
-        # Get active space integrals.
-        E_core, spinor, one_body_integrals, two_body_integrals = self.get_integrals_FCIDUMP()
-        n_qubits = len(one_body_integrals)
-        # Initialize Hamiltonian coefficients.
-        one_body_coefficients = numpy.zeros((n_qubits, n_qubits))
-        two_body_coefficients = numpy.zeros((n_qubits, n_qubits,
-                                             n_qubits, n_qubits))
-
-        if self.relativistic:
-          for p in range(n_qubits):
-            for q in range(n_qubits):
-                if (p+1,q+1) in one_body_integrals: 
-                   one_body_coefficients[p,q] = one_body_integrals[p+1,q+1]
-                for r in range(n_qubits):
-                    for s in range(n_qubits):
-                        if (p+1,q+1,r+1,s+1) in two_body_integrals and self.relativistic is True:
-                           two_body_coefficients[p,r,s,q] = two_body_integrals[p+1,q+1,r+1,s+1] / 2.0
-        else:
-          for p in range(n_qubits):
-            for q in range(n_qubits):
-                if (p+1,q+1) in one_body_integrals:
-                   one_body_coefficients[p,q] = one_body_integrals[p+1,q+1]
-                   one_body_coefficients[q,p] = one_body_integrals[p+1,q+1]
-
-          #permutation symmetry
-          for p in range(n_qubits//2):
-            for q in range(n_qubits//2):
-                for r in range(n_qubits//2):
-                    for s in range(n_qubits//2):
-                        if (2*p+1,2*q+1,2*r+1,2*s+1) in two_body_integrals:
-                           two_body_coefficients[2*p,2*r,2*s,2*q] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-                           two_body_coefficients[2*q,2*r,2*s,2*p] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-                           two_body_coefficients[2*p,2*s,2*r,2*q] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-                           two_body_coefficients[2*q,2*s,2*r,2*p] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-                           two_body_coefficients[2*r,2*p,2*q,2*s] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-                           two_body_coefficients[2*s,2*p,2*q,2*r] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-                           two_body_coefficients[2*r,2*q,2*p,2*s] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-                           two_body_coefficients[2*s,2*q,2*p,2*r] = two_body_integrals[2*p+1,2*q+1,2*r+1,2*s+1] / 2.0
-        # restricted calculation
-          for p in range(n_qubits//2):
-            for q in range(n_qubits//2):
-                for r in range(n_qubits//2):
-                    for s in range(n_qubits//2):
-                        two_body_coefficients[2*p+1,2*q,2*r,2*s+1] = two_body_coefficients[2*p,2*q,2*r,2*s]
-                        two_body_coefficients[2*p,2*q+1,2*r+1,2*s] = two_body_coefficients[2*p,2*q,2*r,2*s]
-                        two_body_coefficients[2*p+1,2*q+1,2*r+1,2*s+1] = two_body_coefficients[2*p,2*q,2*r,2*s]
-
-        # Truncate.
-        one_body_coefficients[
-            numpy.absolute(one_body_coefficients) < EQ_TOLERANCE] = 0.
-        two_body_coefficients[
-            numpy.absolute(two_body_coefficients) < EQ_TOLERANCE] = 0.
+        with track_memory(self, 'parse'):
+            # Get active space integrals, parsed during the export or from the
+            # .npy files if run_dirac wrote them.
+            if self._streamed_integrals is not None:
+                (E_core, spinor, one_body_index, one_body_value,
+                 two_body_index, two_body_value) = self._streamed_integrals
+                self.E_core, self.spinor = E_core, spinor
+            elif self._moint_directory() is not None:
+                (E_core, spinor, one_body_index, one_body_value,
+                 two_body_index, two_body_value) = self.get_integrals_MOINT()
+            else:
+                E_core, spinor, one_body_integrals, two_body_integrals = self.get_integrals_FCIDUMP()
+                one_body_index, one_body_value = _integral_arrays(one_body_integrals, 2)
+                two_body_index, two_body_value = _integral_arrays(two_body_integrals, 4)
+        # Imports openfermion, if not done yet, outside of the stage.
+        tolerance = openfermion_config.EQ_TOLERANCE
+        with track_memory(self, 'build'):
+            n_qubits = len(one_body_value)
+            # Initialize Hamiltonian coefficients, directly in the precision asked.
+            if precision is None:
+                precision = self.precision
+            if precision not in _precisions:
+                raise ValueError("precision must be 'double', 'single' or 'mixed'.")
+            single_one_body, single_two_body = _precisions[precision]
+            dtype = numpy.result_type(one_body_value.dtype, two_body_value.dtype)
+            one_body_coefficients = numpy.zeros(
+                (n_qubits, n_qubits), _coefficient_dtype(dtype, single_one_body))
+            two_body_coefficients = self._allocate(
+                (n_qubits, n_qubits, n_qubits, n_qubits),
+                _coefficient_dtype(dtype, single_two_body), 'two_body_coefficients')
+
+            # Python indices of the integrals, the spinors start at 1 in Dirac.
+            one_body_index, one_body_value = _sorted_integrals(one_body_index, one_body_value)
+            two_body_index, two_body_value = _sorted_integrals(two_body_index, two_body_value)
+            p, q = one_body_index.T
+            self.rounding_error = max(
+                _rounding_error(one_body_value, one_body_coefficients.dtype),
+                _rounding_error(numpy.asarray(two_body_value) / 2.0,
+                                two_body_coefficients.dtype))
+
+            if self.relativistic:
+              inside = (p < n_qubits) & (q < n_qubits)
+              one_body_coefficients[p[inside], q[inside]] = one_body_value[inside]
+              inside = numpy.all(two_body_index < n_qubits, axis=1)
+              p, q, r, s = two_body_index[inside].T
+              two_body_coefficients[p, r, s, q] = two_body_value[inside] / 2.0
+            else:
+              inside = (p < n_qubits) & (q < n_qubits)
+              one_body_coefficients[p[inside], q[inside]] = one_body_value[inside]
+              one_body_coefficients[q[inside], p[inside]] = one_body_value[inside]
+
+              #permutation symmetry, from the integrals of the alpha spinors
+              inside = (numpy.all(two_body_index % 2 == 0, axis=1) &
+                        numpy.all(two_body_index < 2 * (n_qubits // 2), axis=1))
+              p, q, r, s = two_body_index[inside].T
+              value = two_body_value[inside] / 2.0
+              two_body_coefficients[p, r, s, q] = value
+              two_body_coefficients[q, r, s, p] = value
+              two_body_coefficients[p, s, r, q] = value
+              two_body_coefficients[q, s, r, p] = value
+              two_body_coefficients[r, p, q, s] = value
+              two_body_coefficients[s, p, q, r] = value
+              two_body_coefficients[r, q, p, s] = value
+              two_body_coefficients[s, q, p, r] = value
+            # restricted calculation
+              alpha = slice(0, 2 * (n_qubits // 2), 2)
+              beta = slice(1, 2 * (n_qubits // 2), 2)
+              two_body_coefficients[beta, alpha, alpha, beta] = two_body_coefficients[alpha, alpha, alpha, alpha]
+              two_body_coefficients[alpha, beta, beta, alpha] = two_body_coefficients[alpha, alpha, alpha, alpha]
+              two_body_coefficients[beta, beta, beta, beta] = two_body_coefficients[alpha, alpha, alpha, alpha]
+
+            # Truncate.
+            one_body_coefficients[numpy.absolute(one_body_coefficients) < tolerance] = 0.
+            # By slices, without temporary arrays of the size of the tensor.
+            for two_body_slice in two_body_coefficients:
+                two_body_slice[numpy.absolute(two_body_slice) < tolerance] = 0.
+
+        # Reorder the spinors on the qubits.
+        self.spinor_order = None
+        self.jordan_wigner_weight = None
+        if spinor_order is not None:
+            with track_memory(self, 'transform'):
+                irreps = (spinor_irreps(self) if isinstance(spinor_order, str) and
+                          spinor_order in ('irrep', 'auto') else None)
+                order = order_spinors(one_body_coefficients, two_body_coefficients,
+                                      spinor_order, irreps)
+                one_body_coefficients = one_body_coefficients[numpy.ix_(order, order)]
+                ordered = self._allocate(two_body_coefficients.shape,
+                                         two_body_coefficients.dtype,
+                                         'reordered two_body_coefficients')
+                for k, p in enumerate(order):
+                    ordered[k] = two_body_coefficients[p][numpy.ix_(order, order, order)]
+                two_body_coefficients = ordered
+                self.spinor_order = order
+                self.jordan_wigner_weight = jordan_wigner_weight(one_body_coefficients,
+                                                                 two_body_coefficients)
 
         # Cast to InteractionOperator class and return.
-        molecular_hamiltonian = InteractionOperator(
+        molecular_hamiltonian = openfermion_ops.InteractionOperator(
             E_core, one_body_coefficients, two_body_coefficients)
 
         return molecular_hamiltonian, one_body_coefficients, two_body_coefficients
@@ -0,0 +1,137 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""OpenFermion MolecularData view of a MolecularData_Dirac. This module
+imports openfermion, it is loaded when first used."""
+
+import numpy
+
+from openfermion.chem import MolecularData
+from openfermion.ops import InteractionOperator
+
+
+def _energy(value):
+    """Energies parsed from the Dirac output are strings."""
+    return float(value) if value is not None else None
+
+
+class MolecularData_OpenFermion(MolecularData):
+
+    """Attributes, in addition to those of openfermion MolecularData:
+        dirac_molecule: The MolecularData_Dirac this object is a view of.
+        relativistic: Boolean, relativistic calculation or not.
+        one_body_coefficients: The one body coefficients of the Dirac
+            molecule, same array (spin-orbitals or spinors).
+        two_body_coefficients: The two body coefficients of the Dirac
+            molecule, same array.
+
+    The energies are converted to float, E_core is the nuclear_repulsion
+    and orbital_energies holds one energy per Kramers pair (the spatial
+    orbitals in a non relativistic calculation). In a non relativistic
+    calculation, one_body_integrals is a view of the alpha block of the
+    one body coefficients and two_body_integrals is computed from the
+    alpha block of the two body coefficients when first used. These
+    spatial integrals do not exist in a relativistic calculation, they
+    are None.
+    """
+    def __init__(self, molecule, filename=None):
+        """Build the view, computing what is missing in molecule.
+
+        Args:
+            molecule: A MolecularData_Dirac for which run_dirac has been
+                called. The coefficients are computed from the Dirac files if
+                they are not available yet.
+            filename: Optional name of the OpenFermion HDF5 file written by
+                save, molecule.filename + '_openfermion' by default, so that
+                the file of molecule is not overwritten.
+        """
+        if molecule.two_body_coeff is None:
+            (molecule.molecular_hamiltonian, molecule.one_body_coeff,
+             molecule.two_body_coeff) = molecule.get_molecular_hamiltonian()
+        if molecule.hf_energy is None:
+            try:
+                molecule.get_energies()
+            except FileNotFoundError:
+                pass
+        MolecularData.__init__(self,
+                               geometry=molecule.geometry,
+                               basis=molecule.basis,
+                               multiplicity=molecule.multiplicity,
+                               charge=molecule.charge,
+                               description=molecule.description,
+                               filename=(filename or
+                                         molecule.filename + '_openfermion'))
+        self.dirac_molecule = molecule
+        self.relativistic = molecule.relativistic
+        self.one_body_coefficients = molecule.one_body_coeff
+        self.two_body_coefficients = molecule.two_body_coeff
+        self.n_qubits = molecule.one_body_coeff.shape[0]
+        self.n_orbitals = self.n_qubits // 2
+        self.nuclear_repulsion = molecule.E_core
+        self.hf_energy = _energy(molecule.hf_energy)
+        self.mp2_energy = _energy(molecule.mp2_energy)
+        self.ccsd_energy = _energy(molecule.ccsd_energy)
+        if molecule.spinor is not None:
+            energies = numpy.array([molecule.spinor[key]
+                                    for key in sorted(molecule.spinor)])
+            if molecule.spinor_order is not None:
+                order = molecule.spinor_order
+                energies = energies[order[order < len(energies)]]
+            self.orbital_energies = energies[::2]
+
+    @property
+    def one_body_integrals(self):
+        if self._one_body_integrals is None and not self.relativistic:
+            self._one_body_integrals = self.one_body_coefficients[::2, ::2]
+        return self._one_body_integrals
+
+    @one_body_integrals.setter
+    def one_body_integrals(self, value):
+        self._one_body_integrals = value
+
+    @property
+    def two_body_integrals(self):
+        if self._two_body_integrals is None and not self.relativistic:
+            # The Dirac coefficients include the 1/2 of the Hamiltonian.
+            self._two_body_integrals = 2. * self.two_body_coefficients[::2, ::2, ::2, ::2]
+        return self._two_body_integrals
+
+    @two_body_integrals.setter
+    def two_body_integrals(self, value):
+        self._two_body_integrals = value
+
+    def get_molecular_hamiltonian(self, occupied_indices=None, active_indices=None):
+        """Output the Hamiltonian as an InteractionOperator.
+
+        Without indices, the Hamiltonian shares the coefficients of the
+        Dirac molecule. The active space reduction of OpenFermion uses the
+        spatial integrals, it is only available in a non relativistic
+        calculation, use the active argument of run_dirac otherwise.
+
+        Args:
+            occupied_indices(list): A list of spatial orbital indices
+                indicating which orbitals should be considered doubly occupied.
+            active_indices(list): A list of spatial orbital indices indicating
+                which orbitals should be considered active.
+
+        Returns:
+            molecular_hamiltonian: An instance of the InteractionOperator class.
+        """
+        if occupied_indices is None and active_indices is None:
+            return InteractionOperator(self.nuclear_repulsion,
+                                       self.one_body_coefficients,
+                                       self.two_body_coefficients)
+        if self.relativistic:
+            raise ValueError('occupied_indices and active_indices need spatial '
+                             'orbitals, not available in a relativistic calculation')
+        return MolecularData.get_molecular_hamiltonian(self, occupied_indices,
+                                                       active_indices)
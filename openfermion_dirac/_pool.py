@@ -0,0 +1,43 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pool of threads working through a lazy iterable of items."""
+
+import collections
+import concurrent.futures
+
+
+def bounded_map(function, items, max_workers):
+    """Call function on each item with a pool of threads, in order.
+
+    The items are taken lazily from the iterable, at most 2 * max_workers
+    of them are submitted and not yet yielded at the same time, so that a
+    long iterable (e.g. the frames of a trajectory) is never all in memory.
+
+    Args:
+        function: Function of one item.
+        items: Iterable of the items.
+        max_workers: Number of threads.
+
+    Yields:
+        (item, future): Each item and the concurrent.futures.Future of
+            function(item), in the order of the items. future.result()
+            raises the exception of the call, if any.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
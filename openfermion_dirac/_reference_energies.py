@@ -0,0 +1,113 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Hartree-Fock and MP2 energies computed from the Hamiltonian coefficients,
+without the correlated step of Dirac.
+
+With the coefficients of get_molecular_hamiltonian,
+two_body_coefficients[p, q, r, s] = <pq|sr> / 2, so the antisymmetrized
+integral is <ij||ab> = 2 * (two[i, j, b, a] - two[i, j, a, b]). The formulas
+are those of spin-orbitals, valid for real and complex integrals.
+"""
+
+from ._lazy import LazyModule
+
+numpy = LazyModule('numpy')
+
+# Default number of elements of the blocks of integrals of mp2_energy.
+_block_elements = 1 << 24
+
+
+def hartree_fock_energy(constant, one_body_coefficients, two_body_coefficients,
+                        occupied):
+    """Energy of the determinant of the occupied spinors.
+
+    Args:
+        constant: The core energy.
+        one_body_coefficients: Array (n_qubits, n_qubits).
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits, n_qubits).
+        occupied: List of the occupied spinors (qubits).
+
+    Returns:
+        energy: Real number.
+    """
+    occupied = numpy.asarray(list(occupied), dtype=numpy.intp)
+    block = two_body_coefficients[numpy.ix_(occupied, occupied, occupied, occupied)]
+    energy = (constant + numpy.trace(one_body_coefficients[numpy.ix_(occupied, occupied)]) +
+              numpy.einsum('ijji->', block) - numpy.einsum('ijij->', block))
+    return float(numpy.real(energy))
+
+
+def fock_diagonal(one_body_coefficients, two_body_coefficients, occupied):
+    """Diagonal of the Fock matrix of the determinant of the occupied
+    spinors, f[p] = h[p, p] + sum_j <pj||pj>, the spinor energies if the
+    determinant is the canonical Hartree-Fock solution.
+
+    Args:
+        one_body_coefficients: Array (n_qubits, n_qubits).
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits, n_qubits).
+        occupied: List of the occupied spinors (qubits).
+
+    Returns:
+        energies: Real array (n_qubits,).
+    """
+    occupied = numpy.asarray(list(occupied), dtype=numpy.intp)
+    diagonal = numpy.real(numpy.diagonal(one_body_coefficients)).copy()
+    for j in occupied:
+        diagonal += 2. * numpy.real(numpy.diagonal(two_body_coefficients[:, j, j, :]) -
+                                    numpy.diagonal(two_body_coefficients[:, j, :, j]))
+    return diagonal
+
+
+def mp2_energy(one_body_coefficients, two_body_coefficients, occupied,
+               energies=None, block_size=None):
+    """MP2 correlation energy of the determinant of the occupied spinors.
+
+    E = 1/4 sum_ijab |<ij||ab>|^2 / (e_i + e_j - e_a - e_b), computed by
+    blocks of occupied spinors i, such that only the integrals of a block
+    are in memory.
+
+    Args:
+        one_body_coefficients: Array (n_qubits, n_qubits).
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits, n_qubits).
+        occupied: List of the occupied spinors (qubits), the others are
+            virtual.
+        energies: Optional array of the spinor energies. Defaults to
+            fock_diagonal.
+        block_size: Optional integer, number of spinors i per block. By
+            default a block has about 16 million integrals.
+
+    Returns:
+        energy: Real number, the correlation energy.
+    """
+    n_qubits = one_body_coefficients.shape[0]
+    occupied = numpy.asarray(sorted(occupied), dtype=numpy.intp)
+    virtual = numpy.setdiff1d(numpy.arange(n_qubits), occupied)
+    if energies is None:
+        energies = fock_diagonal(one_body_coefficients, two_body_coefficients, occupied)
+    energies = numpy.asarray(energies, dtype=float)
+    if block_size is None:
+        block_size = max(1, _block_elements // max(1, len(occupied) * len(virtual) ** 2))
+    e_occupied = energies[occupied]
+    e_virtual = energies[virtual]
+    virtual_pairs = e_virtual[:, None] + e_virtual[None, :]
+
+    energy = 0.
+    for start in range(0, len(occupied), block_size):
+        block = occupied[start:start + block_size]
+        # integrals[i, j, x, y] = two[i, j, x, y], <ij||ab> for b = x, a = y.
+        integrals = two_body_coefficients[numpy.ix_(block, occupied, virtual, virtual)]
+        antisymmetrized = 2. * (integrals - integrals.transpose(0, 1, 3, 2))
+        denominators = ((energies[block][:, None] + e_occupied[None, :])[:, :, None, None] -
+                        virtual_pairs[None, None, :, :])
+        energy += numpy.sum(numpy.absolute(antisymmetrized) ** 2 / denominators)
+    return float(energy / 4.)
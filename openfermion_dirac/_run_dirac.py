@@ -19,15 +19,27 @@ from __future__ import absolute_import
 
 import os
 import re
-import subprocess
+import shutil
+import tempfile
 import warnings
 
+from ._estimate import count_basis_functions
+from ._lazy import LazyModule
+from ._memory import available_memory
+from ._stream import FcidumpStream
+
+subprocess = LazyModule('subprocess')
+
 class ActiveOrbitalsError(Exception):
     pass
 class SpecialBasisError(Exception):
     pass
 class SpeedOfLightError(Exception):
     pass
+class StartGuessError(Exception):
+    pass
+class ExportFormatError(Exception):
+    pass
 
 def create_geometry_string(geometry):
     """This function converts MolecularData geometry to Dirac geometry.
@@ -64,7 +76,8 @@ def generate_dirac_input(molecule,
                         point_nucleus,
                         speed_of_light,
                         active,
-                        manual_option):
+                        manual_option,
+                        directory=None):
     """This function creates and saves a Dirac input file.
 
     Args:
@@ -86,13 +99,20 @@ def generate_dirac_input(molecule,
                                If the gap is lower than this number, the lowest
                                (or highest) energy is shifted down (or up) until
                                the gap is larger to the third number.
+        directory: Optional directory where the files are written, instead
+                   of next to molecule.filename.
 
     Returns:
         input_file: A string giving the name of the saved input file, and the xyz file.
     """
+    if directory is None:
+        root = molecule.filename
+    else:
+        root = os.path.join(directory, os.path.basename(molecule.filename))
+
     # Create Dirac geometry string.
     geo_string = create_geometry_string(molecule.geometry)
-    xyz_file = molecule.filename + '.xyz'
+    xyz_file = root + '.xyz'
     with open(xyz_file, 'w') as f:
      f.write(str(molecule.n_atoms)+'\n')
      f.write(molecule.filename + ' # anything can be in this line\n')
@@ -120,7 +140,7 @@ def generate_dirac_input(molecule,
        raise SpeedOfLightError('A given speed of light has been specified without setting relativistic to True')
 
     # Write input file and return handle.
-    input_file = molecule.filename + '.inp'
+    input_file = root + '.inp'
     with open(input_file, 'w') as f:
       f.write("**DIRAC\n")
       f.write(".4INDEX\n")
@@ -167,15 +187,60 @@ def generate_dirac_input(molecule,
 
     return input_file, xyz_file
 
-def rename(molecule):
-    output_file_dirac = molecule.filename + "_" + molecule.name + '.out'
+def _remove(path):
+    """Remove a file or a directory, if it exists."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def rename(molecule, directory=os.curdir):
+    output_file_dirac = os.path.join(directory, os.path.basename(molecule.filename) + "_" + molecule.name + '.out')
     output_file = molecule.filename + '.out'
-    os.rename("FCIDUMP", "FCIDUMP_" + molecule.name)
-    os.rename(output_file_dirac,output_file)
+    if os.path.exists(os.path.join(directory, "FCIDUMP")):
+        os.rename(os.path.join(directory, "FCIDUMP"), os.path.join(directory, "FCIDUMP_" + molecule.name))
+    else:
+        # .npy files of the exporter, gathered in the directory MOINT_name
+        npy_files = [local_file for local_file in os.listdir(directory)
+                     if local_file.startswith("MOINT_") and local_file.endswith(".npy")]
+        if npy_files:
+            moint_directory = os.path.join(directory, "MOINT_" + molecule.name)
+            _remove(moint_directory)
+            os.mkdir(moint_directory)
+            for local_file in npy_files:
+                os.rename(os.path.join(directory, local_file), os.path.join(moint_directory, local_file))
+    shutil.move(output_file_dirac,output_file)
+    if os.path.exists(os.path.join(directory, "DFCOEF")):
+        os.rename(os.path.join(directory, "DFCOEF"), os.path.join(directory, "DFCOEF_" + molecule.name))
+
+def collect(molecule, directory, delete_input=True, delete_xyz=True, delete_MRCONEE=True,
+            delete_MDCINT=True, delete_DFCOEF=True):
+    """Move the files to keep from the scratch directory next to molecule.filename.
+
+    The FCIDUMP (or the MOINT directory of .npy files) is always moved, it
+    is read when saving the results.
+    """
+    destination = os.path.dirname(os.path.abspath(molecule.filename))
+    root = os.path.basename(molecule.filename)
+    keep = [("FCIDUMP_" + molecule.name, True),
+            ("MOINT_" + molecule.name, True),
+            (root + '.inp', not delete_input),
+            (root + '.xyz', not delete_xyz),
+            ("MRCONEE", not delete_MRCONEE),
+            ("MDCINT", not delete_MDCINT),
+            ("DFCOEF_" + molecule.name, not delete_DFCOEF)]
+    for local_file, kept in keep:
+        if kept and os.path.exists(os.path.join(directory, local_file)):
+            _remove(os.path.join(destination, local_file))
+            shutil.move(os.path.join(directory, local_file),
+                        os.path.join(destination, local_file))
+    molecule.dfcoef_file = None
+    if os.path.exists(os.path.join(destination, "DFCOEF_" + molecule.name)):
+        molecule.dfcoef_file = os.path.join(destination, "DFCOEF_" + molecule.name)
 
 def clean_up(molecule, delete_input=True, delete_xyz=True, delete_output=False, delete_MRCONEE=True,
-             delete_MDCINT=True, delete_FCIDUMP=False):
-    os.remove("FCITABLE")
+             delete_MDCINT=True, delete_FCIDUMP=False, delete_DFCOEF=True):
+    _remove("FCITABLE")
     input_file = molecule.filename + '.inp'
     xyz_file = molecule.filename + '.xyz'
     output_file_dirac = molecule.filename + "_" + molecule.name + '.out'
@@ -199,7 +264,114 @@ def clean_up(molecule, delete_input=True, delete_xyz=True, delete_output=False,
     if delete_MDCINT:
         os.remove("MDCINT")
     if delete_FCIDUMP:
-        os.remove("FCIDUMP_" + molecule.name)
+        _remove("FCIDUMP_" + molecule.name)
+        _remove("MOINT_" + molecule.name)
+    if os.path.exists("DFCOEF_" + molecule.name):
+        if delete_DFCOEF:
+            os.remove("DFCOEF_" + molecule.name)
+            molecule.dfcoef_file = None
+        else:
+            molecule.dfcoef_file = os.path.abspath("DFCOEF_" + molecule.name)
+
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def dirac_resources(molecule, relativistic=False, jobs_per_node=1,
+                    cores=None, memory=None, n_basis=None):
+    """Choose the MPI processes, OpenMP threads and memory of a Dirac run.
+
+    Small molecules run on one process, since the MPI start-up costs more
+    than it saves. Larger ones get one MPI process per 50 basis functions,
+    within the share of the node given to this job.
+
+    Args:
+        molecule: An instance of the MolecularData_Dirac class.
+        relativistic: Boolean, relativistic calculation or not.
+        jobs_per_node: Integer, number of jobs sharing the node, each one
+                       gets this fraction of the cores and memory.
+        cores: Optional integer, cores of the node. Defaults to the cores
+               this process may run on.
+        memory: Optional integer, memory of the node in megawords (8 MB).
+                Defaults to 80% of the available memory (see
+                available_memory), or 2048 if it is unknown.
+        n_basis: Optional integer, number of basis functions, counted in
+                 the basis set library of Dirac if not given (see
+                 count_basis_functions), estimated from the basis name for
+                 the elements missing from it.
+
+    Returns:
+        mpi: Integer, number of MPI processes.
+        omp_threads: Integer, number of OpenMP threads per process.
+        memory: Integer, work memory per process in megawords.
+    """
+    if cores is None:
+        cores = _available_cores()
+    if memory is None:
+        available = available_memory()
+        memory = (int(0.8 * available) // (8 * 1024**2) if available is not None
+                  else 2048)
+    if n_basis is None:
+        n_large, n_small, _ = count_basis_functions(molecule, relativistic)
+        n_basis = n_large + n_small
+    cores = max(1, cores // jobs_per_node)
+    memory = max(64, memory // jobs_per_node)
+
+    mpi = max(1, min(cores, n_basis // 50))
+    omp_threads = max(1, cores // mpi)
+    # Dirac allocates its work array at start-up: ask for the transformed
+    # integrals of a process (n_basis**4 / 8 words, spread over the
+    # processes) but never less than the default 64 MW.
+    needed = max(64, n_basis**4 // (8 * mpi * 10**6))
+    return mpi, omp_threads, min(needed, max(64, memory // mpi))
+
+
+def _pam_command(xyz_file, input_file, start_guess, mpi, memory, scratch):
+    """Arguments of pam, run without a shell so that no file name or option
+    is ever interpreted as a command."""
+    command = ["pam", "--mol=" + xyz_file, "--inp=" + input_file]
+    if start_guess is not None:
+        command.append("--put=" + start_guess + "=DFCOEF")
+    if mpi and mpi > 1:
+        command.append("--mpi=" + str(int(mpi)))
+    if memory:
+        command.append("--aw=" + str(int(memory)))
+    if scratch:
+        command.append("--scratch=" + str(scratch))
+    return command + ["--get=MRCONEE MDCINT DFCOEF", "--silent", "--noarch"]
+
+
+def _export_stream(molecule, run_directory, archive):
+    """Run the exporter writing its FCIDUMP into a named pipe, parsed and
+    turned into the Hamiltonian coefficients by a thread while the exporter
+    runs.
+
+    Returns:
+        The result of molecule.get_molecular_hamiltonian for the integrals.
+    """
+    def build(integrals):
+        molecule._streamed_integrals = integrals
+        return molecule.get_molecular_hamiltonian()
+
+    stream = FcidumpStream(os.path.join(run_directory, "FCIDUMP"),
+                           os.path.join(run_directory, "FCIDUMP_" + molecule.name)
+                           if archive else None,
+                           build=build)
+    stream.start()
+    try:
+        subprocess.check_call(["dirac_openfermion_mointegral_export.x", "fcidump"],
+                              cwd=run_directory)
+    except BaseException:
+        try:
+            stream.finish()
+        except Exception:
+            pass
+        raise
+    return stream.finish()
 
 
 def run_dirac(molecule,
@@ -216,6 +388,17 @@ def run_dirac(molecule,
              delete_MRCONEE=False,
              delete_MDCINT=False,
              delete_FCIDUMP=False,
+             delete_DFCOEF=True,
+             start_guess=None,
+             mpi=False,
+             omp_threads=False,
+             memory=False,
+             scratch=False,
+             auto_resources=False,
+             jobs_per_node=1,
+             scratch_root=False,
+             export_format='fcidump',
+             archive_FCIDUMP=False,
              save=False):
     """This function runs a Dirac calculation.
 
@@ -237,38 +420,233 @@ def run_dirac(molecule,
         delete_MRCONEE: Optional boolean to delete Dirac MRCONEE file.
         delete_MDCINT: Optional boolean to delete Dirac MDCINT file.
         delete_FCIDUMP: Optional boolean to delete Dirac FCIDUMP file.
+        delete_DFCOEF: Optional boolean to delete the DFCOEF file holding the
+                       orbital coefficients. Set it to False to use this
+                       calculation as start_guess of another one.
+        start_guess: Optional MolecularData_Dirac computed with
+                     delete_DFCOEF=False, or the name of a DFCOEF file, whose
+                     orbitals are the starting guess of the SCF, e.g. the
+                     neighbouring point of a scan. Same atoms and basis are
+                     required.
+        mpi: Optional integer, number of MPI processes of pam.
+        omp_threads: Optional integer, number of OpenMP threads per process.
+        memory: Optional integer, work memory per process in megawords
+                (8 MB), given to pam as --aw.
+        scratch: Optional string, scratch directory of pam.
+        auto_resources: Optional boolean to choose mpi, omp_threads and
+                        memory which are not given from the size of the
+                        molecule and the cores and memory of the node,
+                        see dirac_resources.
+        jobs_per_node: Optional integer, number of jobs sharing the node
+                       when auto_resources is used.
+        scratch_root: Optional string, directory (e.g. a node-local disk or
+                      /dev/shm) in which a private directory is created for
+                      the intermediate files (input, MRCONEE, MDCINT,
+                      FCIDUMP, FCITABLE, ...), instead of the current
+                      directory. It is also the scratch of pam unless
+                      scratch is given. Only the files which are not deleted
+                      are moved next to molecule.filename, and the private
+                      directory is removed even if the calculation fails.
+        export_format: Optional string, format of the integrals written by
+                       dirac_openfermion_mointegral_export.x: 'fcidump' (text
+                       file FCIDUMP_name) or 'npy' (directory MOINT_name of
+                       .npy files, memory-mapped when the Hamiltonian is
+                       built, without parsing) or 'stream' (the FCIDUMP is
+                       written into a named pipe and parsed while it is
+                       exported, the coefficients are built when the export
+                       ends and no FCIDUMP is written). delete_FCIDUMP
+                       applies to all.
+        archive_FCIDUMP: Optional boolean, with export_format='stream', to
+                         also write the FCIDUMP_name file while parsing it.
 
     Returns:
         molecule: The updated MolecularData object.
     """
-    # Prepare input.
-    input_file, xyz_file = generate_dirac_input(molecule,
-                        symmetry,
-                        run_ccsd,
-                        relativistic,
-                        point_nucleus,
-                        speed_of_light,
-                        active,
-                        manual_option)
+    if export_format not in ('fcidump', 'npy', 'stream'):
+        raise ExportFormatError('export_format should be "fcidump", "npy" or "stream"')
+    if scratch_root:
+        run_directory = tempfile.mkdtemp(prefix=molecule.name + '_', dir=scratch_root)
+        scratch = scratch or scratch_root
+    else:
+        run_directory = os.curdir
+    try:
+        # Prepare input.
+        input_file, xyz_file = generate_dirac_input(molecule,
+                            symmetry,
+                            run_ccsd,
+                            relativistic,
+                            point_nucleus,
+                            speed_of_light,
+                            active,
+                            manual_option,
+                            run_directory if scratch_root else None)
+        input_file = os.path.abspath(input_file)
+        xyz_file = os.path.abspath(xyz_file)
+
+        # Orbitals of a previous calculation, copied to the Dirac scratch as
+        # DFCOEF, are read by the SCF in place of the default starting guess.
+        guess_file = None
+        if start_guess is not None:
+            if not isinstance(start_guess, str):
+                if (start_guess.basis != molecule.basis or
+                        start_guess.atoms != molecule.atoms):
+                    raise StartGuessError('start_guess should have the same '
+                                          'atoms and basis as the molecule')
+                start_guess = start_guess.dfcoef_file
+            if start_guess is None or not os.path.exists(start_guess):
+                warnings.warn('No DFCOEF file for the start guess, run the '
+                              'previous calculation with delete_DFCOEF=False.',
+                              Warning)
+            else:
+                guess_file = os.path.abspath(start_guess)
+
+        if auto_resources:
+            auto_mpi, auto_omp_threads, auto_memory = dirac_resources(
+                molecule, relativistic, jobs_per_node)
+            mpi = mpi or auto_mpi
+            omp_threads = omp_threads or auto_omp_threads
+            memory = memory or auto_memory
+        environment = None
+        if omp_threads:
+            environment = dict(os.environ, OMP_NUM_THREADS=str(omp_threads))
 
-    # Run Dirac
-    print('Starting Dirac calculation\n')
-    subprocess.check_call("pam --mol=" + xyz_file + " --inp=" + input_file + " --get='MRCONEE MDCINT' --silent --noarch", shell=True)
+        # Run Dirac
+        print('Starting Dirac calculation\n')
+        subprocess.check_call(_pam_command(xyz_file, input_file, guess_file, mpi, memory, scratch),
+                              env=environment, cwd=run_directory)
 
-    # run dirac_openfermion_mointegral_export.x
-    print('\nCreation of the FCIDUMP file\n')
-    subprocess.check_call("dirac_openfermion_mointegral_export.x",shell=True)
+        # run dirac_openfermion_mointegral_export.x
+        print('\nCreation of the ' + export_format + ' integral files\n')
+        molecule._streamed_integrals = None
+        if export_format == 'stream':
+            hamiltonian = _export_stream(molecule, run_directory, archive_FCIDUMP)
+        else:
+            subprocess.check_call(["dirac_openfermion_mointegral_export.x", export_format],
+                                  cwd=run_directory)
+            if export_format == 'npy' and not any(
+                    local_file.startswith("MOINT_") and local_file.endswith(".npy")
+                    for local_file in os.listdir(run_directory)):
+                # An exporter built before the npy target writes a FCIDUMP.
+                _remove(os.path.join(run_directory, "FCIDUMP"))
+                raise ExportFormatError(
+                    'dirac_openfermion_mointegral_export.x wrote no MOINT_*.npy '
+                    'files, rebuild it from utils/ (see the README) for '
+                    'export_format="npy"')
 
-    rename(molecule)
+        # Integrals of a previous run written in another format are outdated.
+        stale = {'fcidump': ["MOINT_"],
+                 'npy': ["FCIDUMP_"],
+                 'stream': ["MOINT_"] + ([] if archive_FCIDUMP else ["FCIDUMP_"])}
+        for prefix in stale[export_format]:
+            _remove(os.path.join(os.path.dirname(molecule.filename), prefix + molecule.name))
+            _remove(prefix + molecule.name)
 
-    if save:
-     try:
-        print("\nSaving the results\n")
-        molecule.save()
-     except:
-        warnings.warn('Error in saving results.',
-                      Warning)
+        rename(molecule, run_directory)
+        if scratch_root:
+            collect(molecule, run_directory, delete_input, delete_xyz, delete_MRCONEE, delete_MDCINT,
+                    delete_DFCOEF)
 
-    # Clean-up
-    clean_up(molecule, delete_input, delete_xyz, delete_output, delete_MRCONEE, delete_MDCINT, delete_FCIDUMP)
+        # Results of a previous calculation on this molecule are outdated, they
+        # are computed again from the new output and FCIDUMP when needed.
+        molecule.hf_energy = None
+        molecule.mp2_energy = None
+        molecule.ccsd_energy = None
+        molecule.molecular_hamiltonian = None
+        molecule.one_body_coeff = None
+        molecule.two_body_coeff = None
+        if export_format == 'stream':
+            (molecule.molecular_hamiltonian, molecule.one_body_coeff,
+             molecule.two_body_coeff) = hamiltonian
+
+        if save:
+         try:
+            print("\nSaving the results\n")
+            molecule.save()
+         except:
+            warnings.warn('Error in saving results.',
+                          Warning)
+
+        # Clean-up
+        if scratch_root:
+            # The other intermediate files are removed with the scratch directory.
+            if delete_output:
+                os.remove(molecule.filename + '.out')
+            if delete_FCIDUMP:
+                _remove(os.path.join(os.path.dirname(molecule.filename), "FCIDUMP_" + molecule.name))
+                _remove(os.path.join(os.path.dirname(molecule.filename), "MOINT_" + molecule.name))
+        else:
+            clean_up(molecule, delete_input, delete_xyz, delete_output, delete_MRCONEE, delete_MDCINT,
+                     delete_FCIDUMP, delete_DFCOEF)
+    finally:
+        if scratch_root:
+            shutil.rmtree(run_directory, ignore_errors=True)
     return molecule
+
+
+def order_by_geometry(molecules):
+    """Order molecules such that each geometry is close to the previous one.
+
+    Starting from an end of the scan, the geometry farthest from the first
+    molecule, the nearest remaining geometry (distance between the atomic
+    positions) is appended repeatedly. For a scan of one coordinate this is
+    the order of the coordinate.
+
+    Args:
+        molecules: A list of MolecularData_Dirac with the same atoms, given
+                   in the same order.
+
+    Returns:
+        ordered: The list of molecules in geometric order.
+    """
+    def distance(molecule_1, molecule_2):
+        return sum((x_1 - x_2)**2
+                   for (_, xyz_1), (_, xyz_2) in zip(molecule_1.geometry,
+                                                     molecule_2.geometry)
+                   for x_1, x_2 in zip(xyz_1, xyz_2))
+
+    remaining = list(molecules)
+    if not remaining:
+        return remaining
+    start = max(remaining,
+                key=lambda molecule: distance(remaining[0], molecule))
+    remaining.remove(start)
+    ordered = [start]
+    while remaining:
+        nearest = min(remaining,
+                      key=lambda molecule: distance(ordered[-1], molecule))
+        remaining.remove(nearest)
+        ordered.append(nearest)
+    return ordered
+
+
+def run_dirac_scan(molecules, warm_start=True, **kwargs):
+    """Run Dirac on the points of a scan, in geometric order.
+
+    Args:
+        molecules: A list of MolecularData_Dirac, e.g. one per bond length.
+        warm_start: Optional boolean to start the SCF of each point from the
+                    orbitals of the previous point. The DFCOEF files are
+                    deleted as soon as the next point is done, unless
+                    delete_DFCOEF=False is given.
+        kwargs: Other arguments given to run_dirac for every point.
+
+    Returns:
+        molecules: The list of updated molecules, in the order given.
+    """
+    delete_DFCOEF = kwargs.pop('delete_DFCOEF', True)
+    previous = None
+    for molecule in order_by_geometry(molecules):
+        run_dirac(molecule,
+                  start_guess=previous if warm_start else None,
+                  delete_DFCOEF=delete_DFCOEF and not warm_start,
+                  **kwargs)
+        if (previous is not None and delete_DFCOEF and
+                previous.dfcoef_file is not None):
+            os.remove(previous.dfcoef_file)
+            previous.dfcoef_file = None
+        previous = molecule
+    if (previous is not None and delete_DFCOEF and
+            previous.dfcoef_file is not None):
+        os.remove(previous.dfcoef_file)
+        previous.dfcoef_file = None
+    return molecules
@@ -0,0 +1,237 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Class to store a potential energy surface scan in a single HDF5 file."""
+
+import os
+
+from ._lazy import LazyModule
+from ._molecular_data_Dirac import basestring
+
+h5py = LazyModule('h5py')
+numpy = LazyModule('numpy')
+
+
+class ScanMismatchError(Exception):
+    pass
+
+
+# Metadata shared by every point of a scan, written once.
+_shared_fields = ['basis', 'multiplicity', 'charge', 'relativistic',
+                  'symmetry', 'speed_of_light', 'n_atoms', 'n_electrons']
+
+# Scalar results stacked along the geometry axis.
+_energy_fields = {'hf_energy': 'hf_energy',
+                  'mp2_energy': 'mp2_energy',
+                  'ccsd_energy': 'ccsd_energy',
+                  'nuclear_repulsion': 'E_core'}
+
+
+def _chunk_shape(point_shape, itemsize, points_per_chunk,
+                 target_bytes=2**20):
+    """Chunk shape for a dataset stacked along a leading geometry axis.
+
+    A chunk covers points_per_chunk geometries and, when a single point is
+    larger than target_bytes, a block of the trailing axes only, such that
+    reading one point or one element along the whole scan both touch a
+    small number of chunks.
+    """
+    chunk = [points_per_chunk] + list(point_shape)
+    axis = len(chunk) - 1
+    while (numpy.prod(chunk) * itemsize > target_bytes and
+           any(size > 1 for size in chunk[1:])):
+        if chunk[axis] > 1:
+            chunk[axis] = (chunk[axis] + 1) // 2
+        axis -= 1
+        if axis == 0:
+            axis = len(chunk) - 1
+    return tuple(chunk)
+
+
+class ScanData_Dirac(object):
+
+    """Attributes:
+        filename: The name of the file where the scan is saved.
+        points_per_chunk: Number of geometries stored in one HDF5 chunk.
+
+    The metadata common to all points (basis, multiplicity, charge, ...) is
+    written once, when the first point is appended. Every per-point
+    quantity is stacked along a leading geometry axis:
+        positions : (n_points, n_atoms, 3)
+        coordinate : (n_points,) scan coordinate, e.g. the bond length
+        description : (n_points,)
+        hf_energy, mp2_energy, ccsd_energy, nuclear_repulsion : (n_points,)
+        orbital_energies : (n_points, n_spinors)
+        one_body_coefficients : (n_points, n_qubits, n_qubits)
+        two_body_coefficients : (n_points, n_qubits, n_qubits,
+                                 n_qubits, n_qubits)
+    Missing energies are stored as NaN.
+    """
+    def __init__(self, filename, points_per_chunk=8):
+        """Initialize the scan store.
+
+        Args:
+            filename: A string giving the name of the HDF5 file, with or
+                without the .hdf5 extension. The file is created when the
+                first point is appended.
+            points_per_chunk: Number of geometries per HDF5 chunk. Larger
+                values favour reading one coefficient along the whole scan,
+                smaller values favour reading a single point.
+        """
+        if filename[-5:] == '.hdf5':
+            filename = filename[:(len(filename) - 5)]
+        self.filename = filename
+        self.points_per_chunk = points_per_chunk
+
+    @property
+    def n_points(self):
+        """Number of geometries stored in the scan."""
+        if not os.path.exists("{}.hdf5".format(self.filename)):
+            return 0
+        with h5py.File("{}.hdf5".format(self.filename), "r") as f:
+            if "positions" not in f:
+                return 0
+            return f["positions"].shape[0]
+
+    def append(self, molecule, coordinate=None):
+        """Append a finished scan point to the file.
+
+        Args:
+            molecule: An instance of MolecularData_Dirac for which run_dirac
+                has been called. The coefficients and energies are computed
+                from the Dirac files if they are not available yet.
+            coordinate: Optional real number locating the point along the
+                scan, e.g. the bond length. Stored as NaN if not given.
+
+        Returns:
+            index: The index of the new point along the geometry axis.
+
+        Raises:
+            ScanMismatchError: If the molecule is not compatible with the
+                points already stored (metadata or number of qubits).
+        """
+        if molecule.hf_energy is None:
+            molecule.get_energies()
+        if molecule.two_body_coeff is None:
+            (molecule.molecular_hamiltonian, molecule.one_body_coeff,
+             molecule.two_body_coeff) = molecule.get_molecular_hamiltonian()
+        positions = numpy.array([list(item[1]) for item in molecule.geometry],
+                                dtype=float)
+        spinor = numpy.array([molecule.spinor[key]
+                              for key in sorted(molecule.spinor)])
+        point_data = {
+            "positions": positions,
+            "coordinate": numpy.nan if coordinate is None else coordinate,
+            "description": molecule.description,
+            "orbital_energies": spinor,
+            "one_body_coefficients": molecule.one_body_coeff,
+            "two_body_coefficients": molecule.two_body_coeff}
+        for dataset, attribute in _energy_fields.items():
+            value = getattr(molecule, attribute)
+            point_data[dataset] = numpy.nan if value is None else float(value)
+
+        with h5py.File("{}.hdf5".format(self.filename), "a") as f:
+            if "positions" not in f:
+                self._initialize(f, molecule, point_data)
+            else:
+                self._check_compatible(f, molecule, point_data)
+            index = f["positions"].shape[0]
+            for dataset, data in point_data.items():
+                f[dataset].resize(index + 1, axis=0)
+                f[dataset][index] = data
+        return index
+
+    def _initialize(self, f, molecule, point_data):
+        """Write the shared metadata and create the stacked datasets."""
+        f.create_dataset("basis", data=numpy.string_(molecule.basis))
+        f.create_dataset("special_basis",
+                         data=([numpy.string_(basis) for basis
+                                in molecule.special_basis]
+                               if molecule.special_basis is not None
+                               else False))
+        f.create_dataset("multiplicity", data=molecule.multiplicity)
+        f.create_dataset("charge", data=molecule.charge)
+        f.create_dataset("relativistic", data=molecule.relativistic)
+        f.create_dataset("symmetry", data=molecule.symmetry)
+        f.create_dataset("speed_of_light", data=molecule.speed_of_light)
+        f.create_dataset("n_atoms", data=molecule.n_atoms)
+        f.create_dataset("n_electrons", data=molecule.n_electrons)
+        f.create_dataset("atoms", data=[numpy.string_(item[0])
+                                        for item in molecule.geometry])
+        f.create_dataset("n_qubits",
+                         data=molecule.one_body_coeff.shape[0])
+
+        for dataset, data in point_data.items():
+            if isinstance(data, basestring):
+                dtype = h5py.special_dtype(vlen=str)
+                point_shape = ()
+            else:
+                data = numpy.asarray(data)
+                dtype = data.dtype
+                point_shape = data.shape
+            f.create_dataset(
+                dataset, shape=(0,) + point_shape,
+                maxshape=(None,) + point_shape, dtype=dtype,
+                chunks=_chunk_shape(point_shape,
+                                    numpy.dtype(dtype).itemsize,
+                                    self.points_per_chunk),
+                fillvalue=(numpy.nan if dtype == float else None))
+
+    def _check_compatible(self, f, molecule, point_data):
+        """Raise ScanMismatchError if molecule does not belong to the scan."""
+        for field in _shared_fields:
+            stored = f[field][()]
+            if isinstance(stored, bytes):
+                stored = stored.decode()
+            if stored != getattr(molecule, field):
+                raise ScanMismatchError(
+                    '{} of the molecule ({}) differs from the scan ({})'
+                    .format(field, getattr(molecule, field), stored))
+        atoms = [atom.decode() for atom in f["atoms"][...]]
+        if atoms != [item[0] for item in molecule.geometry]:
+            raise ScanMismatchError('atoms of the molecule differ from the '
+                                    'scan, or are not given in the same order')
+        for dataset, data in point_data.items():
+            if numpy.shape(data) != f[dataset].shape[1:]:
+                raise ScanMismatchError(
+                    '{} has shape {} but the scan stores {}'.format(
+                        dataset, numpy.shape(data), f[dataset].shape[1:]))
+
+    def get_from_file(self, property_name, points=Ellipsis):
+        """Read a property of the scan, sliced along the geometry axis.
+
+        Args:
+            property_name: String, name of the dataset (see the class
+                docstring for the stacked datasets, the shared metadata
+                use the same names as in MolecularData_Dirac.save).
+            points: Optional index, slice or list of indices of the
+                geometries to read. Defaults to all points. Ignored for
+                the shared metadata. To follow a single coefficient along
+                the scan, use e.g. get_from_file('two_body_coefficients',
+                (slice(None), 0, 1, 1, 0)).
+
+        Returns:
+            The requested data, or None if the property or the file is not
+            found.
+        """
+        try:
+            with h5py.File("{}.hdf5".format(self.filename), "r") as f:
+                dataset = f[property_name]
+                if dataset.shape and dataset.maxshape[0] is None:
+                    data = dataset[points]
+                else:
+                    data = dataset[...]
+        except KeyError:
+            data = None
+        except IOError:
+            data = None
+        return data
@@ -0,0 +1,212 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Functions to give the Hamiltonian coefficients of a molecule to worker
+processes through shared memory, instead of pickling the arrays.
+
+In the main process:
+    handle = publish_coefficients(molecule)
+    pool.map(work, [(handle, parameters) for parameters in sweep])
+    unlink_coefficients(handle)
+In a worker:
+    arrays = attach_coefficients(handle)   # no copy
+    ... arrays['two_body_coeff'] ...
+    release_coefficients(handle)
+"""
+
+import threading
+
+from ._lazy import LazyModule
+
+numpy = LazyModule('numpy')
+resource_tracker = LazyModule('multiprocessing.resource_tracker')
+shared_memory = LazyModule('multiprocessing.shared_memory')
+openfermion_ops = LazyModule('openfermion.ops')
+
+# Coefficients published by publish_coefficients.
+_coefficient_fields = ('one_body_coeff', 'two_body_coeff')
+
+# Segments created by this process, segment name -> SharedMemory.
+_published = {}
+# Segments attached by this process, segment name -> [SharedMemory, count].
+_attached = {}
+_lock = threading.Lock()
+
+
+class SharedArraysHandle(object):
+
+    """Small picklable description of arrays published in shared memory.
+
+    Attributes:
+        arrays: Dictionary name -> (segment name, shape, dtype string).
+        constant: Optional number sent with the arrays, e.g. the core energy.
+    """
+    def __init__(self, arrays, constant=None):
+        self.arrays = arrays
+        self.constant = constant
+
+    def __repr__(self):
+        return 'SharedArraysHandle({})'.format(
+            ', '.join('{}{}'.format(name, shape)
+                      for name, (_, shape, _) in self.arrays.items()))
+
+
+# Whether this process uses the resource tracker of the process which
+# started it, decided at the first attachment.
+_inherited_tracker = None
+
+
+def _open_segment(segment_name):
+    """Attach a segment without letting a resource tracker of this process
+    unlink it when this process ends, while the publisher and other workers
+    still use it.
+    """
+    global _inherited_tracker
+    try:
+        return shared_memory.SharedMemory(name=segment_name, track=False)
+    except TypeError:  # Python < 3.13 always registers the segment.
+        pass
+    if _inherited_tracker is None:
+        # Processes started by multiprocessing share the tracker of their
+        # parent, which already tracks the segment: unregistering it there
+        # would make the publisher's unlink fail. Other processes start their
+        # own tracker.
+        _inherited_tracker = getattr(resource_tracker._resource_tracker, '_fd', None) is not None
+    segment = shared_memory.SharedMemory(name=segment_name)
+    if not _inherited_tracker:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def publish_arrays(arrays, constant=None):
+    """Copy arrays into new shared memory segments.
+
+    Args:
+        arrays: Dictionary name -> numpy array.
+        constant: Optional number stored in the handle.
+
+    Returns:
+        handle: A SharedArraysHandle to give to the workers. The segments
+            exist until unlink_coefficients(handle) is called.
+    """
+    description = {}
+    with _lock:
+        for name, array in arrays.items():
+            array = numpy.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(create=True,
+                                                 size=max(array.nbytes, 1))
+            shared = numpy.ndarray(array.shape, array.dtype, buffer=segment.buf)
+            shared[...] = array
+            _published[segment.name] = segment
+            description[name] = (segment.name, array.shape, array.dtype.str)
+    return SharedArraysHandle(description, constant)
+
+
+def publish_coefficients(molecule):
+    """Publish the Hamiltonian coefficients of a molecule in shared memory.
+
+    Args:
+        molecule: A MolecularData_Dirac. The coefficients are computed from
+            the Dirac files if they are not available yet.
+
+    Returns:
+        handle: A SharedArraysHandle of 'one_body_coeff' and
+            'two_body_coeff', with E_core as constant.
+    """
+    if molecule.two_body_coeff is None:
+        (molecule.molecular_hamiltonian, molecule.one_body_coeff,
+         molecule.two_body_coeff) = molecule.get_molecular_hamiltonian()
+    return publish_arrays({field: getattr(molecule, field)
+                           for field in _coefficient_fields},
+                          molecule.E_core)
+
+
+def attach_coefficients(handle):
+    """Arrays of a handle, backed by the shared memory (no copy).
+
+    Each call must be matched by a call to release_coefficients. The arrays
+    are read only, they are shared by all the processes.
+
+    Args:
+        handle: A SharedArraysHandle from publish_coefficients or
+            publish_arrays.
+
+    Returns:
+        arrays: Dictionary name -> numpy array.
+    """
+    arrays = {}
+    with _lock:
+        for name, (segment_name, shape, dtype) in handle.arrays.items():
+            if segment_name in _published:
+                segment = _published[segment_name]
+            else:
+                if segment_name not in _attached:
+                    _attached[segment_name] = [_open_segment(segment_name), 0]
+                _attached[segment_name][1] += 1
+                segment = _attached[segment_name][0]
+            array = numpy.ndarray(shape, numpy.dtype(dtype), buffer=segment.buf)
+            array.flags.writeable = False
+            arrays[name] = array
+    return arrays
+
+
+def attach_hamiltonian(handle):
+    """InteractionOperator whose coefficients are in shared memory.
+
+    Args:
+        handle: A SharedArraysHandle from publish_coefficients.
+
+    Returns:
+        molecular_hamiltonian: An instance of the InteractionOperator class.
+            Call release_coefficients(handle) when it is not used anymore.
+    """
+    arrays = attach_coefficients(handle)
+    return openfermion_ops.InteractionOperator(
+        handle.constant, arrays['one_body_coeff'], arrays['two_body_coeff'])
+
+
+def release_coefficients(handle):
+    """Release the arrays of one attach_coefficients call.
+
+    The segments are closed in this process when the last attachment is
+    released. The arrays must not be used anymore.
+    """
+    with _lock:
+        for segment_name, _, _ in handle.arrays.values():
+            if segment_name not in _attached:
+                continue
+            _attached[segment_name][1] -= 1
+            if _attached[segment_name][1] == 0:
+                segment = _attached.pop(segment_name)[0]
+                try:
+                    segment.close()
+                except BufferError:
+                    # Arrays still refer to the memory, it is freed with
+                    # them.
+                    pass
+
+
+def unlink_coefficients(handle):
+    """Free the shared memory of a handle, in the publishing process.
+
+    The workers must have released the arrays.
+    """
+    with _lock:
+        for segment_name, _, _ in handle.arrays.values():
+            segment = _published.pop(segment_name, None)
+            if segment is None:
+                continue
+            try:
+                segment.close()
+            except BufferError:
+                pass
+            segment.unlink()
@@ -0,0 +1,317 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Functions to order the spinors on the qubits such that the Jordan-Wigner
+strings of the Hamiltonian are short.
+
+An order is an array whose element k is the spinor (0-based index of the
+coefficients of get_molecular_hamiltonian) put on qubit k. The spinors 2k
+and 2k+1 (a Kramers pair, or the alpha and beta spin-orbitals) are kept
+next to each other, in this order, by the methods below.
+"""
+
+from ._lazy import LazyModule
+
+numpy = LazyModule('numpy')
+openfermion_config = LazyModule('openfermion.config')
+scipy_sparse = LazyModule('scipy.sparse')
+scipy_csgraph = LazyModule('scipy.sparse.csgraph')
+
+# Methods of order_spinors.
+_methods = ('energy', 'irrep', 'bandwidth', 'greedy', 'auto')
+
+
+def _aggregate(keys, counts, magnitude):
+    """Sum the counts and keep the largest magnitude of equal keys."""
+    if len(keys) == 0:
+        return keys, counts, magnitude
+    order = numpy.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = numpy.flatnonzero(numpy.concatenate([[True], keys[1:] != keys[:-1]]))
+    return (keys[starts], numpy.add.reduceat(counts[order], starts),
+            numpy.maximum.reduceat(magnitude[order], starts))
+
+
+class _Terms(object):
+
+    """Nonzero coefficients, grouped by the sorted spinors they act on.
+
+    The weight of a term only depends on the set of its spinors, so the
+    terms are stored once per set, with their number and largest magnitude.
+    The two body tensor is read one slab [p] at a time, the index arrays
+    never hold more than a slab of nonzero coefficients besides the groups.
+    """
+    def __init__(self, one_body_coefficients, two_body_coefficients, tolerance):
+        self.n_spinors = n = one_body_coefficients.shape[0]
+        self.one_body, self.one_body_count, self.one_body_magnitude = self._group(
+            [one_body_coefficients], tolerance, 2)
+        self.two_body, self.two_body_count, self.two_body_magnitude = self._group(
+            (two_body_coefficients[p] for p in range(n)), tolerance, 4)
+
+    def _group(self, slabs, tolerance, rank):
+        n = self.n_spinors
+        keys = numpy.zeros(0, dtype=numpy.int64)
+        counts = numpy.zeros(0, dtype=numpy.int64)
+        magnitude = numpy.zeros(0)
+        pending = []
+        for p, slab in enumerate(slabs):
+            slab_magnitude = numpy.absolute(slab)
+            nonzero = numpy.nonzero(slab_magnitude > tolerance)
+            index = numpy.empty((len(nonzero[0]), rank), dtype=numpy.int32)
+            if rank == 4:
+                index[:, 0] = p
+            for column, spinor in enumerate(nonzero, rank - len(nonzero)):
+                index[:, column] = spinor
+            index.sort(axis=1)
+            slab_keys = numpy.zeros(len(index), dtype=numpy.int64)
+            for column in range(rank):
+                slab_keys = slab_keys * n + index[:, column]
+            pending.append(_aggregate(slab_keys,
+                                      numpy.ones(len(index), dtype=numpy.int64),
+                                      slab_magnitude[nonzero]))
+            del slab_magnitude, nonzero, index
+            if sum(len(block[0]) for block in pending) > len(keys):
+                keys, counts, magnitude = _aggregate(
+                    *(numpy.concatenate(arrays) for arrays in
+                      zip((keys, counts, magnitude), *pending)))
+                pending = []
+        if pending:
+            keys, counts, magnitude = _aggregate(
+                *(numpy.concatenate(arrays) for arrays in
+                  zip((keys, counts, magnitude), *pending)))
+        index = numpy.empty((len(keys), rank), dtype=numpy.int32)
+        for column in range(rank - 1, -1, -1):
+            keys, index[:, column] = numpy.divmod(keys, n)
+        return index, counts, magnitude
+
+    def weight(self, position, one_terms=slice(None), two_terms=slice(None)):
+        """Estimated Pauli weight of each group of terms, for spinor ->
+        qubit position.
+
+        The Jordan-Wigner string of a product of operators on the sorted
+        qubits a <= b (<= c <= d) acts on the qubits [a, b] (and [c, d]).
+
+        Args:
+            position: Integer array, qubit of each spinor.
+            one_terms, two_terms: Optional indices of the groups evaluated.
+        """
+        one = numpy.sort(position[self.one_body[one_terms]], axis=1)
+        two = numpy.sort(position[self.two_body[two_terms]], axis=1)
+        one_weight = one[:, 1] - one[:, 0] + 1
+        two_weight = (two[:, 1] - two[:, 0] + two[:, 3] - two[:, 2] + 2 -
+                      (two[:, 1] == two[:, 2]))
+        return one_weight, two_weight
+
+    def total_weight(self, position, one_terms=slice(None), two_terms=slice(None)):
+        """Sum of the weights of the terms (of the groups given)."""
+        one_weight, two_weight = self.weight(position, one_terms, two_terms)
+        return int(numpy.dot(one_weight, self.one_body_count[one_terms]) +
+                   numpy.dot(two_weight, self.two_body_count[two_terms]))
+
+    def terms_of(self, group_of_spinor, n_groups):
+        """Groups of terms acting on each group of spinors.
+
+        Returns:
+            terms: List (one per group of spinors) of (one body, two body)
+                integer arrays of the indices of the groups of terms.
+        """
+        result = [[None, None] for _ in range(n_groups)]
+        for kind, index in enumerate((self.one_body, self.two_body)):
+            group = group_of_spinor[index]
+            term = numpy.broadcast_to(numpy.arange(len(index), dtype=numpy.int32)[:, None],
+                                      group.shape)
+            keys = numpy.unique(group.astype(numpy.int64).ravel() * len(index) +
+                                term.ravel())
+            group, term = numpy.divmod(keys, max(len(index), 1))
+            bounds = numpy.searchsorted(group, numpy.arange(n_groups + 1))
+            for k in range(n_groups):
+                result[k][kind] = term[bounds[k]:bounds[k + 1]]
+        return result
+
+
+def _position(order):
+    position = numpy.empty(len(order), dtype=numpy.intp)
+    position[order] = numpy.arange(len(order))
+    return position
+
+
+def _total_weight(terms, order):
+    return terms.total_weight(_position(order))
+
+
+def jordan_wigner_weight(one_body_coefficients, two_body_coefficients,
+                         spinor_order=None, tolerance=None):
+    """Estimated Pauli weight of the Jordan-Wigner Hamiltonian.
+
+    Each nonzero coefficient counts for the number of qubits its
+    Jordan-Wigner string acts on. The Hermitian conjugate terms and the
+    terms combined by the transformation are not merged, so this is an upper
+    bound used to compare orders, computed without the transformation.
+
+    Args:
+        one_body_coefficients: Array (n_qubits, n_qubits).
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits, n_qubits).
+        spinor_order: Optional order to evaluate, the coefficients are in
+            the order to evaluate by default.
+        tolerance: Coefficients smaller than tolerance are ignored.
+            Defaults to EQ_TOLERANCE of openfermion.
+
+    Returns:
+        total_weight: Integer, sum of the weights of the terms.
+        longest: Integer, largest weight of a term.
+    """
+    if tolerance is None:
+        tolerance = openfermion_config.EQ_TOLERANCE
+    terms = _Terms(one_body_coefficients, two_body_coefficients, tolerance)
+    if spinor_order is None:
+        spinor_order = numpy.arange(one_body_coefficients.shape[0])
+    position = _position(numpy.asarray(spinor_order))
+    one_weight, two_weight = terms.weight(position)
+    longest = max(one_weight.max(initial=0), two_weight.max(initial=0))
+    return terms.total_weight(position), int(longest)
+
+
+def _pairs(n_qubits):
+    """Spinors kept together, [2k, 2k+1], the last one alone if n_qubits is
+    odd."""
+    return [list(range(first, min(first + 2, n_qubits)))
+            for first in range(0, n_qubits, 2)]
+
+
+def _order_of_pairs(pairs, pair_order):
+    return numpy.array([spinor for k in pair_order for spinor in pairs[k]],
+                       dtype=numpy.intp)
+
+
+def _irrep_order(pairs, irreps):
+    """Pairs grouped by irrep of their first spinor, by energy in a group."""
+    def irrep(k):
+        first = pairs[k][0]
+        return irreps[first] if first < len(irreps) else 0
+    return _order_of_pairs(pairs, sorted(range(len(pairs)), key=irrep))
+
+
+def _bandwidth_order(pairs, terms):
+    """Reverse Cuthill-McKee order of the graph of the pairs coupled by the
+    largest coefficients."""
+    pair_of = numpy.repeat(numpy.arange(len(pairs)), 2)[:sum(map(len, pairs))]
+    n_pairs = len(pairs)
+    strength = numpy.zeros((n_pairs, n_pairs))
+    for index, magnitude in ((terms.one_body, terms.one_body_magnitude),
+                             (terms.two_body, terms.two_body_magnitude)):
+        pair = pair_of[index]
+        for i in range(pair.shape[1]):
+            for j in range(i + 1, pair.shape[1]):
+                numpy.maximum.at(strength, (pair[:, i], pair[:, j]), magnitude)
+    strength = numpy.maximum(strength, strength.T)
+    numpy.fill_diagonal(strength, 0.)
+    if not strength.any():
+        return _order_of_pairs(pairs, range(n_pairs))
+    # Only the strongest half of the couplings, the graph of all the
+    # couplings is usually complete.
+    graph = strength >= numpy.median(strength[strength > 0])
+    pair_order = scipy_csgraph.reverse_cuthill_mckee(
+        scipy_sparse.csr_matrix(graph), symmetric_mode=True)
+    return _order_of_pairs(pairs, pair_order)
+
+
+def _greedy_order(pairs, terms, order):
+    """Swaps of neighbouring pairs, kept while they lower the weight.
+
+    Only the terms acting on the two swapped pairs change weight, the
+    change of the total is computed from them alone.
+    """
+    pair_of_first = {pair[0]: k for k, pair in enumerate(pairs)}
+    pair_order = [pair_of_first[spinor] for spinor in order if spinor in pair_of_first]
+    pair_of = numpy.empty(terms.n_spinors, dtype=numpy.intp)
+    for k, pair in enumerate(pairs):
+        pair_of[pair] = k
+    terms_of_pair = terms.terms_of(pair_of, len(pairs))
+    position = _position(_order_of_pairs(pairs, pair_order))
+    improved = True
+    while improved:
+        improved = False
+        for k in range(len(pair_order) - 1):
+            first, second = pair_order[k], pair_order[k + 1]
+            one_terms, two_terms = (numpy.union1d(a, b) for a, b in
+                                    zip(terms_of_pair[first], terms_of_pair[second]))
+            weight = terms.total_weight(position, one_terms, two_terms)
+            # The second pair moves to the start of the first one, the first
+            # pair right after it.
+            start = position[pairs[first][0]]
+            trial = position.copy()
+            trial[pairs[second]] = start + numpy.arange(len(pairs[second]))
+            trial[pairs[first]] = (start + len(pairs[second]) +
+                                   numpy.arange(len(pairs[first])))
+            if terms.total_weight(trial, one_terms, two_terms) < weight:
+                pair_order[k], pair_order[k + 1] = second, first
+                position, improved = trial, True
+    return _order_of_pairs(pairs, pair_order)
+
+
+def order_spinors(one_body_coefficients, two_body_coefficients, method='auto',
+                  irreps=None, tolerance=None):
+    """Order of the spinors on the qubits.
+
+    Args:
+        one_body_coefficients: Array (n_qubits, n_qubits).
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits, n_qubits).
+        method: String, or the order itself (a permutation of the spinors).
+            'energy': order of the exporter (spinors by energy).
+            'irrep': pairs grouped by irrep, needs irreps.
+            'bandwidth': reverse Cuthill-McKee order of the pairs, for the
+                graph of their largest couplings.
+            'greedy': swaps of neighbouring pairs lowering the estimated
+                Jordan-Wigner weight (see jordan_wigner_weight), from the
+                'energy' order.
+            'auto': the swaps of 'greedy' from the order of lowest weight
+                of 'energy', 'bandwidth' and 'irrep' (if irreps is given).
+        irreps: Optional list of the irrep label of each spinor.
+        tolerance: Coefficients smaller than tolerance are ignored.
+            Defaults to EQ_TOLERANCE of openfermion.
+
+    Returns:
+        spinor_order: Integer array, spinor put on each qubit.
+
+    Raises:
+        ValueError: If method is unknown, or is not a permutation.
+    """
+    n_qubits = one_body_coefficients.shape[0]
+    if not isinstance(method, str):
+        spinor_order = numpy.asarray(method, dtype=numpy.intp)
+        if not numpy.array_equal(numpy.sort(spinor_order), numpy.arange(n_qubits)):
+            raise ValueError('spinor_order must be a permutation of range({})'.format(n_qubits))
+        return spinor_order
+    if method not in _methods:
+        raise ValueError('spinor_order must be a permutation or one of {}'.format(
+            ', '.join("'{}'".format(name) for name in _methods)))
+    pairs = _pairs(n_qubits)
+    energy_order = numpy.arange(n_qubits)
+    if method == 'energy':
+        return energy_order
+    if method == 'irrep':
+        if irreps is None:
+            raise ValueError("spinor_order='irrep' needs the irreps of the spinors")
+        return _irrep_order(pairs, irreps)
+
+    if tolerance is None:
+        tolerance = openfermion_config.EQ_TOLERANCE
+    terms = _Terms(one_body_coefficients, two_body_coefficients, tolerance)
+    if method == 'bandwidth':
+        return _bandwidth_order(pairs, terms)
+    if method == 'greedy':
+        return _greedy_order(pairs, terms, energy_order)
+    candidates = [energy_order, _bandwidth_order(pairs, terms)]
+    if irreps is not None:
+        candidates.append(_irrep_order(pairs, irreps))
+    start = min(candidates, key=lambda order: _total_weight(terms, order))
+    return _greedy_order(pairs, terms, start)
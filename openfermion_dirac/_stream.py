@@ -0,0 +1,210 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Parsing of the FCIDUMP while dirac_openfermion_mointegral_export.x
+writes it, used by run_dirac with export_format='stream'.
+
+The exporter writes its FCIDUMP into a named pipe (FIFO) instead of a file,
+and a thread reads the rows as they arrive, so the parsing overlaps with the
+export and nothing is written on disk unless an archive is asked for.
+"""
+
+import errno
+import itertools
+import os
+import threading
+import time
+
+from ._lazy import LazyModule
+
+numpy = LazyModule('numpy')
+
+
+def iter_fcidump_blocks(f, chunk_size, archive=None):
+    """Read the rows of an open FCIDUMP by blocks of at most chunk_size
+    lines.
+
+    Args:
+        f: File object at the start of the FCIDUMP, e.g. a pipe.
+        chunk_size: Integer, maximum number of rows per block.
+        archive: Optional writable file object receiving a copy of every
+            line read.
+
+    Yields:
+        (index, value): Integer array (n_rows, 4) of the indices and array
+            (n_rows) of the values, complex if the rows give the real and
+            imaginary parts.
+    """
+    for line in f:
+        if archive is not None:
+            archive.write(line)
+        if "&END" in line:
+            break
+    while True:
+        lines = list(itertools.islice(f, chunk_size))
+        if not lines:
+            return
+        if archive is not None:
+            archive.writelines(lines)
+        width = len(lines[0].split())
+        rows = numpy.array(" ".join(lines).split(), dtype=float).reshape(-1, width)
+        value = rows[:, 0] if width == 5 else rows[:, 0] + 1j * rows[:, 1]
+        yield rows[:, -4:].astype(int), value
+
+
+def split_fcidump_rows(blocks):
+    """Sort the rows of a FCIDUMP in core energy, spinor energies, one body
+    and two body integrals.
+
+    Args:
+        blocks: Iterable of (index, value) blocks of iter_fcidump_blocks.
+
+    Returns:
+        The integrals as get_integrals_MOINT: E_core, spinor (dictionary
+        index -> energy, in the order of the file), one_body_index,
+        one_body_value, two_body_index and two_body_value, the indices
+        starting at 1. Of integrals with the same indices, the last one
+        read is kept, as when the FCIDUMP is read in dictionaries.
+    """
+    E_core = 0
+    spinor = {}
+    one_body = []
+    two_body = []
+    for index, value in blocks:
+        zero = index == 0
+        core = zero.all(axis=1)
+        if core.any():
+            E_core = float(numpy.real(value[core][-1]))
+        energy = zero[:, 1:].all(axis=1) & ~core
+        for i, e in zip(index[energy, 0], numpy.real(value[energy])):
+            spinor[int(i)] = float(e)
+        one = zero[:, 2:].all(axis=1) & ~zero[:, 1]
+        one_body.append((index[one, :2], value[one]))
+        two = ~zero[:, 2:].all(axis=1)
+        two_body.append((index[two], value[two]))
+
+    def unique(blocks, n_indices):
+        if not blocks:
+            return numpy.zeros((0, n_indices), int), numpy.zeros(0)
+        index = numpy.concatenate([block[0] for block in blocks])
+        value = numpy.concatenate([block[1] for block in blocks])
+        # Last occurrence of each index, in the order of the file.
+        _, last = numpy.unique(index[::-1], axis=0, return_index=True)
+        keep = numpy.sort(len(index) - 1 - last)
+        return index[keep], value[keep]
+
+    one_body_index, one_body_value = unique(one_body, 2)
+    two_body_index, two_body_value = unique(two_body, 4)
+    return (E_core, spinor, one_body_index, one_body_value,
+            two_body_index, two_body_value)
+
+
+class FcidumpStream(object):
+
+    """Thread parsing the FCIDUMP written in a named pipe.
+
+    Usage:
+        stream = FcidumpStream(fifo)    # creates the pipe
+        stream.start()
+        try:
+            ... run the exporter, writing into fifo ...
+        finally:
+            result = stream.finish()    # waits for the end of the parsing
+
+    Attributes:
+        fifo: Name of the named pipe.
+        archive: Optional name of a file receiving a copy of the FCIDUMP.
+        build: Optional function called by the thread with the integrals,
+            whose result is returned by finish instead of the integrals.
+        integrals: The integrals as returned by split_fcidump_rows, once
+            finish has returned.
+    """
+    def __init__(self, fifo, archive=None, build=None, chunk_size=65536):
+        if os.path.lexists(fifo):
+            os.remove(fifo)
+        os.mkfifo(fifo)
+        self.fifo = fifo
+        self.archive = archive
+        self.build = build
+        self.chunk_size = chunk_size
+        self.integrals = None
+        self._result = None
+        self._error = None
+        self._empty = False
+        self._opened = threading.Event()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+
+    def _read(self):
+        try:
+            with open(self.fifo) as f:
+                self._opened.set()
+                first_line = f.readline()
+                if not first_line:
+                    # Opened by _unblock, or the exporter wrote nothing.
+                    self._empty = True
+                    return
+                archive = open(self.archive, 'w') if self.archive else None
+                try:
+                    self.integrals = split_fcidump_rows(iter_fcidump_blocks(
+                        itertools.chain([first_line], f), self.chunk_size, archive))
+                except BaseException as error:
+                    self._error = error
+                    # Drain the pipe, the exporter would block on it.
+                    for _ in f:
+                        pass
+                finally:
+                    if archive is not None:
+                        archive.close()
+            if self._error is None and self.build is not None:
+                self._result = self.build(self.integrals)
+        except BaseException as error:
+            self._error = error
+        finally:
+            self._opened.set()
+
+    def start(self):
+        self._thread.start()
+
+    def _unblock(self):
+        """Open the pipe for writing if the exporter never did, so that the
+        thread waiting to open it reads an empty file."""
+        while not self._opened.is_set():
+            try:
+                descriptor = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as error:
+                if error.errno != errno.ENXIO:  # ENXIO: no reader yet.
+                    raise
+                time.sleep(0.01)
+                continue
+            os.close(descriptor)
+            break
+
+    def finish(self):
+        """Wait for the thread, remove the pipe and return the integrals,
+        or the result of build.
+
+        Raises:
+            FileNotFoundError: If nothing opened the pipe to write the
+                FCIDUMP.
+            The exception raised by the parsing or build, if any.
+        """
+        try:
+            self._unblock()
+            self._thread.join()
+        finally:
+            os.remove(self.fifo)
+        if self._error is not None:
+            raise self._error
+        if self._empty:
+            raise FileNotFoundError('FCIDUMP not written by '
+                                    'dirac_openfermion_mointegral_export.x')
+        return self._result if self.build is not None else self.integrals
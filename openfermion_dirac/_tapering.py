@@ -0,0 +1,250 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Functions to find the Z2 symmetries of a Dirac Hamiltonian and to taper
+off the corresponding qubits.
+
+The parity of the number of electrons in a set S of spinors is conserved
+when each term of the Hamiltonian creates and annihilates an even number of
+electrons in S. Under the Jordan-Wigner transformation this parity is the
+Pauli string prod_{j in S} Z_j, which commutes with the qubit Hamiltonian and
+fixes the state of one qubit. These sets are found exactly from the
+coefficients, as the solutions of a linear system over GF(2).
+"""
+
+import collections
+import os
+import re
+
+from ._lazy import LazyModule
+from ._memory import track_memory
+
+numpy = LazyModule('numpy')
+openfermion_config = LazyModule('openfermion.config')
+openfermion_ops = LazyModule('openfermion.ops')
+openfermion_transforms = LazyModule('openfermion.transforms')
+
+
+# A symmetry: its name and the tuple of qubits of its Z string.
+Z2Symmetry = collections.namedtuple('Z2Symmetry', ['name', 'qubits'])
+
+
+def _term_masks(one_body_coefficients, two_body_coefficients, tolerance):
+    """Parity pattern of every term, as integers whose bit j is the number
+    of operators of the term acting on qubit j, modulo 2."""
+    n_qubits = one_body_coefficients.shape[0]
+    masks = set()
+    if n_qubits <= 62:
+        bit = numpy.left_shift(numpy.int64(1), numpy.arange(n_qubits, dtype=numpy.int64))
+    else:
+        bit = numpy.array([1 << j for j in range(n_qubits)], dtype=object)
+    for coefficients in (one_body_coefficients, two_body_coefficients):
+        indices = numpy.nonzero(numpy.absolute(coefficients) > tolerance)
+        mask = bit[indices[0]]
+        for index in indices[1:]:
+            mask = mask ^ bit[index]
+        masks.update(int(value) for value in numpy.unique(mask))
+    masks.discard(0)
+    return masks
+
+
+def _reduced_row_echelon(rows):
+    """Basis of the span of rows over GF(2), as {pivot bit: row} where the
+    pivot bit of a row is set in no other row."""
+    basis = {}
+    for row in rows:
+        for pivot, basis_row in basis.items():
+            if row >> pivot & 1:
+                row ^= basis_row
+        if row:
+            pivot = row.bit_length() - 1
+            for other, basis_row in basis.items():
+                if basis_row >> pivot & 1:
+                    basis[other] = basis_row ^ row
+            basis[pivot] = row
+    return basis
+
+
+def _commutes(mask, basis):
+    """Whether the Z string of mask commutes with every term."""
+    return all(bin(mask & row).count('1') % 2 == 0 for row in basis.values())
+
+
+def _named_candidates(n_qubits, irreps, spinor_order):
+    """Symmetries with a physical meaning, tried first."""
+    if spinor_order is None:
+        spinor_order = range(n_qubits)
+    spinor_order = [int(spinor) for spinor in spinor_order]
+
+    def mask(spinors):
+        return sum(1 << qubit for qubit, spinor in enumerate(spinor_order)
+                   if spinor in spinors)
+
+    candidates = [('number parity', mask(set(range(n_qubits)))),
+                  ('even spinors parity (alpha, or Kramers partner)',
+                   mask(set(range(0, n_qubits, 2)))),
+                  ('odd spinors parity (beta, or Kramers partner)',
+                   mask(set(range(1, n_qubits, 2))))]
+    if irreps is not None:
+        irreps = [int(irrep) for irrep in irreps]
+        for bit in range(max(irreps).bit_length()):
+            candidates.append(('irrep bit {} parity'.format(bit),
+                               mask({spinor for spinor, irrep in enumerate(irreps)
+                                     if (irrep - 1) >> bit & 1})))
+    return candidates
+
+
+def find_z2_symmetries(one_body_coefficients, two_body_coefficients,
+                       irreps=None, spinor_order=None, tolerance=None):
+    """Independent Z2 symmetries (Z strings) of a Hamiltonian.
+
+    Every symmetry returned is checked on all the coefficients. The number
+    parity, the parities of the even and odd spinors (alpha and beta spin, or
+    the two spinors of the Kramers pairs) and the parities of the bits of the
+    irrep labels are taken first when they are symmetries, the others
+    complete the set.
+
+    Args:
+        one_body_coefficients: Array (n_qubits, n_qubits).
+        two_body_coefficients: Array (n_qubits, n_qubits, n_qubits, n_qubits).
+        irreps: Optional list of the abelian irrep label (starting at 1) of
+            each spinor, e.g. MOINT_spinor_abelian_irrep.npy.
+        spinor_order: Optional spinor on each qubit, if the coefficients
+            are reordered (see order_spinors).
+        tolerance: Coefficients smaller than tolerance are ignored.
+            Defaults to EQ_TOLERANCE of openfermion.
+
+    Returns:
+        symmetries: List of Z2Symmetry(name, qubits).
+    """
+    if tolerance is None:
+        tolerance = openfermion_config.EQ_TOLERANCE
+    n_qubits = one_body_coefficients.shape[0]
+    basis = _reduced_row_echelon(
+        _term_masks(one_body_coefficients, two_body_coefficients, tolerance))
+
+    # Solutions of the linear system: one per free (non pivot) qubit.
+    solutions = []
+    for free in range(n_qubits):
+        if free in basis:
+            continue
+        mask = 1 << free
+        for pivot, row in basis.items():
+            if row >> free & 1:
+                mask |= 1 << pivot
+        solutions.append(('parity', mask))
+
+    symmetries = []
+    independent = {}
+    for name, mask in _named_candidates(n_qubits, irreps, spinor_order) + solutions:
+        if not mask or not _commutes(mask, basis):
+            continue
+        reduced = mask
+        for pivot, row in independent.items():
+            if reduced >> pivot & 1:
+                reduced ^= row
+        if not reduced:
+            continue
+        independent = _reduced_row_echelon(list(independent.values()) + [reduced])
+        symmetries.append(Z2Symmetry(name, tuple(j for j in range(n_qubits)
+                                                 if mask >> j & 1)))
+    return symmetries
+
+
+def _orbsym(fcidump_file):
+    """ORBSYM of the FCIDUMP header, in the order of the spinor lines."""
+    header = ''
+    with open(fcidump_file) as f:
+        for line in f:
+            header += line
+            if "&END" in line:
+                break
+    orbsym = re.search(r'ORBSYM=([-\d,\s]*?)(?:[A-Z]+=|&END)', header)
+    return [int(label) for label in re.findall(r'-?\d+', orbsym.group(1))] if orbsym else None
+
+
+def spinor_irreps(molecule):
+    """Abelian irrep label of each spinor of a Dirac calculation, in the
+    order of the spinor indices, or None if not available."""
+    moint_directory = molecule._moint_directory()
+    if moint_directory is not None:
+        return list(numpy.load(os.path.join(moint_directory,
+                                            'MOINT_spinor_abelian_irrep.npy')))
+    fcidump_file = molecule._fcidump_file()
+    if fcidump_file is None:
+        return None
+    orbsym = _orbsym(fcidump_file)
+    if orbsym is None:
+        return None
+    # The header follows the order of the spinor lines, not the indices.
+    order = []
+    with open(fcidump_file) as f:
+        for line in f:
+            data = line.split()
+            if len(data) >= 5 and data[-3:] == ['0', '0', '0'] and data[-4] != '0':
+                order.append(int(data[-4]))
+    if sorted(order) != list(range(1, len(orbsym) + 1)):
+        return None
+    irreps = [0] * len(orbsym)
+    for index, label in zip(order, orbsym):
+        irreps[index - 1] = label
+    return irreps
+
+
+def taper_hamiltonian(molecule, symmetries=None, occupied=None):
+    """Jordan-Wigner Hamiltonian of a molecule without the qubits fixed by
+    its Z2 symmetries.
+
+    Args:
+        molecule: A MolecularData_Dirac for which run_dirac has been called.
+            The coefficients are computed if they are not available yet.
+        symmetries: Optional list of Z2Symmetry to use, by default all those
+            found by find_z2_symmetries with the irreps of the molecule.
+        occupied: Optional list of the occupied qubits of the reference
+            state, which fixes the eigenvalue (+1 or -1) of each symmetry.
+            The default occupied spinors are put on their qubits of
+            molecule.spinor_order.
+            Defaults to the occupied spinors of export_format='npy', else
+            the n_electrons lowest spinors (Hartree-Fock).
+
+    Returns:
+        tapered_hamiltonian: QubitOperator acting on the remaining qubits.
+        stabilizers: List of the QubitOperator stabilizers used, with the
+            sign of the reference state.
+        removed_qubits: List of the removed qubits.
+    """
+    if molecule.two_body_coeff is None:
+        (molecule.molecular_hamiltonian, molecule.one_body_coeff,
+         molecule.two_body_coeff) = molecule.get_molecular_hamiltonian()
+    if symmetries is None:
+        symmetries = find_z2_symmetries(molecule.one_body_coeff,
+                                        molecule.two_body_coeff,
+                                        spinor_irreps(molecule),
+                                        molecule.spinor_order)
+    if occupied is None:
+        occupied = molecule._occupied_qubits()
+    occupied = set(occupied)
+
+    stabilizers = []
+    for symmetry in symmetries:
+        sign = (-1) ** len(occupied.intersection(symmetry.qubits))
+        stabilizers.append(openfermion_ops.QubitOperator(
+            ' '.join('Z{}'.format(qubit) for qubit in symmetry.qubits), sign))
+
+    with track_memory(molecule, 'transform'):
+        qubit_hamiltonian = openfermion_transforms.jordan_wigner(
+            molecule.molecular_hamiltonian)
+        if not stabilizers:
+            return qubit_hamiltonian, stabilizers, []
+        tapered_hamiltonian, removed_qubits = openfermion_transforms.taper_off_qubits(
+            qubit_hamiltonian, stabilizers, output_tapered_positions=True)
+    return tapered_hamiltonian, stabilizers, list(removed_qubits)
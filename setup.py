@@ -7,5 +7,8 @@ setup(name='openfermion_interface',
       author='Bruno',
       author_email='senjean@lorentz.leidenuniv.nl',
       packages=['openfermion_dirac'],
-      install_requires=["openfermion"]
+      install_requires=["openfermion"],
+      entry_points={
+          'console_scripts': [
+              'openfermion-dirac = openfermion_dirac._cli:main']}
       )
@@ -0,0 +1,54 @@
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Import time of the package: the heavy dependencies are only imported
+when they are first used (see _lazy.py)."""
+
+import json
+import os
+import subprocess
+import sys
+
+# Seconds allowed for import openfermion_dirac, the best of a few runs.
+IMPORT_BUDGET = 0.5
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_script = """
+import json, sys, time
+start = time.perf_counter()
+import openfermion_dirac
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds,
+                  'modules': [name for name in ('numpy', 'h5py', 'openfermion')
+                              if name in sys.modules]}))
+"""
+
+
+def _import_in_subprocess():
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [_root] + [path for path in [environment.get('PYTHONPATH')] if path])
+    output = subprocess.check_output([sys.executable, '-c', _script],
+                                     env=environment, cwd=_root)
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def test_import_does_not_load_heavy_dependencies():
+    assert _import_in_subprocess()['modules'] == []
+
+
+def test_import_time_budget():
+    seconds = min(_import_in_subprocess()['seconds'] for _ in range(3))
+    assert seconds < IMPORT_BUDGET, (
+        'import openfermion_dirac took {:.3f} s, the budget is {} s'.format(
+            seconds, IMPORT_BUDGET))